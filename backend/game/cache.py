@@ -0,0 +1,111 @@
+"""Cached reads of games for consumers and REST views.
+
+A game's summary is the ``GameDetailSerializer`` output of its row: the
+ids, status, score, duration and players' names. That data only changes
+with the status, so it is cached by game id. Every write of the status
+also writes the summary to the cache (write-through), and a summary that
+cannot be rebuilt is dropped. The live match snapshot is not part of
+this cache. It comes from the ``state_store`` slots the ticker already
+keeps current, so the cache is never written per tick.
+
+Each player's running game id is cached as well, or NO_GAME when they
+have none, so ``game_status`` does not need to query the database.
+Starting a game writes its id over NO_GAME, ending it writes NO_GAME
+back.
+"""
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from . import state_store
+from .models import Game
+from .serializers import GameDetailSerializer
+
+
+NO_GAME = 0  # Cached as the running game id of a player without one
+
+
+def summary_key(game_id):
+    return f"game:{game_id}:summary"
+
+
+def active_game_key(user_id):
+    return f"user:{user_id}:active_game"
+
+
+def summarize(game):
+    return dict(GameDetailSerializer(game).data)
+
+
+def write_through(game):
+    """Cache the summary of ``game`` right after it was written, returns it"""
+    summary = summarize(game)
+    cache.set(summary_key(game.id), summary, timeout=settings.GAME_CACHE_TTL)
+
+    players = [user_id for user_id in (game.player1_id, game.player2_id) if user_id]
+    if game.status == 'active':
+        cache.set_many({active_game_key(user_id): game.id for user_id in players},
+                       timeout=settings.GAME_CACHE_TTL)
+    else:
+        # Only forget the players' game if it is still this one
+        current = cache.get_many([active_game_key(user_id) for user_id in players])
+        cache.set_many({key: NO_GAME for key, game_id in current.items() if game_id == game.id},
+                       timeout=settings.GAME_CACHE_TTL)
+    return summary
+
+
+def invalidate(game_id):
+    cache.delete(summary_key(game_id))
+
+
+def load_summary(game_id):
+    """Read the game from the database and cache it, None if it does not exist"""
+    try:
+        game = Game.objects.select_related('player1', 'player2', 'winner').get(id=game_id)
+    except Game.DoesNotExist:
+        invalidate(game_id)
+        return None
+    return write_through(game)
+
+
+def get_summary(game_id):
+    summary = cache.get(summary_key(game_id))
+    if summary is None:
+        summary = load_summary(game_id)
+    return summary
+
+
+async def aget_summary(game_id):
+    summary = await cache.aget(summary_key(game_id))
+    if summary is None:
+        summary = await database_sync_to_async(load_summary)(game_id)
+    return summary
+
+
+def find_active_game(user_id):
+    """Summary of the running game of ``user_id``, or None"""
+    key = active_game_key(user_id)
+    game_id = cache.get(key)
+    if game_id is None:
+        # Not cached: look it up once and remember the answer, even "none"
+        game_id = Game.objects.filter(
+            Q(player1_id=user_id) | Q(player2_id=user_id),
+            status='active'
+        ).values_list('id', flat=True).first() or NO_GAME
+        # Added, not set: a game that started meanwhile keeps its id
+        cache.add(key, game_id, timeout=settings.GAME_CACHE_TTL)
+    summary = get_summary(game_id) if game_id != NO_GAME else None
+    if summary is None or summary['status'] != 'active':
+        return None
+    return summary
+
+
+async def with_live_state(summary):
+    """``summary`` with the current snapshot of its match while it runs"""
+    if summary is None or summary['status'] != 'active':
+        return summary
+    live = await state_store.read_state(summary['id'])
+    if live is None:
+        return summary
+    return {**summary, 'game_state': live[0]}
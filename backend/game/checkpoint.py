@@ -0,0 +1,157 @@
+"""Batched checkpoints of ``Game.game_state``.
+
+Tickers hand their snapshots to the checkpoint writer of their worker
+instead of updating their row themselves. Every GAME_CHECKPOINT_FLUSH_MS
+the writer writes the snapshots queued since the last flush in one
+transaction: it locks the rows, keeps those whose ``state_version`` is
+still the one this worker wrote last (the same compare-and-set as
+before) and writes them with a single ``bulk_update``. A match queued
+twice before a flush is written once, with its latest snapshot.
+
+When a flush takes longer than the interval the next one waits twice as
+long as it took, up to MAX_FLUSH_DELAY, so a slow database gets fewer
+and larger batches instead of a growing backlog.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Game
+
+logger = logging.getLogger('game')
+
+MAX_FLUSH_DELAY = 5.0  # Seconds between flushes at most, however slow the database
+
+
+@database_sync_to_async
+def write_checkpoints(batch):
+    """Compare-and-set ``{game_id: (game_state, tick, version)}`` in one transaction.
+
+    Returns the ids of the games written.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        current = dict(
+            Game.objects.select_for_update()
+            .filter(id__in=list(batch))
+            .order_by('id')
+            .values_list('id', 'state_version')
+        )
+        rows = [
+            Game(id=game_id, game_state=game_state, state_tick=tick, state_version=version + 1, updated_at=now)
+            for game_id, (game_state, tick, version) in batch.items()
+            if current.get(game_id) == version
+        ]
+        Game.objects.bulk_update(rows, ['game_state', 'state_tick', 'state_version', 'updated_at'])
+    return {row.id for row in rows}
+
+
+class CheckpointWriter:
+    """Queues the snapshots of this worker's matches and writes them in batches"""
+
+    def __init__(self):
+        self.interval = settings.GAME_CHECKPOINT_FLUSH_MS / 1000
+        self.batch_size = settings.GAME_CHECKPOINT_BATCH_SIZE
+        self.delay = self.interval
+        self.versions = {}  # game id -> state_version of the row as this worker left it
+        self.dirty = {}  # game id -> latest (snapshot, tick) not written yet
+        self.waiters = {}  # game id -> futures resolved when that snapshot is written
+        self.lost = set()  # Games whose row another owner wrote
+        self.released = set()  # Games forgotten once their last snapshot is written
+        self.task = None
+
+    def track(self, game_id, version):
+        """Start checkpointing ``game_id``, whose row is at ``version``"""
+        self.versions[game_id] = version
+        self.lost.discard(game_id)
+        self.released.discard(game_id)
+
+    def release(self, game_id):
+        """Stop checkpointing ``game_id`` after its queued snapshot is written"""
+        if game_id in self.dirty:
+            self.released.add(game_id)
+        else:
+            self.forget(game_id)
+
+    def forget(self, game_id):
+        self.versions.pop(game_id, None)
+        self.lost.discard(game_id)
+        self.released.discard(game_id)
+
+    def owns(self, game_id):
+        return game_id not in self.lost
+
+    def save(self, game_id, game_state, tick):
+        """Queue a snapshot taken at ``tick``, returns a future set to False if the write lost the row"""
+        future = asyncio.get_running_loop().create_future()
+        if game_id in self.lost:
+            future.set_result(False)
+            return future
+        self.dirty[game_id] = (game_state, tick)
+        self.waiters.setdefault(game_id, []).append(future)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return future
+
+    async def run(self):
+        try:
+            while self.dirty:
+                await asyncio.sleep(self.delay)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error in checkpoint writer: {str(e)}", exc_info=True)
+
+    async def flush(self):
+        game_ids = list(self.dirty)[:self.batch_size]
+        batch = {game_id: (*self.dirty.pop(game_id), self.versions[game_id]) for game_id in game_ids}
+        waiters = {game_id: self.waiters.pop(game_id, []) for game_id in game_ids}
+
+        started = time.monotonic()
+        try:
+            written = await write_checkpoints(batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} checkpoints: {str(e)}", exc_info=True)
+            # Retry on the next flush, unless a newer snapshot was queued meanwhile
+            for game_id, (game_state, tick, _) in batch.items():
+                self.dirty.setdefault(game_id, (game_state, tick))
+                self.waiters.setdefault(game_id, []).extend(waiters[game_id])
+            self.delay = min(self.delay * 2, MAX_FLUSH_DELAY)
+            return
+
+        # Backpressure: leave a slow database twice the time it took
+        elapsed = time.monotonic() - started
+        self.delay = min(max(self.interval, elapsed * 2), MAX_FLUSH_DELAY)
+
+        for game_id in game_ids:
+            ok = game_id in written
+            if ok:
+                self.versions[game_id] += 1
+            else:
+                logger.warning(f"[GAME {game_id}] Game state was written by another owner")
+                self.lost.add(game_id)
+            for future in waiters[game_id]:
+                if not future.done():
+                    future.set_result(ok)
+            if game_id in self.released and game_id not in self.dirty:
+                self.forget(game_id)
+
+
+# One writer per event loop, shared by all of its matches
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_checkpoint_writer():
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = CheckpointWriter()
+        _writers[loop] = writer
+    return writer
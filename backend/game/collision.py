@@ -0,0 +1,96 @@
+"""Swept ball collision.
+
+The ball moves along a straight segment each step. Instead of testing
+overlap at the end of the step, ``sweep`` finds the first wall or paddle
+face the segment touches, moves the ball there, responds and continues
+with the rest of the step. A fast ball can no longer tunnel through a
+paddle, and the path does not depend on how a second is cut into steps.
+
+Velocities are in pixels per reference tick (1/60 s) whatever the tick
+rate, so ``dt`` is the step length in reference ticks.
+"""
+import math
+
+REFERENCE_TICK_RATE = 60
+PADDLE_SPEEDUP = 1.1  # Ball speed factor on every paddle hit, up to the cap
+MAX_CONTACTS = 8  # Contacts resolved per step at most
+
+
+def step_length(tick_rate):
+    """``dt`` of one step at ``tick_rate``, in reference ticks"""
+    return REFERENCE_TICK_RATE / tick_rate
+
+
+def first_contact(state, limit):
+    """Return ``(t, contact)`` for the first contact within ``limit``.
+
+    ``contact`` is ``'wall'``, a paddle key or None when the ball moves
+    freely for the whole ``limit``.
+    """
+    ball = state.ball
+    best_t, best = limit, None
+
+    if ball.dy < 0:
+        t = max(0.0, (ball.radius - ball.y) / ball.dy)
+        if t <= best_t:
+            best_t, best = t, 'wall'
+    elif ball.dy > 0:
+        t = max(0.0, (state.canvas_height - ball.radius - ball.y) / ball.dy)
+        if t <= best_t:
+            best_t, best = t, 'wall'
+
+    # Only the face towards the field counts, and only from in front of it
+    left = state.player1
+    face = left.x + left.width + ball.radius
+    if ball.dx < 0 and ball.x >= face:
+        t = (face - ball.x) / ball.dx
+        if t <= best_t and (best is None or t < best_t):
+            y = ball.y + ball.dy * t
+            if left.y <= y <= left.y + left.height:
+                best_t, best = t, 'player1'
+
+    right = state.player2
+    face = right.x - ball.radius
+    if ball.dx > 0 and ball.x <= face:
+        t = (face - ball.x) / ball.dx
+        if t <= best_t and (best is None or t < best_t):
+            y = ball.y + ball.dy * t
+            if right.y <= y <= right.y + right.height:
+                best_t, best = t, 'player2'
+
+    return best_t, best
+
+
+def paddle_bounce(ball, paddle, direction, max_speed, max_angle):
+    """Send the ball back at an angle set by where it hit ``paddle``.
+
+    The centre of the paddle returns it straight, the ends at
+    ``max_angle`` radians. ``direction`` is 1 towards the right.
+    """
+    speed = min(math.hypot(ball.dx, ball.dy) * PADDLE_SPEEDUP, max_speed)
+    half = paddle.height / 2
+    offset = max(-1.0, min(1.0, (ball.y - (paddle.y + half)) / half))
+    angle = offset * max_angle
+    ball.dx = direction * speed * math.cos(angle)
+    ball.dy = speed * math.sin(angle)
+
+
+def sweep(state, dt, max_speed, max_angle):
+    """Move the ball of ``state`` for ``dt`` reference ticks, resolving contacts in order"""
+    ball = state.ball
+    remaining = dt
+    for _ in range(MAX_CONTACTS):
+        t, contact = first_contact(state, remaining)
+        if contact is None:
+            break
+        ball.x += ball.dx * t
+        ball.y += ball.dy * t
+        remaining -= t
+        if contact == 'wall':
+            ball.dy = -ball.dy
+        elif contact == 'player1':
+            paddle_bounce(ball, state.player1, 1, max_speed, max_angle)
+        else:
+            paddle_bounce(ball, state.player2, -1, max_speed, max_angle)
+    ball.x += ball.dx * remaining
+    ball.y += ball.dy * remaining
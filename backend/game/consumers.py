@@ -1,22 +1,28 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from asgiref.sync import sync_to_async
 from .models import Game
+from . import presence, protocol, state_store
+from .cache import aget_summary, find_active_game, with_live_state, write_through
+from .engine import get_engine
+from .hosting import get_host
+from .matchmaking import SEARCH_REFRESH, get_queue, get_rated_queue, rating_window
+from .ratings import get_rating
+from .replay import Replay
+from .spectators import get_hub
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db import transaction
-from django.db.models import Q
 import asyncio
 import logging
 import time
-from datetime import timedelta
-import random
-from django.utils import timezone
+from urllib.parse import parse_qs
 
 logger = logging.getLogger('game')
 User = get_user_model()
 
+REPLAY_FRAME_RATE = 30  # Frames per second sent to replay viewers
+REPLAY_MAX_SPEED = 8
+
 class GameConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -25,395 +31,177 @@ class GameConsumer(AsyncWebsocketConsumer):
         self.channel_group_name = None
         self.user_group = None
         self.is_connected = False
-        self.last_paddle_update = {}
-        self.paddle_update_interval = 0.025  # 25ms for paddle updates
-        self.state_update_interval = 0.05    # 50ms for state updates
-        self.db_update_interval = 0.2        # Only update DB every 200ms
-        self.pending_updates = {'paddles': {}, 'ball': None}
-        self.last_db_update = 0
-        self.cached_game_state = None
-        self.game_start_time = None
+        self.binary = False
+        self.search_task = None
+        self.presence_task = None
         self.messageCount = 0
         self.lastLogTime = 0
 
     @database_sync_to_async
-    def create_game_sync(self):
-        """Create a new game in the database"""
+    def create_paired_game(self, opponent_id):
+        """Create the game for a pair found by matchmaking"""
         try:
-            game = Game.objects.create(player1=self.user)
-            logger.info(f"Game {game.id} created by {self.user.username}")
+            game = Game.objects.create(player1_id=opponent_id, player2=self.user, status='active')
+            write_through(game)
+            logger.info(f"Game {game.id} created for user {opponent_id} vs {self.user.username}")
             return game
         except Exception as e:
             logger.error(f"Error creating game: {str(e)}", exc_info=True)
             return None
 
-    async def create_game(self):
-        """Create a new game and join it immediately"""
+    async def find_match(self):
+        """Pair with the longest waiting player, or wait in the queue"""
         try:
-            # Create the game in database
-            game = await self.create_game_sync()
-            if not game:
-                await self.send_json({
-                    'type': 'error',
-                    'message': 'Failed to create game'
-                })
-                return
-
-            # Set up channel group for this game
-            self.game = game
-            self.channel_group_name = f"game_{game.id}"
-            await self.channel_layer.group_add(
-                self.channel_group_name,
-                self.channel_name
-            )
-            logger.info(f"[GAME {game.id}] Player {self.user.username} added to channel group {self.channel_group_name}")
-
-            # Send confirmation to creator
-            await self.send_json({
-                'type': 'game_created',
-                'game_id': str(game.id),
-                'player_id': self.user.id,
-                'game_state': game.game_state
-            })
-
-            logger.info(f"Game {game.id} created and joined by {self.user.username}")
-            return game
+            # Joining the casual queue leaves the ranked one
+            self.stop_search_task()
+            opponent_id = await get_queue().pair(self.user.id)
+            if opponent_id is None:
+                logger.info(f"{self.user.username} queued for matchmaking")
+                await self.send_json({'type': 'matchmaking_queued'})
+                self.search_task = asyncio.create_task(self.refresh_search())
+                return None
+            return await self.start_paired_game(opponent_id)
 
         except Exception as e:
-            logger.error(f"Error in create_game: {str(e)}", exc_info=True)
+            logger.error(f"Error in matchmaking: {str(e)}", exc_info=True)
             await self.send_json({
                 'type': 'error',
-                'message': 'Failed to create game'
+                'message': 'Matchmaking failed'
             })
             return None
 
-    @database_sync_to_async
-    def update_game_state_sync(self, game_id, new_state, update_type='all'):
-        """Update game state in database"""
-        try:
-            # Use update instead of get+save to reduce queries
-            Game.objects.filter(id=game_id).update(
-                game_state=new_state,
-                updated_at=timezone.now()
-            )
-        except Exception as e:
-            logger.error(f"Error updating game: {str(e)}", exc_info=True)
-
-    async def join_game(self):
-        """Join an existing game"""
+    async def find_ranked_match(self):
+        """Pair with the closest-rated waiting player, widening the window while queued"""
         try:
-            # First, try to find an available game
-            game = await self.find_available_game()
-            if not game:
-                logger.info("No available games found")
-                return None
-
-            if game.status == 'waiting' and game.player1 != self.user:
-                # Join as player 2
-                game.player2 = self.user
-                game.status = 'active'
-                await sync_to_async(game.save)()
-
-                # Set up channel group
-                self.game = game  # Set self.game here
-                self.channel_group_name = f"game_{game.id}"
-                await self.channel_layer.group_add(
-                    self.channel_group_name,
-                    self.channel_name
-                )
-                logger.info(f"[GAME {game.id}] Player {self.user.username} added to channel group {self.channel_group_name}")
-
-                # Start game timer when second player joins
-                self.game_start_time = time.time()
-
-                # Broadcast join message with game state from database
-                await self.channel_layer.group_send(
-                    self.channel_group_name,
-                    {
-                        'type': 'game_joined',
-                        'game_id': str(game.id),
-                        'player1_id': game.player1.id,
-                        'player2_id': self.user.id,
-                        'game_state': game.game_state
-                    }
-                )
-                logger.info(f"[GAME {game.id}] Broadcasted join message to group {self.channel_group_name}")
-                return game
-
-            elif game.status == 'active' and (game.player1 == self.user or game.player2 == self.user):
-                # Reconnecting to an active game
-                self.game = game  # Set self.game here
-                self.channel_group_name = f"game_{game.id}"
-                await self.channel_layer.group_add(
-                    self.channel_group_name,
-                    self.channel_name
-                )
-                logger.info(f"[GAME {game.id}] Player {self.user.username} reconnected to channel group {self.channel_group_name}")
-                
-                # Send current game state
-                await self.send_json({
-                    'type': 'game_state_update',
-                    'game_state': game.game_state
-                })
-                return game
-
-            else:
-                await self.send_json({
-                    'type': 'error',
-                    'message': 'Game is not available for joining'
-                })
+            await self.cancel_search()
+            rating = await database_sync_to_async(get_rating)(self.user.id)
+            opponent_id = await get_rated_queue().pair(self.user.id, rating, rating_window(0))
+            if opponent_id is None:
+                logger.info(f"{self.user.username} queued for ranked matchmaking at {rating:.0f}")
+                await self.send_json({'type': 'matchmaking_queued', 'mode': 'ranked'})
+                self.search_task = asyncio.create_task(self.widen_search(rating))
                 return None
+            return await self.start_paired_game(opponent_id)
 
         except Exception as e:
-            logger.error(f"Error joining game: {str(e)}", exc_info=True)
+            logger.error(f"Error in ranked matchmaking: {str(e)}", exc_info=True)
+            await self.send_json({
+                'type': 'error',
+                'message': 'Matchmaking failed'
+            })
             return None
 
-    async def paddle_move(self, direction, game_id):
-        """Handle paddle movement"""
+    async def refresh_search(self):
+        """Keep this player's casual queue entry counted as live until matched or cancelled"""
+        queue = get_queue()
         try:
-            logger.info(f"[GAME {game_id}] Received paddle_move: direction={direction}")
-            
-            game = await self.get_game(game_id)
-            if not game:
-                logger.error(f"[GAME {game_id}] Game not found")
-                return
-            if game.status != 'active':
-                logger.error(f"[GAME {game_id}] Game not active")
-                return
-
-            # Determine which paddle to move
-            if self.user.id == game.player1.id:
-                paddle_key = 'player1'
-            elif self.user.id == game.player2.id:
-                paddle_key = 'player2'
-            else:
-                logger.error(f"[GAME {game_id}] User {self.user.username} is not a player")
-                return
-                
-            logger.info(f"[GAME {game_id}] Moving {paddle_key}'s paddle")
-            
-            # Rate limiting
-            current_time = time.time()
-            last_update = self.last_paddle_update.get(paddle_key, 0)
-            if current_time - last_update < self.paddle_update_interval:
-                logger.debug(f"[GAME {game_id}] Rate limiting paddle movement")
-                return
-            self.last_paddle_update[paddle_key] = current_time
-
-            # Update paddle position in game state
-            game_state = game.game_state
-            paddle = game_state['paddles'][paddle_key]
-            paddle_speed = game_state['paddle_speed']
-            canvas_height = game_state['canvas']['height']
-            paddle_height = paddle['height']
-
-            current_y = paddle['y']
-            if direction == 'up':
-                new_y = max(0, current_y - paddle_speed)
-            elif direction == 'down':
-                new_y = min(canvas_height - paddle_height, current_y + paddle_speed)
-            else:
-                logger.error(f"[GAME {game_id}] Invalid direction: {direction}")
-                return
-
-            # Update position in game state
-            game_state['paddles'][paddle_key]['y'] = new_y
-            
-            # Save to database with paddle update type
-            await self.update_game_state_sync(game.id, game_state, update_type='paddle')
-
-            logger.info(f"[GAME {game.id}] {self.user.username} moved {paddle_key} {direction}. New Y: {new_y}")
-
-            # Broadcast to all players
-            await self.channel_layer.group_send(
-                self.channel_group_name,
-                {
-                    'type': 'game_state_update',
-                    'game_state': game_state
-                }
-            )
-
+            while await queue.is_queued(self.user.id):
+                await asyncio.sleep(SEARCH_REFRESH)
+                await queue.touch(self.user.id)
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            logger.error(f"Error in paddle_move: {str(e)}", exc_info=True)
+            logger.error(f"Error refreshing casual search: {str(e)}", exc_info=True)
 
-    async def update_ball_position(self):
-        """Update ball position"""
+    async def widen_search(self, rating):
+        """Retry the ranked pairing with a wider window until matched or cancelled"""
+        started = time.monotonic()
+        queue = get_rated_queue()
         try:
-            current_time = time.time()
-            
-            # Initialize cached state if needed
-            if not self.cached_game_state:
-                self.cached_game_state = self.game.game_state.copy()
-            
-            # Update ball position in cached state
-            ball = self.cached_game_state['ball']
-            ball['x'] += ball['dx']
-            ball['y'] += ball['dy']
-            
-            # Check for wall collisions
-            if ball['y'] - ball['radius'] <= 0 or ball['y'] + ball['radius'] >= self.cached_game_state['canvas']['height']:
-                ball['dy'] = -ball['dy']
-                logger.warning("Ball hit top/bottom wall")
-            
-            # Check for scoring
-            if ball['x'] <= 0:
-                # Player 2 scores
-                self.cached_game_state['score']['player2'] += 1
-                logger.warning(f"Score: Player 2 ({self.cached_game_state['score']['player2']}) - Player 1 ({self.cached_game_state['score']['player1']})")
-                
-                # Check for game end
-                if self.cached_game_state['score']['player2'] >= 11:
-                    logger.warning("Player 2 wins!")
-                    await self.end_game('player2')
+            while await queue.is_queued(self.user.id):
+                await asyncio.sleep(settings.GAME_RATING_SEARCH_INTERVAL)
+                window = rating_window(time.monotonic() - started)
+                opponent_id = await queue.pair(self.user.id, rating, window, retry=True)
+                if opponent_id is not None:
+                    await self.start_paired_game(opponent_id)
                     return
-                
-                self._reset_ball(self.cached_game_state)
-                
-                # Update score in database
-                await self.update_game_state_sync(
-                    self.game.id,
-                    self.cached_game_state,
-                    'all'
-                )
-                
-            elif ball['x'] >= self.cached_game_state['canvas']['width']:
-                # Player 1 scores
-                self.cached_game_state['score']['player1'] += 1
-                logger.warning(f"Score: Player 1 ({self.cached_game_state['score']['player1']}) - Player 2 ({self.cached_game_state['score']['player2']})")
-                
-                # Check for game end
-                if self.cached_game_state['score']['player1'] >= 11:
-                    logger.warning("Player 1 wins!")
-                    await self.end_game('player1')
-                    return
-                
-                self._reset_ball(self.cached_game_state)
-                
-                # Update score in database
-                await self.update_game_state_sync(
-                    self.game.id,
-                    self.cached_game_state,
-                    'all'
-                )
-            
-            # Check for paddle collisions
-            paddles = self.cached_game_state['paddles']
-            for paddle_id, paddle in paddles.items():
-                if (ball['x'] - ball['radius'] <= paddle['x'] + paddle['width'] and
-                    ball['x'] + ball['radius'] >= paddle['x'] and
-                    ball['y'] + ball['radius'] >= paddle['y'] and
-                    ball['y'] - ball['radius'] <= paddle['y'] + paddle['height']):
-                    ball['dx'] = -ball['dx']
-                    # Slightly increase speed on paddle hits
-                    if ball['dx'] > 0:
-                        ball['dx'] = min(ball['dx'] + 0.5, 10)
-                    else:
-                        ball['dx'] = max(ball['dx'] - 0.5, -10)
-                    logger.warning(f"Ball hit {paddle_id} paddle")
-                    break
-            
-            # Only update database periodically
-            if current_time - self.last_db_update >= self.db_update_interval:
-                await self.update_game_state_sync(
-                    self.game.id,
-                    self.cached_game_state,
-                    'all'
-                )
-                self.last_db_update = current_time
-            
-            # Send updates to clients at state_update_interval
-            if current_time - self.lastLogTime >= self.state_update_interval:
-                await self.channel_layer.group_send(
-                    self.channel_group_name,
-                    {
-                        'type': 'game_state_update',
-                        'game_state': self.cached_game_state,
-                        'update_type': 'all'
-                    }
-                )
-                self.lastLogTime = current_time
-                
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
-            logger.error(f"Error in update_ball_position: {str(e)}", exc_info=True)
-
-    def _reset_ball(self, game_state):
-        """Reset ball to center after scoring"""
-        canvas = game_state['canvas']
-        game_state['ball'].update({
-            'x': canvas['width'] / 2,
-            'y': canvas['height'] / 2,
-            'dx': 5 if random.random() > 0.5 else -5,
-            'dy': 5 if random.random() > 0.5 else -5
-        })
+            logger.error(f"Error widening ranked search: {str(e)}", exc_info=True)
+
+    def stop_search_task(self):
+        if self.search_task and self.search_task is not asyncio.current_task():
+            self.search_task.cancel()
+        self.search_task = None
+
+    async def cancel_search(self):
+        """Leave both matchmaking queues and stop refreshing or widening the search"""
+        self.stop_search_task()
+        await get_queue().cancel(self.user.id)
+        await get_rated_queue().cancel(self.user.id)
+
+    async def start_paired_game(self, opponent_id):
+        """Create the game for a found pair and push it to both players"""
+        # The game row only exists once both players are known
+        game = await self.create_paired_game(opponent_id)
+        if not game:
+            await self.send_json({
+                'type': 'error',
+                'message': 'Failed to create game'
+            })
+            return None
 
-    async def game_state_update(self, event):
-        """Handle game state update"""
+        # Push the match to both players wherever they are connected
+        event = {
+            'type': 'game_joined',
+            'game_id': str(game.id),
+            'player1_id': opponent_id,
+            'player2_id': self.user.id,
+            'game_state': game.game_state
+        }
+        for user_id in (opponent_id, self.user.id):
+            await self.channel_layer.group_send(f"user_{user_id}", event)
+        logger.info(f"[GAME {game.id}] Sent join message to both players")
+        return game
+
+    async def paddle_move(self, direction, game_id, seq=0):
+        """Send a paddle input to the worker hosting the match"""
         try:
-            if event.get('type') == 'game_end':
-                logger.warning("Received game_end event in game_state_update")
-                await self.send_json(event)
-            else:
-                await self.send_json({
-                    'type': 'game_state_update',
-                    'game_state': event.get('game_state', {}),
-                    'update_type': event.get('update_type', 'all')
-                })
+            host = await get_host()
+            await host.relay_input(game_id, self.user.id, direction, seq)
         except Exception as e:
-            logger.error(f"Error in game_state_update: {str(e)}", exc_info=True)
+            logger.error(f"Error in paddle_move: {str(e)}", exc_info=True)
 
-    async def end_game(self, winner):
-        """End the game and update the database"""
+    async def game_frame(self, event):
+        """Forward a keyframe or delta from the match ticker.
+
+        The ticker already encoded the frame, so this must not re-serialize.
+        """
         try:
-            logger.warning("=== ENDING GAME ===")
-            logger.warning(f"Winner: {winner}")
-            
-            # Get final game state from database
-            game = await self.get_game(self.game.id)
-            final_score = None
-            if game and game.game_state:
-                final_score = game.game_state['score']
-                logger.warning(f"Final Score: {final_score}")
-            
-            # Calculate game duration
-            if self.game_start_time:
-                game_duration = int(time.time() - self.game_start_time)
-                minutes = game_duration // 60
-                seconds = game_duration % 60
-                duration_formatted = f"{minutes:02d}:{seconds:02d}"
+            if self.binary and event['bytes'] is not None:
+                await self.send(bytes_data=event['bytes'])
             else:
-                game_duration = 0
-                duration_formatted = "00:00"
-            
-            # Get winner's user ID
-            winner_id = None
-            if winner == 'player1':
-                winner_id = self.game.player1_id
-            elif winner == 'player2':
-                winner_id = self.game.player2_id
-            
-            # Update game status in database
-            await self.update_game_status('ended', winner_id, game_duration, duration_formatted)
-            
-            # Notify all players that game has ended
-            await self.channel_layer.group_send(
-                self.channel_group_name,
-                {
-                    'type': 'game_end_message',
-                    'winner': winner,
-                    'duration': duration_formatted,
-                    'final_score': final_score
-                }
-            )
-            
+                await self.send(text_data=event['text'])
         except Exception as e:
-            logger.error(f"Error ending game: {str(e)}", exc_info=True)
+            logger.error(f"Error in game_frame: {str(e)}", exc_info=True)
+
+    async def send_keyframe(self):
+        """Send the full current state, from the engine when it runs here"""
+        engine = get_engine(self.game['id'])
+        if engine:
+            await self.send_json(protocol.keyframe(engine.snapshot(), engine.tick, engine.acks()))
+            return
+        # Running on another worker: rebuild it from the live state slots
+        live = await state_store.read_state(self.game['id'])
+        if live:
+            await self.send_json(protocol.keyframe(*live))
+            return
+        game = await self.get_game(self.game['id'])
+        if game:
+            await self.send_json(protocol.keyframe(game['game_state'], 0, [0, 0]))
 
     async def game_end_message(self, event):
         """Handle game end message"""
         try:
+            # Nothing left to be present for
+            if self.presence_task:
+                self.presence_task.cancel()
+                self.presence_task = None
             await self.send_json({
                 'type': 'game_end',
                 'winner': event['winner'],
+                'reason': event.get('reason', 'score'),
                 'duration': event['duration'],
                 'final_score': event['final_score']
             })
@@ -433,8 +221,17 @@ class GameConsumer(AsyncWebsocketConsumer):
             self.game = None
             self.user_group = f"user_{self.user.id}"
             
+            # Matchmaking reaches this connection through the user group
+            await self.channel_layer.group_add(
+                self.user_group,
+                self.channel_name
+            )
+
+            # Binary frames are opt-in through the WebSocket subprotocol
+            self.binary = protocol.BINARY_SUBPROTOCOL in self.scope.get('subprotocols', [])
+
             # Accept the connection first
-            await self.accept()
+            await self.accept(subprotocol=protocol.BINARY_SUBPROTOCOL if self.binary else None)
             
             # Then send the message
             await self.send_json({
@@ -448,12 +245,19 @@ class GameConsumer(AsyncWebsocketConsumer):
             
             logger.info(f"User {self.user.username} connected successfully")
 
+            # Back from a dropped connection or a dead worker: pick the match up again
+            await self.rejoin_game()
+
         except Exception as e:
             logger.error(f"Error in connect: {str(e)}", exc_info=True)
             await self.close()
 
     async def receive(self, text_data=None, bytes_data=None):
         try:
+            if bytes_data is not None:
+                await self.receive_binary(bytes_data)
+                return
+
             if not text_data:
                 return
                 
@@ -485,24 +289,30 @@ class GameConsumer(AsyncWebsocketConsumer):
                 logger.info(f"Received message {self.messageCount}: type={message_type}")
                 self.lastLogTime = current_time
 
-            if message_type == 'create_game':
-                await self.create_game()
-            
-            elif message_type == 'join_game':
-                game_id = data.get('game_id')
-                await self.join_game()
+            if message_type in ('create_game', 'join_game'):
+                if data.get('mode') == 'ranked':
+                    await self.find_ranked_match()
+                else:
+                    await self.find_match()
             
+            elif message_type == 'resync':
+                if self.game:
+                    await self.send_keyframe()
+
             elif message_type == 'paddle_move':
                 game_id = data.get('game_id')
                 direction = data.get('direction')
-                logger.info(f"Received paddle_move message: game_id={game_id}, direction={direction}")
+                seq = data.get('seq', 0)
                 if not game_id:
                     logger.error("Missing game_id in paddle_move message")
                     return
                 if not direction:
                     logger.error("Missing direction in paddle_move message")
                     return
-                await self.paddle_move(direction, game_id)
+                if not protocol.valid_seq(seq):
+                    logger.error("Invalid seq in paddle_move message")
+                    return
+                await self.paddle_move(direction, game_id, seq)
             
             elif message_type == 'user_connected':
                 # Handle user connection info
@@ -539,178 +349,89 @@ class GameConsumer(AsyncWebsocketConsumer):
                 'message': 'Internal server error'
             })
 
-    @database_sync_to_async
-    def get_game_with_players(self, game_id):
-        """Get game with player info from database"""
+    async def receive_binary(self, bytes_data):
+        """Handle a packed input frame from a binary mode client"""
+        data = protocol.decode_input(bytes_data)
+        if data is None:
+            logger.error(f"Invalid binary frame from {self.user.username}")
+            return
+        if not self.game:
+            return
+        await self.paddle_move(data['direction'], self.game['id'], data['seq'])
+
+    async def get_game(self, game_id):
+        """Get the game summary with player information, from the cache first"""
         try:
-            game = Game.objects.select_related('player1', 'player2').get(id=game_id)
-            return game
-        except Game.DoesNotExist:
-            logger.error(f"Game {game_id} not found")
-            return None
+            return await aget_summary(game_id)
         except Exception as e:
             logger.error(f"Error getting game: {str(e)}", exc_info=True)
             return None
 
-    @database_sync_to_async
-    def update_game_player2(self, game, player2):
-        """Update game's player2 and status"""
+    async def enter_game(self, game_id):
+        """Subscribe to the match and keep this connection counted as present"""
+        self.channel_group_name = f"game_{game_id}"
+        await self.channel_layer.group_add(
+            self.channel_group_name,
+            self.channel_name
+        )
+        await presence.touch(game_id, self.user_id, self.channel_name)
+        if self.presence_task:
+            self.presence_task.cancel()
+        self.presence_task = asyncio.create_task(self.refresh_presence(game_id))
+
+    async def refresh_presence(self, game_id):
+        """Refresh this connection's presence until cancelled, then withdraw it"""
         try:
-            game.player2 = player2
-            game.status = 'active'
-            game.save(update_fields=['player2', 'status', 'updated_at'])
-            return game
+            while True:
+                await asyncio.sleep(presence.PRESENCE_REFRESH)
+                await presence.touch(game_id, self.user_id, self.channel_name)
+        except asyncio.CancelledError:
+            await presence.leave(game_id, self.user_id, self.channel_name)
         except Exception as e:
-            logger.error(f"Error updating game: {str(e)}", exc_info=True)
-            return None
+            logger.error(f"Error refreshing presence: {str(e)}", exc_info=True)
+
+    async def rejoin_game(self):
+        """Resume the running match of this user, hosting it here if its worker died"""
+        summary = await database_sync_to_async(find_active_game)(self.user_id)
+        if summary is None:
+            return
+        self.game = summary
+        await self.enter_game(summary['id'])
+        summary = await with_live_state(summary)
+        await self.send_json({
+            'type': 'game_joined',
+            'game_id': str(summary['id']),
+            'player1_id': summary['player1']['id'],
+            'player2_id': summary['player2']['id'] if summary['player2'] else None,
+            'game_state': summary['game_state']
+        })
+        logger.info(f"[GAME {summary['id']}] Player {self.user.username} rejoined")
 
-    @database_sync_to_async
-    def get_game(self, game_id):
-        """Get game by id with player information"""
-        try:
-            return Game.objects.select_related('player1', 'player2').get(id=game_id)
-        except Game.DoesNotExist:
-            return None
-        except Exception as e:
-            logger.error(f"Error getting game: {str(e)}", exc_info=True)
-            return None
-
-    @database_sync_to_async
-    def find_available_game(self):
-        """Find an available game to join"""
-        try:
-            # Look for a game waiting for players
-            game = Game.objects.select_related('player1', 'player2').filter(
-                status='waiting'
-            ).first()
-            
-            if game:
-                logger.info(f"Found available game {game.id}")
-            return game
-            
-        except Exception as e:
-            logger.error(f"Error finding available game: {str(e)}", exc_info=True)
-            return None
+        # Takes the match over from its checkpoint if nobody holds its lease
+        host = await get_host()
+        await host.host_match(summary['id'])
 
     async def game_joined(self, event):
         try:
-            # Initialize game state
-            if not hasattr(self, '_game_state'):
-                self._game_state = event['game_state']
-            
+            # Matchmaking paired us: stop searching, subscribe to the match before it starts
+            await self.cancel_search()
+            self.game = await self.get_game(event['game_id'])
+            await self.enter_game(event['game_id'])
+            logger.info(f"[GAME {event['game_id']}] Player {self.user.username} added to channel group {self.channel_group_name}")
+
             await self.send_json({
                 'type': 'game_joined',
                 'game_id': event['game_id'],
                 'player1_id': event['player1_id'],
                 'player2_id': event['player2_id'],
-                'game_state': self._game_state
+                'game_state': event['game_state']
             })
-            
-            # Start game loop when both players have joined
-            if self.game and self.game.status == 'active' and self.game.player1 and self.game.player2:
-                asyncio.create_task(self.game_loop())
-        except Exception as e:
-            logger.error(f'Error in game_joined: {str(e)}', exc_info=True)
-
-    async def game_loop(self):
-        """Game loop to update ball position"""
-        try:
-            logger.info(f"[GAME {self.game.id}] Starting game loop")
-            
-            while self.game and self.game.status == 'active':
-                # Get current game state
-                game = await self.get_game(self.game.id)
-                if not game:
-                    break
-                
-                # Create a copy of the game state to avoid modifying it directly
-                game_state = game.game_state.copy()
-                ball = game_state['ball']
-                
-                # Update ball position
-                ball['x'] += ball['dx']
-                ball['y'] += ball['dy']
-                
-                # Ball collision with top and bottom walls
-                if ball['y'] <= ball['radius'] or ball['y'] >= game_state['canvas']['height'] - ball['radius']:
-                    ball['dy'] *= -1
-                    logger.warning("Ball hit wall")
-                
-                # Ball collision with paddles
-                paddles = game_state['paddles']
-                
-                # Left paddle collision
-                if (ball['x'] - ball['radius'] <= paddles['player1']['x'] + paddles['player1']['width'] and
-                    ball['y'] >= paddles['player1']['y'] and
-                    ball['y'] <= paddles['player1']['y'] + paddles['player1']['height']):
-                    ball['dx'] = abs(ball['dx'])  # Ensure ball moves right
-                    ball['dx'] *= 1.1  # Speed up slightly
-                    logger.warning("Ball hit Player 1 paddle")
-                
-                # Right paddle collision
-                if (ball['x'] + ball['radius'] >= paddles['player2']['x'] and
-                    ball['y'] >= paddles['player2']['y'] and
-                    ball['y'] <= paddles['player2']['y'] + paddles['player2']['height']):
-                    ball['dx'] = -abs(ball['dx'])  # Ensure ball moves left
-                    ball['dx'] *= 1.1  # Speed up slightly
-                    logger.warning("Ball hit Player 2 paddle")
-                
-                # Ball out of bounds - scoring
-                if ball['x'] < 0:  # Player 2 scores
-                    game_state['score']['player2'] += 1
-                    logger.warning(f"Score: Player 2 ({game_state['score']['player2']}) - Player 1 ({game_state['score']['player1']})")
-                    
-                    # Check for game end
-                    if game_state['score']['player2'] >= 11:
-                        logger.warning("Player 2 wins!")
-                        # Save final state before ending
-                        await self.update_game_state_sync(self.game.id, game_state)
-                        await self.end_game('player2')
-                        return
-                    
-                    ball['x'] = game_state['canvas']['width'] / 2
-                    ball['y'] = game_state['canvas']['height'] / 2
-                    ball['dx'] = -5  # Reset speed and direction
-                    ball['dy'] = 5 if ball['dy'] > 0 else -5
-                    
-                elif ball['x'] > game_state['canvas']['width']:  # Player 1 scores
-                    game_state['score']['player1'] += 1
-                    logger.warning(f"Score: Player 1 ({game_state['score']['player1']}) - Player 2 ({game_state['score']['player2']})")
-                    
-                    # Check for game end
-                    if game_state['score']['player1'] >= 11:
-                        logger.warning("Player 1 wins!")
-                        # Save final state before ending
-                        await self.update_game_state_sync(self.game.id, game_state)
-                        await self.end_game('player1')
-                        return
-                    
-                    ball['x'] = game_state['canvas']['width'] / 2
-                    ball['y'] = game_state['canvas']['height'] / 2
-                    ball['dx'] = 5  # Reset speed and direction
-                    ball['dy'] = 5 if ball['dy'] > 0 else -5
-                
-                # Save to database
-                await self.update_game_state_sync(self.game.id, game_state)
 
-                # Send game state update to all players
-                await self.channel_layer.group_send(
-                    self.channel_group_name,
-                    {
-                        'type': 'game_state_update',
-                        'game_state': game_state
-                    }
-                )
-                
-                # Wait before next update (60 FPS)
-                await asyncio.sleep(1/60)
-                
+            # Both players are in: make sure exactly one worker hosts this match
+            host = await get_host()
+            await host.host_match(event['game_id'])
         except Exception as e:
-            logger.error(f"Error in game loop: {str(e)}", exc_info=True)
-            await self.send_json({
-                'type': 'error',
-                'message': 'Game loop error'
-            })
+            logger.error(f'Error in game_joined: {str(e)}', exc_info=True)
 
     async def send_json(self, content):
         """Send JSON message to WebSocket"""
@@ -734,9 +455,12 @@ class GameConsumer(AsyncWebsocketConsumer):
                     self.channel_group_name,
                     self.channel_name
                 )
+            if self.presence_task:
+                self.presence_task.cancel()
             
             # Only try to remove from user group if we have one
             if self.user_group:
+                await self.cancel_search()
                 await self.channel_layer.group_discard(
                     self.user_group,
                     self.channel_name
@@ -750,22 +474,187 @@ class GameConsumer(AsyncWebsocketConsumer):
         finally:
             logger.info(f"User {self.user.username if hasattr(self, 'user') else 'Unknown'} disconnected")
 
-    @database_sync_to_async
-    def update_game_status(self, status, winner=None, duration=None, duration_formatted=None):
-        """Update game status and statistics in database"""
+
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """Read-only match stream for viewers.
+
+    Frames come from this worker's spectator feed of the match, so a
+    viewer costs nothing on the match host. The route is outside
+    AuthMiddlewareStack (see transcendence/asgi.py), so no session or
+    user is loaded either: watching needs no login and no query.
+    """
+
+    async def connect(self):
+        self.game_id = int(self.scope['url_route']['kwargs']['game_id'])
+        self.hub = get_hub()
         try:
-            update_fields = {
-                'status': status,
-                'updated_at': timezone.now()
-            }
-            
-            if winner is not None:
-                update_fields['winner_id'] = winner
-            
-            if duration is not None:
-                update_fields['duration'] = duration
-                update_fields['duration_formatted'] = duration_formatted
-            
-            Game.objects.filter(id=self.game.id).update(**update_fields)
+            await self.accept()
+            keyframe = await self.hub.watch(self.game_id, self)
+            if keyframe is None:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'Game is not being played'
+                }))
+                await self.close()
+                return
+            await self.send(text_data=json.dumps(keyframe))
         except Exception as e:
-            logger.error(f"Error updating game status: {str(e)}", exc_info=True)
+            logger.error(f"Error in spectator connect: {str(e)}", exc_info=True)
+            await self.close()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '{}')
+        except json.JSONDecodeError:
+            return
+        message_type = data.get('type')
+        if message_type == 'heartbeat':
+            await self.send(text_data=json.dumps({'type': 'heartbeat_response'}))
+        elif message_type == 'resync':
+            keyframe = self.hub.keyframe(self.game_id)
+            if keyframe:
+                await self.send(text_data=json.dumps(keyframe))
+
+    async def disconnect(self, close_code):
+        self.hub.unwatch(self.game_id, self)
+
+
+class ReplayConsumer(AsyncWebsocketConsumer):
+    """Playback of a recorded match, at 1x or faster.
+
+    The match is re-simulated on this worker from its replay file, so
+    playback needs nothing from a match host and no query past the
+    (cached) game summary.
+    Viewers start at ``?speed=`` and may send ``seek`` (a tick),
+    ``speed``, ``pause`` and ``play``. Seeking re-simulates from the
+    nearest keyframe before the target tick.
+
+    Replays are open to any logged-in user, like the game REST endpoints,
+    but only once the match has ended: until then the file is still
+    being written and viewers belong on the spectator stream.
+    """
+
+    async def connect(self):
+        self.game_id = int(self.scope['url_route']['kwargs']['game_id'])
+        self.playback = None
+        if self.scope['user'].is_anonymous:
+            await self.close()
+            return
+        try:
+            await self.accept()
+            summary = await aget_summary(self.game_id)
+            if summary is None or summary['status'] != 'ended':
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'Replay is available once the game has ended'
+                }))
+                await self.close()
+                return
+            self.replay = await asyncio.to_thread(Replay.load, self.game_id)
+            if self.replay is None:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'No replay for this game'
+                }))
+                await self.close()
+                return
+
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            self.speed = self.clamp_speed(query.get('speed', ['1'])[0])
+            self.paused = False
+            await self.send(text_data=json.dumps({
+                'type': 'replay_info',
+                'tick_rate': self.replay.tick_rate,
+                'start_tick': self.replay.start_tick,
+                'last_tick': self.replay.last_tick,
+                'keyframes': self.replay.keyframe_ticks(),
+                'winner': self.replay.winner
+            }))
+            await self.seek(self.replay.start_tick)
+            self.playback = asyncio.create_task(self.play())
+        except Exception as e:
+            logger.error(f"Error in replay connect: {str(e)}", exc_info=True)
+            await self.close()
+
+    def clamp_speed(self, value):
+        try:
+            speed = float(value)
+        except (TypeError, ValueError):
+            return 1.0
+        return max(1.0, min(speed, REPLAY_MAX_SPEED))
+
+    async def seek(self, tick):
+        self.engine = self.replay.engine_at(tick)
+        self.pending_ticks = 0.0
+        await self.send_keyframe()
+
+    async def send_keyframe(self):
+        engine = self.engine
+        self.sent_paddles = protocol.paddle_positions(engine.state)
+        await self.send(text_data=json.dumps(protocol.keyframe(engine.snapshot(), engine.tick, [0, 0])))
+
+    async def play(self):
+        try:
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(1 / REPLAY_FRAME_RATE)
+                now = time.monotonic()
+                elapsed, last = now - last, now
+                if self.paused:
+                    continue
+
+                engine = self.engine
+                last_tick = self.replay.last_tick
+                self.pending_ticks += elapsed * self.replay.tick_rate * self.speed
+                results = []
+                while self.pending_ticks >= 1 and engine.tick < last_tick:
+                    results.append(self.replay.step(engine))
+                    self.pending_ticks -= 1
+
+                if 'score' in results or 'end' in results:
+                    await self.send_keyframe()
+                elif results:
+                    frame = protocol.delta(engine.state, engine.tick, self.sent_paddles, [0, 0])
+                    await self.send(text_data=json.dumps(frame, separators=(',', ':')))
+
+                if engine.tick >= last_tick:
+                    self.paused = True
+                    await self.send(text_data=json.dumps({
+                        'type': 'replay_end',
+                        'tick': engine.tick,
+                        'winner': self.replay.winner,
+                        'final_score': engine.state.score_json()
+                    }))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"[GAME {self.game_id}] Error in replay playback: {str(e)}", exc_info=True)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.playback is None:
+            return
+        try:
+            data = json.loads(text_data or '{}')
+        except json.JSONDecodeError:
+            return
+        message_type = data.get('type')
+        try:
+            if message_type == 'seek':
+                await self.seek(int(data.get('tick', 0)))
+                self.paused = False
+            elif message_type == 'speed':
+                self.speed = self.clamp_speed(data.get('speed'))
+            elif message_type == 'pause':
+                self.paused = True
+            elif message_type == 'play':
+                if self.engine.tick >= self.replay.last_tick:
+                    await self.seek(self.replay.start_tick)
+                self.paused = False
+            elif message_type == 'heartbeat':
+                await self.send(text_data=json.dumps({'type': 'heartbeat_response'}))
+        except (TypeError, ValueError, OverflowError):
+            return
+
+    async def disconnect(self, close_code):
+        if self.playback is not None:
+            self.playback.cancel()
@@ -0,0 +1,180 @@
+import logging
+import math
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import collision, protocol
+from .state import MatchState
+
+logger = logging.getLogger('game')
+
+WINNING_SCORE = 11
+INPUT_QUEUE_LIMIT = 32  # Oldest inputs are dropped past this many per player
+
+
+class MatchEngine:
+    """Authoritative in-memory state of a single running match.
+
+    The engine owns the ball, paddles and score for the whole life of a
+    match. Nothing here touches the database: callers decide when to
+    persist ``snapshot()`` (on scoring, at match end and whenever
+    ``checkpoint_due()`` says so).
+    """
+
+    def __init__(self, game_id, game_state, player1_id, player2_id, checkpoint_interval=None):
+        self.game_id = game_id
+        self.state = MatchState.from_json(game_state)
+        self.players = {'player1': player1_id, 'player2': player2_id}
+        if checkpoint_interval is None:
+            checkpoint_interval = settings.GAME_CHECKPOINT_INTERVAL
+        self.checkpoint_interval = checkpoint_interval
+        self.dt = collision.step_length(settings.GAME_TICK_RATE)
+        self.max_speed = settings.GAME_BALL_MAX_SPEED
+        self.bounce_angle = math.radians(settings.GAME_BOUNCE_ANGLE)
+        self.last_checkpoint = time.monotonic()
+        self.winner = None
+        self.tick = 0
+        self.inputs = {paddle_key: deque(maxlen=INPUT_QUEUE_LIMIT) for paddle_key in self.players}
+        self.last_seq = {paddle_key: 0 for paddle_key in self.players}
+        self.batch = None  # BatchPhysics stepping this engine, if any
+        self.recorder = None  # ReplayRecorder logging the applied inputs, if any
+        self.paused = False
+
+    def paddle_for(self, user_id):
+        """Return the paddle key controlled by ``user_id``, or None"""
+        for paddle_key, player_id in self.players.items():
+            if player_id == user_id:
+                return paddle_key
+        return None
+
+    def queue_input(self, paddle_key, direction, seq):
+        """Queue a paddle input for the next step, False if it is invalid"""
+        if direction not in ('up', 'down') or not protocol.valid_seq(seq):
+            return False
+        self.inputs[paddle_key].append((seq, direction))
+        if self.batch is not None:
+            self.batch.pending_inputs.add(self.game_id)
+        return True
+
+    def apply_inputs(self, tick=None):
+        """Drain the input queues in arrival order.
+
+        ``tick`` is the step the inputs are applied in, the current one
+        by default.
+        """
+        recorder = self.recorder
+        if tick is None:
+            tick = self.tick
+        for paddle_key, queue in self.inputs.items():
+            while queue:
+                seq, direction = queue.popleft()
+                self.move_paddle(paddle_key, direction)
+                self.last_seq[paddle_key] = seq
+                if recorder is not None:
+                    recorder.input(tick, paddle_key, direction)
+
+    def drop_inputs(self):
+        """Discard queued inputs, acked so clients stop predicting them"""
+        for paddle_key, queue in self.inputs.items():
+            if queue:
+                self.last_seq[paddle_key] = queue[-1][0]
+                queue.clear()
+
+    def acks(self):
+        """Last processed input sequence number per player"""
+        return [self.last_seq['player1'], self.last_seq['player2']]
+
+    def move_paddle(self, paddle_key, direction):
+        """Move a paddle one step, returns the new y or None if invalid"""
+        state = self.state
+        paddle = state.paddle(paddle_key)
+
+        if direction == 'up':
+            paddle.y = max(0, paddle.y - state.paddle_speed)
+        elif direction == 'down':
+            paddle.y = min(state.canvas_height - paddle.height, paddle.y + state.paddle_speed)
+        else:
+            return None
+        return paddle.y
+
+    def step(self):
+        """Advance the simulation by one tick.
+
+        Returns 'end' when the match is over, 'score' when a point was
+        scored during this tick and None otherwise.
+        """
+        self.tick += 1
+        self.apply_inputs()
+        state = self.state
+        ball = state.ball
+        collision.sweep(state, self.dt, self.max_speed, self.bounce_angle)
+
+        # Ball out of bounds - scoring
+        if ball.x < 0:
+            return self._score('player2', serve_dx=-5)
+        if ball.x > state.canvas_width:
+            return self._score('player1', serve_dx=5)
+        return None
+
+    def _score(self, scorer, serve_dx):
+        points = self.state.add_point(scorer)
+        score = self.state.score
+        logger.warning(f"[GAME {self.game_id}] Score: Player 1 ({score[0]}) - Player 2 ({score[1]})")
+
+        if points >= WINNING_SCORE:
+            self.winner = scorer
+            return 'end'
+
+        self._reset_ball(serve_dx)
+        return 'score'
+
+    def _reset_ball(self, serve_dx):
+        """Reset ball to center after scoring"""
+        state = self.state
+        ball = state.ball
+        ball.x = state.canvas_width / 2
+        ball.y = state.canvas_height / 2
+        ball.dx = serve_dx
+        ball.dy = 5 if ball.dy > 0 else -5
+
+    def restore(self, game_state, tick, acks):
+        """Resume from a snapshot taken by the previous host of this match"""
+        self.state = MatchState.from_json(game_state)
+        self.tick = tick
+        self.last_seq = {'player1': acks[0], 'player2': acks[1]}
+
+    def snapshot(self):
+        """Return a detached copy of the state in the Game.game_state layout"""
+        return self.state.to_json()
+
+    def checkpoint_due(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        return now - self.last_checkpoint >= self.checkpoint_interval
+
+    def mark_checkpoint(self, now=None):
+        self.last_checkpoint = time.monotonic() if now is None else now
+
+
+_engines = {}
+
+
+def get_engine(game_id):
+    """Return the running engine for ``game_id`` in this process, if any"""
+    return _engines.get(int(game_id))
+
+
+def start_engine(game):
+    """Return the engine for ``game``, creating it from the persisted state"""
+    engine = _engines.get(game.id)
+    if engine is None:
+        engine = MatchEngine(game.id, game.game_state, game.player1_id, game.player2_id)
+        _engines[game.id] = engine
+        logger.info(f"[GAME {game.id}] Match engine started")
+    return engine
+
+
+def stop_engine(game_id):
+    return _engines.pop(int(game_id), None)
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+from datetime import timedelta
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .engine import get_engine
+from .lease import lease_holder, lease_holders
+from .store import get_redis, redis_enabled
+from .ticker import ensure_ticker, hosted_games, idle_active_games, owner_key, stop_ticker
+
+logger = logging.getLogger('game')
+
+HOSTS_KEY = 'game:hosts'
+OWNER_CACHE_TTL = 1.0  # Seconds a looked-up match host is reused for relaying inputs
+
+# One host per event loop, like the Redis clients
+_hosts = weakref.WeakKeyDictionary()
+_local_registry = {}
+
+
+def host_timeout():
+    """Seconds without a heartbeat before a worker is considered gone"""
+    return settings.GAME_LEASE_TTL * 3
+
+
+def queue_input(engine, user_id, direction, seq):
+    """Queue a paddle input on the engine hosted in this process"""
+    paddle_key = engine.paddle_for(user_id)
+    if not paddle_key:
+        logger.error(f"[GAME {engine.game_id}] User {user_id} is not a player")
+        return
+    # Applied on the next step, the frame after it acks seq
+    if not engine.queue_input(paddle_key, direction, seq):
+        logger.error(f"[GAME {engine.game_id}] Invalid input: {direction} {seq}")
+
+
+class MatchHost:
+    """This worker's endpoint for the matches it runs.
+
+    Every worker process listens on its own channel of the channel layer
+    and records that channel as the holder of the lease of each match it
+    ticks. Consumers on other workers relay inputs there, and the worker
+    can be drained: its matches are stopped and handed, with their last
+    in-memory snapshot, to the least loaded live worker. Every worker also
+    sweeps for active matches whose lease expired because their host
+    died, and resumes them from their last checkpoint.
+    """
+
+    def __init__(self):
+        self.channel_layer = get_channel_layer()
+        self.channel_name = None
+        self.draining = False
+        self.owners = {}
+        self.ready = None
+        self.tasks = []
+
+    async def start(self):
+        self.channel_name = await self.channel_layer.new_channel()
+        self.tasks = [
+            asyncio.create_task(self.listen()),
+            asyncio.create_task(self.heartbeat()),
+            asyncio.create_task(self.sweep()),
+        ]
+        logger.info(f"Match host listening on {self.channel_name}")
+
+    async def listen(self):
+        """Dispatch messages sent to this worker's channel"""
+        while True:
+            message = await self.channel_layer.receive(self.channel_name)
+            try:
+                handler = getattr(self, message['type'].replace('.', '_'), None)
+                if handler is None:
+                    logger.error(f"Unknown match host message: {message['type']}")
+                    continue
+                await handler(message)
+            except Exception as e:
+                logger.error(f"Error handling match host message: {str(e)}", exc_info=True)
+
+    async def heartbeat(self):
+        while True:
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.error(f"Error publishing match host heartbeat: {str(e)}", exc_info=True)
+            await asyncio.sleep(settings.GAME_LEASE_TTL)
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(settings.GAME_SWEEP_INTERVAL)
+            self.prune_owners()
+            if self.draining:
+                continue
+            try:
+                await self.recover_orphans()
+            except Exception as e:
+                logger.error(f"Error sweeping for orphaned matches: {str(e)}", exc_info=True)
+
+    async def recover_orphans(self):
+        """Host the active matches nobody holds the lease of, returns how many"""
+        # Rows written within a lease TTL belong to matches still starting or running
+        before = timezone.now() - timedelta(seconds=settings.GAME_LEASE_TTL)
+        game_ids = await idle_active_games(before)
+        holders = await lease_holders([owner_key(game_id) for game_id in game_ids])
+        recovered = 0
+        for game_id, holder in zip(game_ids, holders):
+            if holder is None and await self.host_match(game_id):
+                logger.warning(f"[GAME {game_id}] Lease expired, match recovered by {self.channel_name}")
+                recovered += 1
+        return recovered
+
+    async def publish(self):
+        """Advertise this worker, its load and whether it takes new matches"""
+        info = json.dumps({
+            'seen': time.time(),
+            'matches': len(hosted_games()),
+            'draining': self.draining,
+        })
+        if redis_enabled():
+            await get_redis().hset(HOSTS_KEY, self.channel_name, info)
+        else:
+            _local_registry[self.channel_name] = info
+
+    async def pick_target(self):
+        """The least loaded live worker other than this one, or None"""
+        hosts = await live_hosts()
+        candidates = [
+            (info['matches'], channel) for channel, info in hosts.items()
+            if channel != self.channel_name and not info['draining']
+        ]
+        return min(candidates)[1] if candidates else None
+
+    async def host_match(self, game_id, resume=None):
+        """Run ``game_id`` here, or on another worker while this one drains"""
+        if self.draining and await self.hand_off(game_id, resume):
+            return False
+        return await ensure_ticker(game_id, owner=self.channel_name, resume=resume)
+
+    async def hand_off(self, game_id, resume=None):
+        target = await self.pick_target()
+        if target is None:
+            logger.warning(f"[GAME {game_id}] No other worker to host the match")
+            return False
+        self.owners.pop(int(game_id), None)
+        await self.channel_layer.send(target, {
+            'type': 'match.adopt',
+            'game_id': int(game_id),
+            'resume': resume,
+        })
+        logger.info(f"[GAME {game_id}] Handed match to {target}")
+        return True
+
+    async def drain(self):
+        """Stop taking matches and migrate the running ones to other workers"""
+        self.draining = True
+        await self.publish()
+        moved = 0
+        for game_id in hosted_games():
+            resume = await stop_ticker(game_id)
+            if resume is None:
+                continue
+            if await self.hand_off(game_id, resume):
+                moved += 1
+            else:
+                # Nowhere to go: keep running it here
+                await ensure_ticker(game_id, owner=self.channel_name, resume=resume)
+        await self.publish()
+        logger.warning(f"Match host {self.channel_name} drained, {moved} matches migrated")
+        return moved
+
+    async def find_owner(self, game_id):
+        """Channel of the worker hosting ``game_id``, cached briefly"""
+        now = time.monotonic()
+        owner, expires_at = self.owners.get(game_id, (None, 0))
+        if expires_at <= now:
+            owner = await lease_holder(owner_key(game_id))
+            if owner is None:
+                # Ended or between hosts: nothing worth remembering
+                self.owners.pop(game_id, None)
+            else:
+                self.owners[game_id] = (owner, now + OWNER_CACHE_TTL)
+        return owner
+
+    def prune_owners(self):
+        """Forget the expired hosts, which would otherwise pile up for every match ever relayed to"""
+        now = time.monotonic()
+        for game_id in [game_id for game_id, (_, expires_at) in self.owners.items() if expires_at <= now]:
+            del self.owners[game_id]
+
+    async def relay_input(self, game_id, user_id, direction, seq):
+        """Deliver a paddle input to the match, wherever it is hosted"""
+        engine = get_engine(game_id)
+        if engine:
+            queue_input(engine, user_id, direction, seq)
+            return
+        owner = await self.find_owner(int(game_id))
+        if owner is None or owner == self.channel_name:
+            logger.error(f"[GAME {game_id}] Game not active")
+            return
+        await self.channel_layer.send(owner, {
+            'type': 'match.input',
+            'game_id': int(game_id),
+            'user_id': user_id,
+            'direction': direction,
+            'seq': seq,
+        })
+
+    async def match_input(self, message):
+        engine = get_engine(message['game_id'])
+        if not engine:
+            # Migrated away since the sender looked us up
+            self.owners.pop(message['game_id'], None)
+            logger.warning(f"[GAME {message['game_id']}] Dropped input for a match not hosted here")
+            return
+        queue_input(engine, message['user_id'], message['direction'], message['seq'])
+
+    async def match_adopt(self, message):
+        await self.host_match(message['game_id'], message.get('resume'))
+
+    async def host_drain(self, message):
+        await self.drain()
+
+
+async def get_host():
+    """Return the match host of the running event loop, starting it on first use"""
+    loop = asyncio.get_running_loop()
+    host = _hosts.get(loop)
+    if host is None:
+        host = MatchHost()
+        _hosts[loop] = host
+        host.ready = loop.create_task(host.start())
+    await host.ready
+    return host
+
+
+async def live_hosts():
+    """Registered workers that sent a heartbeat recently, by channel name"""
+    if redis_enabled():
+        raw = await get_redis().hgetall(HOSTS_KEY)
+        hosts = {channel.decode(): json.loads(info) for channel, info in raw.items()}
+    else:
+        hosts = {channel: json.loads(info) for channel, info in _local_registry.items()}
+
+    cutoff = time.time() - host_timeout()
+    stale = [channel for channel, info in hosts.items() if info['seen'] < cutoff]
+    if stale:
+        if redis_enabled():
+            await get_redis().hdel(HOSTS_KEY, *stale)
+        else:
+            for channel in stale:
+                _local_registry.pop(channel, None)
+    return {channel: info for channel, info in hosts.items() if channel not in stale}
@@ -0,0 +1,95 @@
+import time
+import uuid
+
+from .store import get_redis, redis_enabled
+
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLease:
+    """Expiring ownership of ``key`` shared by every worker through Redis"""
+
+    def __init__(self, key, ttl, token=None):
+        self.key = key
+        self.ttl_ms = int(ttl * 1000)
+        self.token = token or uuid.uuid4().hex
+
+    async def acquire(self):
+        return bool(await get_redis().set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    async def renew(self):
+        return bool(await get_redis().eval(RENEW_SCRIPT, 1, self.key, self.token, self.ttl_ms))
+
+    async def release(self):
+        await get_redis().eval(RELEASE_SCRIPT, 1, self.key, self.token)
+
+
+_local_leases = {}
+
+
+class LocalLease:
+    """Same contract as RedisLease, scoped to this process (dev and tests)"""
+
+    def __init__(self, key, ttl, token=None):
+        self.key = key
+        self.ttl = ttl
+        self.token = token or uuid.uuid4().hex
+
+    def _holder(self):
+        token, expires_at = _local_leases.get(self.key, (None, 0))
+        if expires_at <= time.monotonic():
+            return None
+        return token
+
+    async def acquire(self):
+        if self._holder() is not None:
+            return False
+        _local_leases[self.key] = (self.token, time.monotonic() + self.ttl)
+        return True
+
+    async def renew(self):
+        if self._holder() != self.token:
+            return False
+        _local_leases[self.key] = (self.token, time.monotonic() + self.ttl)
+        return True
+
+    async def release(self):
+        if self._holder() == self.token:
+            del _local_leases[self.key]
+
+
+def make_lease(key, ttl, token=None):
+    """Lease on ``key``, ``token`` identifies the holder (random by default)"""
+    if redis_enabled():
+        return RedisLease(key, ttl, token)
+    return LocalLease(key, ttl, token)
+
+
+async def lease_holder(key):
+    """Token of the current holder of ``key``, or None when it is free"""
+    if redis_enabled():
+        token = await get_redis().get(key)
+        return token.decode() if token else None
+    token, expires_at = _local_leases.get(key, (None, 0))
+    return token if expires_at > time.monotonic() else None
+
+
+async def lease_holders(keys):
+    """Token of the current holder of each of ``keys``, None where free"""
+    if not keys:
+        return []
+    if redis_enabled():
+        return [token.decode() if token else None for token in await get_redis().mget(keys)]
+    return [await lease_holder(key) for key in keys]
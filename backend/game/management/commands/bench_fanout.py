@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from game import protocol
+from game.consumers import GameConsumer
+from game.engine import MatchEngine
+from game.models import default_game_state
+
+
+class Command(BaseCommand):
+    help = 'Measure per-tick CPU of game frame fan-out as the subscriber count grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, nargs='+', default=[2, 10, 100, 1000])
+        parser.add_argument('--ticks', type=int, default=600)
+        parser.add_argument('--binary-share', type=float, default=0.0,
+                            help='Fraction of subscribers using binary frames')
+
+    def handle(self, *args, **options):
+        # Keep score and per-send logging out of the measurement
+        logging.getLogger('game').setLevel(logging.ERROR)
+        frames = self.record_frames(options['ticks'])
+
+        self.stdout.write(f"{'subscribers':>12} {'per-socket us/tick':>20} {'serialize-once us/tick':>24} {'speedup':>8}")
+        for count in options['subscribers']:
+            consumers = self.make_consumers(count, options['binary_share'])
+            legacy = asyncio.run(self.run_per_socket(consumers, frames))
+            once = asyncio.run(self.run_serialize_once(consumers, frames))
+            self.stdout.write(f"{count:>12} {legacy:>20.1f} {once:>24.1f} {legacy / once:>7.1f}x")
+
+    def record_frames(self, ticks):
+        """Frames of a real match, with a keyframe on every point like the ticker"""
+        engine = MatchEngine(0, default_game_state(), 1, 2, checkpoint_interval=0)
+        sent_paddles = protocol.paddle_positions(engine.state)
+        frames = []
+        for _ in range(ticks):
+            result = engine.step()
+            if result == 'end':
+                break
+            if result == 'score':
+                sent_paddles = protocol.paddle_positions(engine.state)
+                frames.append(protocol.keyframe(engine.snapshot(), engine.tick, engine.acks()))
+            else:
+                frames.append(protocol.delta(engine.state, engine.tick, sent_paddles, engine.acks()))
+        return frames
+
+    def make_consumers(self, count, binary_share):
+        async def send(text_data=None, bytes_data=None, close=False):
+            pass
+
+        consumers = []
+        binary_count = int(count * binary_share)
+        for i in range(count):
+            consumer = GameConsumer()
+            consumer.user = SimpleNamespace(username=f'bench{i}')
+            consumer.binary = i < binary_count
+            consumer.send = send
+            consumers.append(consumer)
+        return consumers
+
+    async def run_per_socket(self, consumers, frames):
+        """Every subscriber encodes the frame itself, as before"""
+        start = time.process_time()
+        for frame in frames:
+            for consumer in consumers:
+                if consumer.binary and frame['type'] == 'game_delta':
+                    await consumer.send(bytes_data=protocol.encode_delta(frame))
+                else:
+                    await consumer.send_json(frame)
+        return (time.process_time() - start) / len(frames) * 1e6
+
+    async def run_serialize_once(self, consumers, frames):
+        """The ticker encodes once, subscribers forward the payload"""
+        start = time.process_time()
+        for frame in frames:
+            event = {'type': 'game_frame', **protocol.encode_frame(frame)}
+            for consumer in consumers:
+                await consumer.game_frame(event)
+        return (time.process_time() - start) / len(frames) * 1e6
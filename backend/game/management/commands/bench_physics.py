@@ -0,0 +1,48 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.engine import MatchEngine
+from game.models import default_game_state
+from game.physics_batch import BatchPhysics
+
+
+class Command(BaseCommand):
+    help = 'Measure per-tick CPU of scalar vs batch physics as the number of matches grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--matches', type=int, nargs='+', default=[10, 100, 500, 1000])
+        parser.add_argument('--ticks', type=int, default=600)
+
+    def handle(self, *args, **options):
+        # Keep score logging out of the measurement
+        logging.getLogger('game').setLevel(logging.ERROR)
+        ticks = options['ticks']
+
+        self.stdout.write(f"{'matches':>8} {'scalar us/tick':>16} {'batch us/tick':>15} {'speedup':>8}")
+        for count in options['matches']:
+            scalar = self.run_scalar(self.make_engines(count), ticks)
+            batch = self.run_batch(self.make_engines(count), ticks)
+            self.stdout.write(f"{count:>8} {scalar:>16.1f} {batch:>15.1f} {scalar / batch:>7.1f}x")
+
+    def make_engines(self, count):
+        return [MatchEngine(game_id, default_game_state(), 1, 2, checkpoint_interval=0)
+                for game_id in range(count)]
+
+    def run_scalar(self, engines, ticks):
+        start = time.perf_counter()
+        for _ in range(ticks):
+            for engine in engines:
+                if engine.winner is None:
+                    engine.step()
+        return (time.perf_counter() - start) / ticks * 1e6
+
+    def run_batch(self, engines, ticks):
+        physics = BatchPhysics()
+        for engine in engines:
+            physics.add(engine)
+        start = time.perf_counter()
+        for _ in range(ticks):
+            physics.step()
+        return (time.perf_counter() - start) / ticks * 1e6
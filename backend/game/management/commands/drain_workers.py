@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime
+
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from game.hosting import live_hosts
+from game.store import redis_enabled
+
+
+class Command(BaseCommand):
+    help = 'List match hosting workers, or drain some so their matches migrate to the others'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channels', nargs='*', help='Channel names of the workers to drain')
+        parser.add_argument('--list', action='store_true', help='Only list the live workers')
+
+    def handle(self, *args, **options):
+        if not redis_enabled():
+            raise CommandError('Workers only register with each other when GAME_REDIS_URL is set')
+        asyncio.run(self.run(options['channels'], options['list']))
+
+    async def run(self, channels, list_only):
+        hosts = await live_hosts()
+        if list_only or not channels:
+            for channel, info in sorted(hosts.items()):
+                seen = datetime.fromtimestamp(info['seen']).strftime('%H:%M:%S')
+                state = 'draining' if info['draining'] else 'active'
+                self.stdout.write(f"{channel}  {info['matches']:>4} matches  {state}  seen {seen}")
+            return
+
+        channel_layer = get_channel_layer()
+        for channel in channels:
+            if channel not in hosts:
+                self.stderr.write(f"{channel} is not a live worker, skipped")
+                continue
+            await channel_layer.send(channel, {'type': 'host.drain'})
+            self.stdout.write(self.style.SUCCESS(f"Drain requested for {channel}"))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game.models import Game, PlayerRating
+from game.ratings import DEFAULT_RATING, rate
+
+
+class Command(BaseCommand):
+    help = 'Recompute every PlayerRating from the history of finished games'
+
+    def handle(self, *args, **options):
+        ratings = {}
+        games = Game.objects.filter(
+            status='ended', player2__isnull=False
+        ).order_by('updated_at').values_list(
+            'player1_id', 'player2_id', 'winner_id', 'score_player1', 'score_player2', 'game_state'
+        )
+
+        count = 0
+        for player1_id, player2_id, winner_id, score1, score2, game_state in games.iterator():
+            if winner_id is None:
+                # Older rows only have the scores
+                score = (game_state or {}).get('score', {})
+                score1 = score.get('player1', score1)
+                score2 = score.get('player2', score2)
+                if score1 == score2:
+                    continue
+                winner_id = player1_id if score1 > score2 else player2_id
+
+            r1, g1 = ratings.get(player1_id, (DEFAULT_RATING, 0))
+            r2, g2 = ratings.get(player2_id, (DEFAULT_RATING, 0))
+            r1, r2 = rate(r1, g1, r2, g2, winner_id == player1_id)
+            ratings[player1_id] = (r1, g1 + 1)
+            ratings[player2_id] = (r2, g2 + 1)
+            count += 1
+
+        with transaction.atomic():
+            PlayerRating.objects.all().delete()
+            PlayerRating.objects.bulk_create([
+                PlayerRating(user_id=user_id, rating=rating, games_played=games_played)
+                for user_id, (rating, games_played) in ratings.items()
+            ])
+
+        self.stdout.write(self.style.SUCCESS(f"Rated {len(ratings)} players from {count} games"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from game.replay import Replay
+
+
+class Command(BaseCommand):
+    help = 'Re-simulate a match replay and check every recorded keyframe is reproduced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_ids', type=int, nargs='+')
+
+    def handle(self, *args, **options):
+        failed = False
+        for game_id in options['game_ids']:
+            replay = Replay.load(game_id)
+            if replay is None:
+                self.stderr.write(f"Game {game_id}: no replay")
+                failed = True
+                continue
+
+            # Every keyframe must match a re-simulation from the one before it
+            mismatches = 0
+            for (start, _), (tick, game_state) in zip(replay.keyframes, replay.keyframes[1:]):
+                engine = replay.engine_at(start)
+                while engine.tick < tick:
+                    replay.step(engine)
+                if engine.snapshot() != game_state:
+                    mismatches += 1
+                    self.stderr.write(f"Game {game_id}: diverged before tick {tick}")
+
+            self.stdout.write(
+                f"Game {game_id}: ticks {replay.start_tick}-{replay.last_tick}, "
+                f"{len(replay.keyframes)} keyframes, "
+                f"{sum(len(inputs) for inputs in replay.inputs.values())} inputs, "
+                f"{mismatches} mismatches"
+            )
+            failed = failed or mismatches > 0
+        if failed:
+            raise CommandError('Some replays could not be verified')
@@ -0,0 +1,276 @@
+"""Casual and ranked matchmaking queues.
+
+A user waits in at most one of the two queues: joining one leaves the
+other. Every queued user also has a last-seen time, refreshed by the
+searching connection every SEARCH_REFRESH seconds. An opponent not seen
+for GAME_MATCHMAKING_TTL, such as one left behind by a worker that
+died, is dropped from the queue instead of being paired.
+"""
+import bisect
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .store import get_redis, redis_enabled
+
+QUEUE_KEY = 'matchmaking:queue'
+MEMBERS_KEY = 'matchmaking:members'
+RATED_KEY = 'matchmaking:rated'
+SEEN_KEY = 'matchmaking:seen'
+
+SEARCH_REFRESH = 5.0  # Seconds between refreshes of a queued player's last-seen time
+
+# Pop the oldest live waiting player, or queue the caller when nobody waits.
+# Runs atomically inside Redis so concurrent joins can never pair twice.
+PAIR_SCRIPT = """
+local user = ARGV[1]
+if redis.call('zrem', KEYS[3], user) == 1 then
+    redis.call('zrem', KEYS[4], user)
+end
+if redis.call('sismember', KEYS[2], user) == 1 then
+    redis.call('zadd', KEYS[4], ARGV[2], user)
+    return false
+end
+while true do
+    local opponent = redis.call('lpop', KEYS[1])
+    if not opponent then
+        break
+    end
+    redis.call('srem', KEYS[2], opponent)
+    local seen = redis.call('zscore', KEYS[4], opponent)
+    redis.call('zrem', KEYS[4], opponent)
+    if seen and tonumber(seen) >= tonumber(ARGV[3]) then
+        return opponent
+    end
+end
+redis.call('rpush', KEYS[1], user)
+redis.call('sadd', KEYS[2], user)
+redis.call('zadd', KEYS[4], ARGV[2], user)
+return false
+"""
+
+CANCEL_SCRIPT = """
+if redis.call('srem', KEYS[2], ARGV[1]) == 1 then
+    redis.call('lrem', KEYS[1], 0, ARGV[1])
+    redis.call('zrem', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def search_cutoff():
+    """Last-seen time below which a queued player is considered gone"""
+    return time.time() - settings.GAME_MATCHMAKING_TTL
+
+
+class RedisMatchmakingQueue:
+    """First-come pairing shared by every worker"""
+
+    async def pair(self, user_id):
+        """Return the id of the player to pair ``user_id`` with, or None if queued"""
+        opponent = await get_redis().eval(
+            PAIR_SCRIPT, 4, QUEUE_KEY, MEMBERS_KEY, RATED_KEY, SEEN_KEY, user_id, time.time(), search_cutoff()
+        )
+        return int(opponent) if opponent else None
+
+    async def cancel(self, user_id):
+        return bool(await get_redis().eval(CANCEL_SCRIPT, 3, QUEUE_KEY, MEMBERS_KEY, SEEN_KEY, user_id))
+
+    async def touch(self, user_id):
+        """Refresh the last-seen time of ``user_id`` while it is queued"""
+        await get_redis().zadd(SEEN_KEY, {user_id: time.time()}, xx=True)
+
+    async def is_queued(self, user_id):
+        return bool(await get_redis().sismember(MEMBERS_KEY, user_id))
+
+    async def size(self):
+        return await get_redis().scard(MEMBERS_KEY)
+
+
+class InMemoryMatchmakingQueue:
+    """Same semantics as RedisMatchmakingQueue, scoped to this process (dev and tests).
+
+    Methods never await, so each call is atomic on the event loop.
+    """
+
+    def __init__(self):
+        self.waiting = OrderedDict()  # user id -> last seen
+
+    async def pair(self, user_id):
+        await _local_rated_queue.cancel(user_id)
+        if user_id in self.waiting:
+            self.waiting[user_id] = time.time()
+            return None
+        cutoff = search_cutoff()
+        while self.waiting:
+            opponent, seen = self.waiting.popitem(last=False)
+            if seen >= cutoff:
+                return opponent
+        self.waiting[user_id] = time.time()
+        return None
+
+    async def cancel(self, user_id):
+        return self.waiting.pop(user_id, None) is not None
+
+    async def touch(self, user_id):
+        if user_id in self.waiting:
+            self.waiting[user_id] = time.time()
+
+    async def is_queued(self, user_id):
+        return user_id in self.waiting
+
+    async def size(self):
+        return len(self.waiting)
+
+
+# Take the closest-rated live waiting player inside the window, or queue
+# the caller. A retry only runs while the caller is still queued: an
+# opponent may have paired with them since. Two bounded range reads on the sorted set per candidate, so
+# O(log n) unless gone players have to be dropped first.
+RATED_PAIR_SCRIPT = """
+local user = ARGV[1]
+local rating = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+if ARGV[6] == '1' and not redis.call('zscore', KEYS[1], user) then
+    return false
+end
+if redis.call('srem', KEYS[3], user) == 1 then
+    redis.call('lrem', KEYS[2], 0, user)
+end
+while true do
+    local above = redis.call('zrangebyscore', KEYS[1], rating, rating + window, 'WITHSCORES', 'LIMIT', 0, 2)
+    local below = redis.call('zrevrangebyscore', KEYS[1], rating, rating - window, 'WITHSCORES', 'LIMIT', 0, 2)
+    local best, best_gap
+    for _, candidates in ipairs({above, below}) do
+        for i = 1, #candidates, 2 do
+            if candidates[i] ~= user then
+                local gap = math.abs(tonumber(candidates[i + 1]) - rating)
+                if not best or gap < best_gap then
+                    best, best_gap = candidates[i], gap
+                end
+                break
+            end
+        end
+    end
+    if not best then
+        break
+    end
+    local seen = redis.call('zscore', KEYS[4], best)
+    redis.call('zrem', KEYS[1], best)
+    redis.call('zrem', KEYS[4], best)
+    if seen and tonumber(seen) >= tonumber(ARGV[5]) then
+        redis.call('zrem', KEYS[1], user)
+        redis.call('zrem', KEYS[4], user)
+        return best
+    end
+end
+redis.call('zadd', KEYS[1], rating, user)
+redis.call('zadd', KEYS[4], ARGV[4], user)
+return false
+"""
+
+
+def rating_window(waited):
+    """Accepted rating gap after waiting ``waited`` seconds"""
+    return min(
+        settings.GAME_RATING_WINDOW + settings.GAME_RATING_WINDOW_GROWTH * waited,
+        settings.GAME_RATING_WINDOW_MAX
+    )
+
+
+class RedisRatedQueue:
+    """Skill-based pairing over a rating-sorted set shared by every worker"""
+
+    async def pair(self, user_id, rating, window, retry=False):
+        """Return the closest-rated opponent within ``window``, or None if queued.
+
+        With ``retry``, a caller no longer queued is left out and gets None.
+        """
+        opponent = await get_redis().eval(
+            RATED_PAIR_SCRIPT, 4, RATED_KEY, QUEUE_KEY, MEMBERS_KEY, SEEN_KEY,
+            user_id, rating, window, time.time(), search_cutoff(), int(retry)
+        )
+        return int(opponent) if opponent else None
+
+    async def cancel(self, user_id):
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.zrem(RATED_KEY, user_id)
+        pipe.zrem(SEEN_KEY, user_id)
+        removed, _ = await pipe.execute()
+        return bool(removed)
+
+    async def touch(self, user_id):
+        """Refresh the last-seen time of ``user_id`` while it is queued"""
+        await get_redis().zadd(SEEN_KEY, {user_id: time.time()}, xx=True)
+
+    async def is_queued(self, user_id):
+        return await get_redis().zscore(RATED_KEY, user_id) is not None
+
+    async def size(self):
+        return await get_redis().zcard(RATED_KEY)
+
+
+class InMemoryRatedQueue:
+    """Same semantics as RedisRatedQueue, scoped to this process (dev and tests)"""
+
+    def __init__(self):
+        self.entries = []  # Sorted (rating, user_id)
+        self.ratings = {}
+        self.seen = {}
+
+    async def pair(self, user_id, rating, window, retry=False):
+        if retry and user_id not in self.ratings:
+            return None
+        await _local_queue.cancel(user_id)
+        await self.cancel(user_id)
+        cutoff = search_cutoff()
+        while True:
+            index = bisect.bisect_left(self.entries, (rating, user_id))
+            candidates = self.entries[max(index - 1, 0):index + 1]
+            best = min(candidates, key=lambda entry: abs(entry[0] - rating), default=None)
+            if best is None or abs(best[0] - rating) > window:
+                break
+            seen = self.seen.get(best[1], 0)
+            await self.cancel(best[1])
+            if seen >= cutoff:
+                return best[1]
+        bisect.insort(self.entries, (rating, user_id))
+        self.ratings[user_id] = rating
+        self.seen[user_id] = time.time()
+        return None
+
+    async def cancel(self, user_id):
+        rating = self.ratings.pop(user_id, None)
+        if rating is None:
+            return False
+        self.entries.remove((rating, user_id))
+        del self.seen[user_id]
+        return True
+
+    async def touch(self, user_id):
+        if user_id in self.seen:
+            self.seen[user_id] = time.time()
+
+    async def is_queued(self, user_id):
+        return user_id in self.ratings
+
+    async def size(self):
+        return len(self.ratings)
+
+
+_local_queue = InMemoryMatchmakingQueue()
+_local_rated_queue = InMemoryRatedQueue()
+
+
+def get_queue():
+    if redis_enabled():
+        return RedisMatchmakingQueue()
+    return _local_queue
+
+
+def get_rated_queue():
+    if redis_enabled():
+        return RedisRatedQueue()
+    return _local_rated_queue
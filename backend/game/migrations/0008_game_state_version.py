@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_game_duration_game_duration_formatted_game_winner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='state_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_playerrating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='state_tick',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
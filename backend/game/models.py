@@ -3,6 +3,19 @@ from django.conf import settings
 
 # Create your models here.
 
+def default_game_state():
+    return {
+        'ball': {'x': 400, 'y': 300, 'dx': 5, 'dy': 5, 'radius': 10},
+        'paddles': {
+            'player1': {'x': 50, 'y': 250, 'width': 20, 'height': 100},
+            'player2': {'x': 730, 'y': 250, 'width': 20, 'height': 100}
+        },
+        'canvas': {'width': 800, 'height': 600},
+        'score': {'player1': 0, 'player2': 0},
+        'paddle_speed': 25
+    }
+
+
 class Game(models.Model):
     GAME_STATUS_CHOICES = (
         ('waiting', 'Waiting for Player'),
@@ -33,6 +46,8 @@ class Game(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     game_state = models.JSONField(default=dict)
+    state_version = models.PositiveIntegerField(default=0)  # Bumped by every game_state write
+    state_tick = models.PositiveIntegerField(default=0)  # Engine tick game_state was taken at
     winner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         related_name='games_won',
@@ -51,16 +66,7 @@ class Game(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.game_state and self._state.adding:  # Only set default state when creating new game
-            self.game_state = {
-                'ball': {'x': 400, 'y': 300, 'dx': 5, 'dy': 5, 'radius': 10},
-                'paddles': {
-                    'player1': {'x': 50, 'y': 250, 'width': 20, 'height': 100},
-                    'player2': {'x': 730, 'y': 250, 'width': 20, 'height': 100}
-                },
-                'canvas': {'width': 800, 'height': 600},
-                'score': {'player1': 0, 'player2': 0},
-                'paddle_speed': 25
-            }
+            self.game_state = default_game_state()
         super().save(*args, **kwargs)
 
     def is_player_in_game(self, user):
@@ -94,3 +100,17 @@ class Game(models.Model):
                 'score': self.score_player2
             } if self.player2 else None
         }
+
+
+class PlayerRating(models.Model):
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name='rating',
+        on_delete=models.CASCADE
+    )
+    rating = models.FloatField(default=1500)
+    games_played = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.rating:.0f}"
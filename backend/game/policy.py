@@ -0,0 +1,94 @@
+"""When match frames go out, independently of the physics rate.
+
+The engine steps at GAME_TICK_RATE, but a delta is only worth sending
+when a client could not predict it: the ball is about to reach a paddle
+or a paddle moved. In open play clients extrapolate the ball between
+deltas, so sends are spaced out, further right after a point and for
+spectators. When the worker's event loop falls behind every interval is
+stretched until it catches up, so an overloaded worker sends less
+instead of missing ticks.
+"""
+import asyncio
+import time
+import weakref
+
+from django.conf import settings
+
+NEAR_PADDLE_TICKS = 15  # Reference ticks (1/60 s) before a paddle contact counted as near
+BACKOFF_STEP_INTERVAL = 0.5  # Seconds between two changes of the lag backoff
+
+
+def ticks_to_paddle(state):
+    """Reference ticks before the ball reaches the paddle face it heads to"""
+    ball = state.ball
+    if ball.dx < 0:
+        face = state.player1.x + state.player1.width + ball.radius
+    elif ball.dx > 0:
+        face = state.player2.x - ball.radius
+    else:
+        return float('inf')
+    return max(0.0, (face - ball.x) / ball.dx)
+
+
+class SendPolicy:
+    """Send interval of a match stream for its current situation"""
+
+    def __init__(self):
+        self.rate = settings.GAME_SEND_RATE
+        self.near_rate = settings.GAME_SEND_RATE_NEAR_PADDLE
+        self.idle_rate = settings.GAME_SEND_RATE_IDLE
+        self.spectator_rate = settings.GAME_SEND_RATE_SPECTATOR
+        self.idle_after_point = settings.GAME_IDLE_AFTER_POINT
+
+    def interval(self, state, paddles_moved, since_point, spectator=False, backoff=1.0):
+        """Seconds to wait after the previous send of the stream"""
+        if ticks_to_paddle(state) <= NEAR_PADDLE_TICKS:
+            rate = self.near_rate
+        elif since_point < self.idle_after_point and not paddles_moved:
+            rate = self.idle_rate
+        else:
+            rate = self.rate
+        if spectator:
+            rate = min(rate, self.spectator_rate)
+        return backoff / rate
+
+
+class LagMonitor:
+    """Backoff factor for send intervals, from the event loop's wakeup lag.
+
+    Doubles while the lag stays above GAME_LAG_THRESHOLD_MS and halves
+    back once it is under half of it, at most once per
+    BACKOFF_STEP_INTERVAL.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.threshold_ms = settings.GAME_LAG_THRESHOLD_MS
+        self.max_backoff = settings.GAME_MAX_SEND_BACKOFF
+        self.clock = clock
+        self.backoff = 1.0
+        self.changed_at = clock()
+
+    def update(self, lag_ms):
+        now = self.clock()
+        if now - self.changed_at < BACKOFF_STEP_INTERVAL:
+            return self.backoff
+        if lag_ms > self.threshold_ms and self.backoff < self.max_backoff:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            self.changed_at = now
+        elif lag_ms < self.threshold_ms / 2 and self.backoff > 1.0:
+            self.backoff = max(self.backoff / 2, 1.0)
+            self.changed_at = now
+        return self.backoff
+
+
+# The lag belongs to the event loop, shared by all of its matches
+_monitors = weakref.WeakKeyDictionary()
+
+
+def get_lag_monitor():
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        monitor = LagMonitor()
+        _monitors[loop] = monitor
+    return monitor
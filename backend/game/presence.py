@@ -0,0 +1,64 @@
+"""Which players of a match currently have a connection to it.
+
+Each game connection of a player is an entry refreshed by its consumer
+every PRESENCE_REFRESH seconds and removed on disconnect. Entries of a
+worker that died stop being refreshed and expire after
+GAME_PRESENCE_TTL, so its players count as away like any disconnect.
+"""
+import time
+
+from django.conf import settings
+
+from .store import get_redis, redis_enabled
+
+PRESENCE_REFRESH = 5.0  # Seconds between refreshes of a connection's entry
+
+# game id -> {member: last seen}, used without Redis
+_local = {}
+
+
+def presence_key(game_id):
+    return f"game:{game_id}:presence"
+
+
+def member(user_id, channel_name):
+    return f"{user_id}:{channel_name}"
+
+
+async def touch(game_id, user_id, channel_name):
+    """Record that ``user_id`` is connected to ``game_id`` through ``channel_name``"""
+    now = time.time()
+    if not redis_enabled():
+        _local.setdefault(int(game_id), {})[member(user_id, channel_name)] = now
+        return
+    key = presence_key(game_id)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.zadd(key, {member(user_id, channel_name): now})
+    pipe.expire(key, int(settings.GAME_PRESENCE_TTL * 2))
+    await pipe.execute()
+
+
+async def leave(game_id, user_id, channel_name):
+    if not redis_enabled():
+        _local.get(int(game_id), {}).pop(member(user_id, channel_name), None)
+        return
+    await get_redis().zrem(presence_key(game_id), member(user_id, channel_name))
+
+
+async def present_players(game_id):
+    """Ids of the users with a live connection to ``game_id``"""
+    cutoff = time.time() - settings.GAME_PRESENCE_TTL
+    if not redis_enabled():
+        entries = _local.get(int(game_id), {})
+        members = [name for name, seen in entries.items() if seen >= cutoff]
+    else:
+        raw = await get_redis().zrangebyscore(presence_key(game_id), cutoff, '+inf')
+        members = [name.decode() for name in raw]
+    return {int(name.split(':', 1)[0]) for name in members}
+
+
+async def clear(game_id):
+    if not redis_enabled():
+        _local.pop(int(game_id), None)
+        return
+    await get_redis().delete(presence_key(game_id))
@@ -0,0 +1,122 @@
+"""Wire format of the game channel.
+
+Clients get a full ``game_keyframe`` when they join, after every point
+and whenever they send ``resync``. Between keyframes every tick is a
+``game_delta`` carrying only what moves: the ball and the paddles whose
+y changed since the previous broadcast. Values in deltas are absolute,
+so a dropped delta is simply superseded by the next one.
+
+``paddle_move`` inputs carry a client ``seq``. Every frame echoes the
+last processed seq of each player in ``acks`` so clients can drop the
+inputs the server has applied and replay the rest on top of it.
+
+Clients that offer the ``pong.bin.v2`` subprotocol at connect get deltas
+as fixed-layout little-endian frames and may send paddle input the same
+way. Keyframes and control messages stay JSON text in both modes.
+"""
+import json
+import struct
+
+from .state import PLAYERS
+
+PROTOCOL_VERSION = 2
+
+BINARY_SUBPROTOCOL = 'pong.bin.v2'
+
+# Opcodes, first byte of every binary frame
+OP_PADDLE_MOVE = 1
+OP_DELTA = 2
+
+# opcode, direction (0 up, 1 down), seq
+INPUT_FRAME = struct.Struct('<BBI')
+# opcode, tick, ball x/y/dx/dy, changed paddles bitmask, player1 y, player2 y,
+# player1 ack, player2 ack
+DELTA_FRAME = struct.Struct('<BIffffBffII')
+
+DIRECTIONS = ('up', 'down')
+MAX_SEQ = 0xFFFFFFFF  # Input seqs are echoed as uint32 acks
+PADDLE_BITS = (('player1', 1), ('player2', 2))
+
+
+def valid_seq(seq):
+    """True if ``seq`` fits the ack fields of a delta frame"""
+    return isinstance(seq, int) and not isinstance(seq, bool) and 0 <= seq <= MAX_SEQ
+
+
+def keyframe(game_state, tick, acks):
+    return {
+        'type': 'game_keyframe',
+        'v': PROTOCOL_VERSION,
+        'tick': tick,
+        'acks': acks,
+        'game_state': game_state
+    }
+
+
+def delta(state, tick, sent_paddles, acks):
+    """Build a delta of a MatchState against ``sent_paddles`` and update it in place.
+
+    ``sent_paddles`` maps paddle key to the last y sent to clients.
+    """
+    ball = state.ball
+    frame = {
+        'type': 'game_delta',
+        'v': PROTOCOL_VERSION,
+        'tick': tick,
+        'acks': acks,
+        'ball': [round(ball.x, 2), round(ball.y, 2), round(ball.dx, 3), round(ball.dy, 3)]
+    }
+
+    paddles = {}
+    for paddle_key in PLAYERS:
+        y = state.paddle(paddle_key).y
+        if sent_paddles.get(paddle_key) != y:
+            paddles[paddle_key] = y
+            sent_paddles[paddle_key] = y
+    if paddles:
+        frame['paddles'] = paddles
+    return frame
+
+
+def paddle_positions(state):
+    return {paddle_key: state.paddle(paddle_key).y for paddle_key in PLAYERS}
+
+
+def encode_delta(frame):
+    """Pack a ``game_delta`` dict into a DELTA_FRAME"""
+    paddles = frame.get('paddles', {})
+    mask = 0
+    for paddle_key, bit in PADDLE_BITS:
+        if paddle_key in paddles:
+            mask |= bit
+    return DELTA_FRAME.pack(
+        OP_DELTA,
+        frame['tick'],
+        *frame['ball'],
+        mask,
+        paddles.get('player1', 0),
+        paddles.get('player2', 0),
+        *frame['acks']
+    )
+
+
+def decode_input(data):
+    """Unpack a binary client frame into the equivalent JSON message, or None"""
+    if len(data) != INPUT_FRAME.size or data[0] != OP_PADDLE_MOVE:
+        return None
+    _, direction, seq = INPUT_FRAME.unpack(data)
+    if direction >= len(DIRECTIONS):
+        return None
+    return {'type': 'paddle_move', 'direction': DIRECTIONS[direction], 'seq': seq}
+
+
+def encode_frame(frame):
+    """Encode a frame once for every subscriber.
+
+    Returns the ``text`` payload for JSON clients and, for deltas, the
+    ``bytes`` payload for binary clients. Consumers forward these as-is.
+    """
+    return {
+        'text': json.dumps(frame, separators=(',', ':')),
+        'bytes': encode_delta(frame) if frame['type'] == 'game_delta' else None
+    }
@@ -0,0 +1,60 @@
+import logging
+
+from django.db import transaction
+
+from .models import PlayerRating
+
+logger = logging.getLogger('game')
+
+DEFAULT_RATING = 1500
+PROVISIONAL_GAMES = 20  # Ratings move faster until a player has this many games
+K_PROVISIONAL = 40
+K_ESTABLISHED = 20
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def k_factor(games_played):
+    return K_PROVISIONAL if games_played < PROVISIONAL_GAMES else K_ESTABLISHED
+
+
+def rate(rating1, games1, rating2, games2, player1_won):
+    """Elo update for one game, returns the new ``(rating1, rating2)``"""
+    score1 = 1.0 if player1_won else 0.0
+    expected1 = expected_score(rating1, rating2)
+    new1 = rating1 + k_factor(games1) * (score1 - expected1)
+    new2 = rating2 + k_factor(games2) * ((1 - score1) - (1 - expected1))
+    return new1, new2
+
+
+def get_rating(user_id):
+    rating = PlayerRating.objects.filter(user_id=user_id).values_list('rating', flat=True).first()
+    return DEFAULT_RATING if rating is None else rating
+
+
+def apply_result(player1_id, player2_id, winner_id):
+    """Update both players' ratings from a finished game.
+
+    Incremental: only the two rows involved are read and written, under a
+    row lock so concurrent results for the same player are applied in turn.
+    """
+    with transaction.atomic():
+        for user_id in (player1_id, player2_id):
+            PlayerRating.objects.get_or_create(user_id=user_id)
+        ratings = {
+            r.user_id: r for r in PlayerRating.objects.select_for_update().filter(
+                user_id__in=(player1_id, player2_id)
+            )
+        }
+        r1, r2 = ratings[player1_id], ratings[player2_id]
+        r1.rating, r2.rating = rate(r1.rating, r1.games_played, r2.rating, r2.games_played,
+                                    winner_id == player1_id)
+        r1.games_played += 1
+        r2.games_played += 1
+        r1.save(update_fields=['rating', 'games_played', 'updated_at'])
+        r2.save(update_fields=['rating', 'games_played', 'updated_at'])
+
+    logger.info(f"Ratings updated: {player1_id}={r1.rating:.0f}, {player2_id}={r2.rating:.0f}")
+    return r1.rating, r2.rating
@@ -0,0 +1,212 @@
+"""Match replays: a compact input log re-simulated on playback.
+
+The engine is deterministic, so a replay only stores what it cannot
+recompute: the paddle inputs with the step that applied them, plus
+keyframes (at the start, on points, at checkpoints and on migration)
+that playback seeks to and re-simulates from. Records are buffered by
+the ticker and appended to ``GAME_REPLAY_DIR/<game id>.replay`` in
+batches, at checkpoints and when the match stops.
+
+File layout, little-endian: a header (magic, format version, tick rate,
+ball speed cap, bounce angle) followed by records starting with a type
+byte. An input is 6 bytes; a keyframe carries zlib-compressed
+``Game.game_state`` JSON. A truncated last record is ignored, so a
+replay can be read while its match is still being recorded.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import struct
+import zlib
+
+from django.conf import settings
+
+from .engine import MatchEngine
+from .state import PLAYERS
+from . import collision
+
+logger = logging.getLogger('game')
+
+MAGIC = b'PRPL'
+FORMAT_VERSION = 1
+
+# magic, version, tick rate, ball max speed, bounce angle in degrees
+HEADER = struct.Struct('<4sBHdd')
+
+RECORD_KEYFRAME = 1
+RECORD_INPUT = 2
+RECORD_END = 3
+
+# type, tick, compressed length; followed by the compressed state JSON
+KEYFRAME_RECORD = struct.Struct('<BII')
+# type, tick, paddle index << 1 | direction (0 up, 1 down)
+INPUT_RECORD = struct.Struct('<BIB')
+# type, tick, winner index
+END_RECORD = struct.Struct('<BIB')
+
+DIRECTIONS = ('up', 'down')
+
+
+def replay_path(game_id):
+    return os.path.join(settings.GAME_REPLAY_DIR, f"{game_id}.replay")
+
+
+def replays_enabled():
+    return bool(settings.GAME_REPLAY_DIR)
+
+
+class ReplayRecorder:
+    """Buffers the records of one match and appends them in batches"""
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.path = replay_path(game_id)
+        self.header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, settings.GAME_TICK_RATE,
+            settings.GAME_BALL_MAX_SPEED, settings.GAME_BOUNCE_ANGLE
+        )
+        self.buffer = bytearray()
+        self.keyframe_tick = None
+
+    def input(self, tick, paddle_key, direction):
+        bits = PLAYERS.index(paddle_key) << 1 | DIRECTIONS.index(direction)
+        self.buffer += INPUT_RECORD.pack(RECORD_INPUT, tick, bits)
+
+    def keyframe(self, tick, game_state):
+        if tick == self.keyframe_tick:
+            return
+        self.keyframe_tick = tick
+        data = zlib.compress(json.dumps(game_state, separators=(',', ':')).encode())
+        self.buffer += KEYFRAME_RECORD.pack(RECORD_KEYFRAME, tick, len(data))
+        self.buffer += data
+
+    def end(self, tick, winner):
+        self.buffer += END_RECORD.pack(RECORD_END, tick, PLAYERS.index(winner))
+
+    async def flush(self):
+        """Append the buffered records to the replay file"""
+        if not self.buffer:
+            return
+        data, self.buffer = bytes(self.buffer), bytearray()
+        try:
+            await asyncio.to_thread(self._append, data)
+        except Exception as e:
+            logger.error(f"[GAME {self.game_id}] Error writing replay: {str(e)}", exc_info=True)
+
+    def _append(self, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            # The first host of the match starts the file
+            if f.tell() == 0:
+                f.write(self.header)
+            f.write(data)
+
+
+class Replay:
+    """A parsed replay file, re-simulated on demand"""
+
+    def __init__(self, game_id, tick_rate, max_speed, bounce_angle):
+        self.game_id = game_id
+        self.tick_rate = tick_rate
+        self.max_speed = max_speed
+        self.bounce_angle = bounce_angle
+        self.keyframes = []  # (tick, game_state) in tick order
+        self.inputs = {}  # tick -> [(paddle_key, direction), ...]
+        self.end_tick = None
+        self.winner = None
+
+    @classmethod
+    def load(cls, game_id):
+        """Read the replay of ``game_id``, None if there is none"""
+        try:
+            with open(replay_path(game_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return cls.parse(game_id, data)
+
+    @classmethod
+    def parse(cls, game_id, data):
+        if len(data) < HEADER.size:
+            return None
+        magic, version, tick_rate, max_speed, bounce_angle = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not a version {FORMAT_VERSION} replay")
+        replay = cls(game_id, tick_rate, max_speed, bounce_angle)
+
+        offset = HEADER.size
+        while offset < len(data):
+            kind = data[offset]
+            if kind == RECORD_INPUT:
+                if offset + INPUT_RECORD.size > len(data):
+                    break
+                _, tick, bits = INPUT_RECORD.unpack_from(data, offset)
+                offset += INPUT_RECORD.size
+                replay.inputs.setdefault(tick, []).append((PLAYERS[bits >> 1], DIRECTIONS[bits & 1]))
+            elif kind == RECORD_KEYFRAME:
+                if offset + KEYFRAME_RECORD.size > len(data):
+                    break
+                _, tick, length = KEYFRAME_RECORD.unpack_from(data, offset)
+                start = offset + KEYFRAME_RECORD.size
+                if start + length > len(data):
+                    break
+                game_state = json.loads(zlib.decompress(data[start:start + length]))
+                offset = start + length
+                replay.add_keyframe(tick, game_state)
+            elif kind == RECORD_END:
+                if offset + END_RECORD.size > len(data):
+                    break
+                _, replay.end_tick, winner = END_RECORD.unpack_from(data, offset)
+                replay.winner = PLAYERS[winner]
+                offset += END_RECORD.size
+            else:
+                raise ValueError(f"Unknown replay record type {kind} at offset {offset}")
+        if not replay.keyframes:
+            return None
+        return replay
+
+    def add_keyframe(self, tick, game_state):
+        # A migrated match starts over from the snapshot its new host resumed,
+        # dropping what its old host recorded past it
+        index = bisect.bisect_left(self.keyframe_ticks(), tick)
+        self.keyframes[index:] = [(tick, game_state)]
+        for later in [input_tick for input_tick in self.inputs if input_tick > tick]:
+            del self.inputs[later]
+
+    def keyframe_ticks(self):
+        return [tick for tick, _ in self.keyframes]
+
+    @property
+    def start_tick(self):
+        return self.keyframes[0][0]
+
+    @property
+    def last_tick(self):
+        """Last tick that can be played back"""
+        if self.end_tick is not None:
+            return self.end_tick
+        last = max(self.inputs, default=0)
+        return max(last, self.keyframes[-1][0])
+
+    def engine_at(self, tick):
+        """An engine positioned at ``tick``, from the keyframe before it"""
+        tick = max(self.start_tick, min(tick, self.last_tick))
+        index = bisect.bisect_right(self.keyframe_ticks(), tick) - 1
+        keyframe_tick, game_state = self.keyframes[index]
+        engine = MatchEngine(self.game_id, game_state, None, None, checkpoint_interval=0)
+        engine.tick = keyframe_tick
+        engine.dt = collision.step_length(self.tick_rate)
+        engine.max_speed = self.max_speed
+        engine.bounce_angle = math.radians(self.bounce_angle)
+        while engine.tick < tick:
+            self.step(engine)
+        return engine
+
+    def step(self, engine):
+        """Replay one engine step with the inputs recorded for it"""
+        for paddle_key, direction in self.inputs.get(engine.tick + 1, ()):
+            engine.queue_input(paddle_key, direction, 0)
+        return engine.step()
@@ -3,4 +3,10 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/game/$', consumers.GameConsumer.as_asgi()),
+    re_path(r'ws/game/(?P<game_id>\d+)/replay/$', consumers.ReplayConsumer.as_asgi()),
+]
+
+# Routed outside AuthMiddlewareStack: no session or user lookup per viewer
+spectator_websocket_urlpatterns = [
+    re_path(r'ws/game/(?P<game_id>\d+)/watch/$', consumers.SpectatorConsumer.as_asgi()),
 ]
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+
+class TickStats:
+    """Per-match scheduling counters: wakeup jitter, overruns and dropped steps"""
+
+    def __init__(self):
+        self.ticks = 0
+        self.steps = 0
+        self.overruns = 0
+        self.catchup_steps = 0
+        self.dropped_steps = 0
+        self.jitter_max_ms = 0.0
+        self.jitter_avg_ms = 0.0
+
+    def record(self, lateness, steps, dropped):
+        jitter_ms = max(lateness, 0.0) * 1000
+        self.ticks += 1
+        self.steps += steps
+        self.jitter_max_ms = max(self.jitter_max_ms, jitter_ms)
+        # Exponential moving average so the value follows the current load
+        self.jitter_avg_ms += (jitter_ms - self.jitter_avg_ms) * 0.05
+        if steps > 1 or dropped:
+            self.overruns += 1
+            self.catchup_steps += steps - 1
+            self.dropped_steps += dropped
+
+    def as_dict(self):
+        return {
+            'ticks': self.ticks,
+            'steps': self.steps,
+            'overruns': self.overruns,
+            'catchup_steps': self.catchup_steps,
+            'dropped_steps': self.dropped_steps,
+            'jitter_max_ms': round(self.jitter_max_ms, 3),
+            'jitter_avg_ms': round(self.jitter_avg_ms, 3),
+        }
+
+
+class FixedTimestep:
+    """Absolute-deadline scheduler for a fixed simulation step.
+
+    Deadlines are ``start + n * interval`` so time spent doing I/O between
+    two waits does not accumulate into drift. When the loop wakes up late
+    ``wait()`` asks for several catch-up steps, but never more than
+    ``max_substeps``: past that the backlog is dropped so an overloaded
+    worker slows the match down instead of spiralling.
+    """
+
+    def __init__(self, interval, max_substeps=5, clock=time.monotonic):
+        self.interval = interval
+        self.max_substeps = max_substeps
+        self.clock = clock
+        self.next_deadline = clock() + interval
+        self.stats = TickStats()
+
+    async def wait(self):
+        """Sleep until the next deadline, return how many steps are due"""
+        delay = self.next_deadline - self.clock()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        now = self.clock()
+        lateness = now - self.next_deadline
+        steps = 1 + max(int(lateness // self.interval), 0)
+        dropped = 0
+        if steps > self.max_substeps:
+            dropped = steps - self.max_substeps
+            steps = self.max_substeps
+            # Clamp the lag: restart the schedule from now
+            self.next_deadline = now + self.interval
+        else:
+            self.next_deadline += steps * self.interval
+
+        self.stats.record(lateness, steps, dropped)
+        return steps
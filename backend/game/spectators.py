@@ -0,0 +1,156 @@
+"""Read-only fan-out of match streams to spectators.
+
+The match ticker publishes each spectator frame once, whatever the
+audience: to a Redis pub/sub channel per match, or in-process without
+Redis. Every worker with viewers of a match subscribes to it once, keeps
+the current state of the match in a ``MatchFeed`` built from those
+frames and forwards them to its local viewers. A new viewer gets a
+keyframe from the feed, or from the live state slots when the worker has
+no feed yet, so spectators never read the database and never reach the
+ticker.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+from . import protocol, state_store
+from .store import get_redis, redis_enabled
+
+logger = logging.getLogger('game')
+
+# In-process subscribers by game id, used without Redis
+_local_queues = {}
+
+
+def watch_channel(game_id):
+    return f"game:{game_id}:watch"
+
+
+async def publish(game_id, text):
+    """Send an encoded frame to every worker watching ``game_id``"""
+    if not redis_enabled():
+        for queue in _local_queues.get(game_id, ()):
+            queue.put_nowait(text)
+        return
+    await get_redis().publish(watch_channel(game_id), text)
+
+
+class MatchFeed:
+    """One worker's subscription to one match, shared by all of its viewers"""
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.viewers = set()
+        self.game_state = None
+        self.tick = 0
+        self.acks = [0, 0]
+        self.task = None
+
+    def keyframe(self):
+        return protocol.keyframe(self.game_state, self.tick, self.acks)
+
+    def apply(self, frame):
+        """Keep the match state current from the frames going past"""
+        if frame['type'] == 'game_keyframe':
+            self.game_state = frame['game_state']
+        elif frame['type'] == 'game_delta' and self.game_state:
+            ball = self.game_state['ball']
+            ball['x'], ball['y'], ball['dx'], ball['dy'] = frame['ball']
+            for paddle_key, y in frame.get('paddles', {}).items():
+                self.game_state['paddles'][paddle_key]['y'] = y
+        else:
+            return
+        self.tick = frame['tick']
+        self.acks = frame['acks']
+
+    async def run(self):
+        try:
+            async for text in self.frames():
+                frame = json.loads(text)
+                self.apply(frame)
+                for viewer in list(self.viewers):
+                    await viewer.send(text_data=text)
+                if frame['type'] == 'game_end':
+                    return
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"[GAME {self.game_id}] Error in spectator feed: {str(e)}", exc_info=True)
+
+    async def frames(self):
+        if not redis_enabled():
+            queue = asyncio.Queue()
+            _local_queues.setdefault(self.game_id, set()).add(queue)
+            try:
+                while True:
+                    yield await queue.get()
+            finally:
+                _local_queues[self.game_id].discard(queue)
+            return
+
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(watch_channel(self.game_id))
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield message['data'].decode()
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+
+class SpectatorHub:
+    """The match feeds of this worker, opened with their first viewer"""
+
+    def __init__(self):
+        self.feeds = {}
+
+    async def watch(self, game_id, viewer):
+        """Subscribe ``viewer`` and return the keyframe to start from, or None"""
+        feed = self.feeds.get(game_id)
+        if feed is None or feed.task.done():
+            feed = MatchFeed(game_id)
+            self.feeds[game_id] = feed
+            feed.task = asyncio.create_task(feed.run())
+        if feed.game_state is None:
+            # First viewer here: start from the live state slots
+            live = await state_store.read_state(game_id)
+            if live is not None and feed.game_state is None:
+                feed.game_state, feed.tick, feed.acks = live
+        if feed.game_state is None:
+            if not feed.viewers:
+                feed.task.cancel()
+                del self.feeds[game_id]
+            return None
+
+        # No await between the two: the viewer gets every frame after this keyframe
+        feed.viewers.add(viewer)
+        return feed.keyframe()
+
+    def keyframe(self, game_id):
+        feed = self.feeds.get(game_id)
+        if feed is None or feed.game_state is None:
+            return None
+        return feed.keyframe()
+
+    def unwatch(self, game_id, viewer):
+        feed = self.feeds.get(game_id)
+        if feed is None:
+            return
+        feed.viewers.discard(viewer)
+        if not feed.viewers:
+            feed.task.cancel()
+            del self.feeds[game_id]
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = SpectatorHub()
+        _hubs[loop] = hub
+    return hub
@@ -0,0 +1,96 @@
+"""Typed in-memory state of a running match.
+
+``Game.game_state`` keeps its nested JSON layout for persistence and
+keyframes; engines convert it once with ``MatchState.from_json`` and
+back with ``to_json``. Between the two every tick mutates plain slotted
+attributes, so no dicts are created or copied per tick and nothing is
+shared with the JSON it came from.
+"""
+
+PLAYERS = ('player1', 'player2')
+
+
+class Ball:
+    __slots__ = ('x', 'y', 'dx', 'dy', 'radius')
+
+    def __init__(self, x, y, dx, dy, radius):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.radius = radius
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['x'], data['y'], data['dx'], data['dy'], data['radius'])
+
+    def to_json(self):
+        return {'x': self.x, 'y': self.y, 'dx': self.dx, 'dy': self.dy, 'radius': self.radius}
+
+
+class Paddle:
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['x'], data['y'], data['width'], data['height'])
+
+    def to_json(self):
+        return {'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height}
+
+
+class MatchState:
+    __slots__ = ('ball', 'player1', 'player2', 'canvas_width', 'canvas_height', 'score', 'paddle_speed')
+
+    def __init__(self, ball, player1, player2, canvas_width, canvas_height, score, paddle_speed):
+        self.ball = ball
+        self.player1 = player1
+        self.player2 = player2
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.score = score  # [player1, player2]
+        self.paddle_speed = paddle_speed
+
+    @classmethod
+    def from_json(cls, data):
+        """Build from the ``Game.game_state`` layout"""
+        return cls(
+            Ball.from_json(data['ball']),
+            Paddle.from_json(data['paddles']['player1']),
+            Paddle.from_json(data['paddles']['player2']),
+            data['canvas']['width'],
+            data['canvas']['height'],
+            [data['score']['player1'], data['score']['player2']],
+            data['paddle_speed']
+        )
+
+    def to_json(self):
+        """Fresh ``Game.game_state`` layout dicts, safe to keep or mutate"""
+        return {
+            'ball': self.ball.to_json(),
+            'paddles': {
+                'player1': self.player1.to_json(),
+                'player2': self.player2.to_json()
+            },
+            'canvas': {'width': self.canvas_width, 'height': self.canvas_height},
+            'score': self.score_json(),
+            'paddle_speed': self.paddle_speed
+        }
+
+    def paddle(self, paddle_key):
+        return self.player1 if paddle_key == 'player1' else self.player2
+
+    def add_point(self, paddle_key):
+        """Score a point for ``paddle_key``, returns its new score"""
+        index = PLAYERS.index(paddle_key)
+        self.score[index] += 1
+        return self.score[index]
+
+    def score_json(self):
+        return {'player1': self.score[0], 'player2': self.score[1]}
@@ -0,0 +1,101 @@
+import json
+
+from .state import PLAYERS
+from .store import get_redis, redis_enabled
+
+STATE_TTL = 3600  # Seconds a finished or abandoned match state lingers
+TICK_STATS_TTL = 60  # Seconds tick stats outlive the last ticker that published them
+
+_local = {}
+_local_stats = {}
+
+
+def state_key(game_id):
+    return f"game:{game_id}:state"
+
+
+def tick_stats_key(game_id):
+    return f"game:{game_id}:tick_stats"
+
+
+async def write_fields(game_id, fields, refresh_ttl=False):
+    """Set independent slots of the live match state.
+
+    Each slot (``ball``, ``paddle:player1``, ``paddle:player2``, ``tick``,
+    ``acks``, ``base``) is written on its own, so writers of different
+    slots never overwrite each other's data.
+    """
+    encoded = {name: json.dumps(value, separators=(',', ':')) for name, value in fields.items()}
+    if not redis_enabled():
+        _local.setdefault(game_id, {}).update(encoded)
+        return
+    key = state_key(game_id)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hset(key, mapping=encoded)
+    if refresh_ttl:
+        pipe.expire(key, STATE_TTL)
+    await pipe.execute()
+
+
+async def read_state(game_id):
+    """Rebuild ``(game_state, tick, acks)`` from the slots, or None"""
+    if redis_enabled():
+        raw = await get_redis().hgetall(state_key(game_id))
+        fields = {name.decode(): json.loads(value) for name, value in raw.items()}
+    else:
+        fields = {name: json.loads(value) for name, value in _local.get(game_id, {}).items()}
+    if 'base' not in fields:
+        return None
+
+    game_state = fields['base']
+    if 'ball' in fields:
+        game_state['ball'].update(fields['ball'])
+    for paddle_key, paddle in game_state['paddles'].items():
+        if f'paddle:{paddle_key}' in fields:
+            paddle['y'] = fields[f'paddle:{paddle_key}']
+    return game_state, fields.get('tick', 0), fields.get('acks', [0, 0])
+
+
+async def write_tick_stats(game_id, stats):
+    """Publish the scheduling counters of a match for any worker to read"""
+    encoded = json.dumps(stats, separators=(',', ':'))
+    if not redis_enabled():
+        _local_stats[game_id] = encoded
+        return
+    await get_redis().set(tick_stats_key(game_id), encoded, ex=TICK_STATS_TTL)
+
+
+async def read_tick_stats(game_id):
+    if redis_enabled():
+        encoded = await get_redis().get(tick_stats_key(game_id))
+    else:
+        encoded = _local_stats.get(game_id)
+    return json.loads(encoded) if encoded is not None else None
+
+
+async def clear(game_id):
+    if not redis_enabled():
+        _local.pop(game_id, None)
+        _local_stats.pop(game_id, None)
+        return
+    await get_redis().delete(state_key(game_id), tick_stats_key(game_id))
+
+
+def keyframe_fields(state, tick, acks):
+    """Every slot of a MatchState"""
+    fields = delta_fields(state, tick, acks, PLAYERS)
+    fields['base'] = state.to_json()
+    return fields
+
+
+def delta_fields(state, tick, acks, changed_paddles):
+    """The slots of a MatchState that change between keyframes"""
+    ball = state.ball
+    fields = {
+        'ball': {'x': ball.x, 'y': ball.y, 'dx': ball.dx, 'dy': ball.dy},
+        'tick': tick,
+        'acks': acks,
+    }
+    for paddle_key in changed_paddles:
+        fields[f'paddle:{paddle_key}'] = state.paddle(paddle_key).y
+    return fields
@@ -0,0 +1,23 @@
+import asyncio
+import weakref
+
+import redis.asyncio as aioredis
+from django.conf import settings
+
+# One client per event loop, dropped with the loop
+_clients = weakref.WeakKeyDictionary()
+
+
+def redis_enabled():
+    """True when match coordination goes through Redis instead of process memory"""
+    return bool(settings.GAME_REDIS_URL)
+
+
+def get_redis():
+    """Return the asyncio Redis client bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = aioredis.from_url(settings.GAME_REDIS_URL)
+        _clients[loop] = client
+    return client
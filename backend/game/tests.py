@@ -0,0 +1,575 @@
+import asyncio
+import json
+import math
+import random
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from . import checkpoint, collision, hosting, matchmaking, presence, protocol, state_store
+from .cache import find_active_game, load_summary, write_through
+from .consumers import GameConsumer, ReplayConsumer, SpectatorConsumer
+from .engine import MatchEngine, stop_engine
+from .models import Game, default_game_state
+from .physics_batch import BatchPhysics
+from .replay import Replay, ReplayRecorder
+from .state import MatchState
+from .ticker import BatchTicker, MatchTicker
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_delta_round_trip(self):
+        engine = MatchEngine(1, default_game_state(), 10, 20)
+        sent = {}
+        frame = protocol.delta(engine.state, 42, sent, [7, protocol.MAX_SEQ])
+        op, tick, x, y, dx, dy, mask, player1, player2, ack1, ack2 = protocol.DELTA_FRAME.unpack(
+            protocol.encode_delta(frame)
+        )
+        self.assertEqual((op, tick, mask), (protocol.OP_DELTA, 42, 3))
+        for decoded, sent_value in zip((x, y, dx, dy), frame['ball']):
+            self.assertAlmostEqual(decoded, sent_value, places=3)
+        self.assertEqual((player1, player2), (sent['player1'], sent['player2']))
+        self.assertEqual((ack1, ack2), (7, protocol.MAX_SEQ))
+
+        # Unchanged paddles are left out of the next delta and its mask
+        frame = protocol.delta(engine.state, 43, sent, [7, 7])
+        self.assertNotIn('paddles', frame)
+        self.assertEqual(protocol.DELTA_FRAME.unpack(protocol.encode_delta(frame))[6], 0)
+
+    def test_input_round_trip(self):
+        for index, direction in enumerate(protocol.DIRECTIONS):
+            data = protocol.INPUT_FRAME.pack(protocol.OP_PADDLE_MOVE, index, protocol.MAX_SEQ)
+            self.assertEqual(
+                protocol.decode_input(data),
+                {'type': 'paddle_move', 'direction': direction, 'seq': protocol.MAX_SEQ}
+            )
+
+    def test_malformed_input_is_rejected(self):
+        valid = protocol.INPUT_FRAME.pack(protocol.OP_PADDLE_MOVE, 0, 1)
+        for data in (
+            b'',
+            valid[:-1],
+            valid + b'\x00',
+            protocol.INPUT_FRAME.pack(protocol.OP_DELTA, 0, 1),
+            protocol.INPUT_FRAME.pack(protocol.OP_PADDLE_MOVE, len(protocol.DIRECTIONS), 1),
+        ):
+            self.assertIsNone(protocol.decode_input(data), data)
+
+    def test_encode_frame(self):
+        keyframe = protocol.keyframe(default_game_state(), 0, [0, 0])
+        encoded = protocol.encode_frame(keyframe)
+        self.assertEqual(json.loads(encoded['text']), keyframe)
+        self.assertIsNone(encoded['bytes'])
+
+
+class CollisionTests(SimpleTestCase):
+    MAX_ANGLE = math.radians(50)
+
+    def state(self, x, y, dx, dy):
+        state = MatchState.from_json(default_game_state())
+        ball = state.ball
+        ball.x, ball.y, ball.dx, ball.dy = x, y, dx, dy
+        return state
+
+    def test_fast_ball_does_not_tunnel_through_a_paddle(self):
+        # Paddle 2 spans x 730-750, so its face for the ball centre is at 720.
+        # 200 px in one step ends well past the paddle without a sweep.
+        state = self.state(700, 300, 200, 0)
+        collision.sweep(state, 1.0, 1000, self.MAX_ANGLE)
+        self.assertLess(state.ball.dx, 0)
+        self.assertLess(state.ball.x, 720)
+        self.assertAlmostEqual(state.ball.x, 720 - (200 - 20) * collision.PADDLE_SPEEDUP)
+
+    def test_paddle_hits_speed_up_to_the_cap(self):
+        state = self.state(715, 300, 10, 0)
+        collision.sweep(state, 1.0, 20, self.MAX_ANGLE)
+        self.assertAlmostEqual(state.ball.dx, -10 * collision.PADDLE_SPEEDUP)
+
+        state = self.state(710, 300, 19, 0)
+        collision.sweep(state, 1.0, 20, self.MAX_ANGLE)
+        self.assertAlmostEqual(math.hypot(state.ball.dx, state.ball.dy), 20)
+
+    def test_bounce_angle_grows_towards_the_paddle_ends(self):
+        # Paddle 2 spans y 250-350: the centre returns the ball straight
+        state = self.state(715, 300, 10, 0)
+        collision.sweep(state, 1.0, 100, self.MAX_ANGLE)
+        self.assertAlmostEqual(state.ball.dy, 0)
+
+        # An end sends it back at the full angle, away from the centre
+        state = self.state(715, 350, 10, 0)
+        collision.sweep(state, 1.0, 100, self.MAX_ANGLE)
+        self.assertAlmostEqual(math.atan2(state.ball.dy, -state.ball.dx), self.MAX_ANGLE)
+
+        # A ball passing beside the paddle is not returned
+        state = self.state(715, 380, 10, 0)
+        collision.sweep(state, 1.0, 100, self.MAX_ANGLE)
+        self.assertEqual((state.ball.x, state.ball.dx), (725, 10))
+
+
+class InputSeqTests(SimpleTestCase):
+    """Input seqs are echoed as uint32 acks, so anything else must be rejected"""
+
+    OUT_OF_RANGE = [-1, protocol.MAX_SEQ + 1, 2 ** 40, True, 1.5, '3', None]
+
+    def make_engine(self):
+        return MatchEngine(1, default_game_state(), 10, 20)
+
+    def test_valid_seq(self):
+        for seq in (0, 1, protocol.MAX_SEQ):
+            self.assertTrue(protocol.valid_seq(seq))
+        for seq in self.OUT_OF_RANGE:
+            self.assertFalse(protocol.valid_seq(seq), seq)
+
+    def test_engine_rejects_out_of_range_seq(self):
+        engine = self.make_engine()
+        for seq in self.OUT_OF_RANGE:
+            self.assertFalse(engine.queue_input('player1', 'up', seq), seq)
+        engine.apply_inputs()
+        self.assertEqual(engine.acks(), [0, 0])
+
+    def test_max_seq_ack_still_encodes(self):
+        engine = self.make_engine()
+        self.assertTrue(engine.queue_input('player2', 'down', protocol.MAX_SEQ))
+        engine.apply_inputs()
+        frame = protocol.delta(engine.state, engine.tick, {}, engine.acks())
+        self.assertIn('bytes', protocol.encode_frame(frame))
+
+    async def test_consumer_drops_out_of_range_seq(self):
+        consumer = GameConsumer()
+        consumer.scope = {'user': SimpleNamespace(is_anonymous=False)}
+        consumer.user = SimpleNamespace(id=10, username='player')
+        consumer.send_json = mock.AsyncMock()
+        with mock.patch.object(consumer, 'paddle_move', new=mock.AsyncMock()) as paddle_move:
+            for seq in [-1, protocol.MAX_SEQ + 1, True]:
+                await consumer.receive(text_data=json.dumps(
+                    {'type': 'paddle_move', 'game_id': 1, 'direction': 'up', 'seq': seq}
+                ))
+            paddle_move.assert_not_called()
+            await consumer.receive(text_data=json.dumps(
+                {'type': 'paddle_move', 'game_id': 1, 'direction': 'up', 'seq': 7}
+            ))
+            paddle_move.assert_awaited_once_with('up', 1, 7)
+
+
+class MatchmakingQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.queue = matchmaking.InMemoryMatchmakingQueue()
+        self.rated = matchmaking.InMemoryRatedQueue()
+        patcher = mock.patch.multiple(matchmaking, _local_queue=self.queue, _local_rated_queue=self.rated)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_a_user_waits_in_one_queue_at_most(self):
+        self.assertIsNone(await self.rated.pair(1, 1000, 50))
+        self.assertIsNone(await self.queue.pair(1))
+        self.assertFalse(await self.rated.is_queued(1))
+        self.assertIsNone(await self.rated.pair(1, 1000, 50))
+        self.assertFalse(await self.queue.is_queued(1))
+        # Only one of the two searches can still pair the user
+        self.assertIsNone(await self.queue.pair(2))
+        self.assertEqual(await self.rated.pair(3, 1000, 50), 1)
+
+    async def test_retry_of_a_player_paired_meanwhile_does_not_pair_again(self):
+        self.assertIsNone(await self.rated.pair(2, 1000, 50))
+        self.assertIsNone(await self.rated.pair(3, 1300, 50))
+        self.assertEqual(await self.rated.pair(1, 1000, 50), 2)
+        # Player 2's widened search wakes up after it was taken
+        self.assertIsNone(await self.rated.pair(2, 1000, 400, retry=True))
+        self.assertFalse(await self.rated.is_queued(2))
+        self.assertTrue(await self.rated.is_queued(3))
+        # A player still waiting keeps retrying as before
+        self.assertIsNone(await self.rated.pair(3, 1300, 50, retry=True))
+        self.assertEqual(await self.rated.pair(4, 1310, 50), 3)
+
+    async def test_players_not_seen_lately_are_dropped(self):
+        stale = time.time() - settings.GAME_MATCHMAKING_TTL - 1
+        await self.queue.pair(1)
+        self.queue.waiting[1] = stale
+        self.assertIsNone(await self.queue.pair(2))
+        self.assertFalse(await self.queue.is_queued(1))
+        await self.queue.touch(2)
+        self.assertEqual(await self.queue.pair(3), 2)
+
+        await self.rated.pair(4, 1000, 50)
+        self.rated.seen[4] = stale
+        self.assertIsNone(await self.rated.pair(5, 1000, 50))
+        self.assertFalse(await self.rated.is_queued(4))
+        self.assertEqual(await self.rated.pair(6, 1020, 50), 5)
+
+
+class BatchPhysicsTests(SimpleTestCase):
+    """BatchPhysics must step every match exactly like MatchEngine.step"""
+
+    def game_state(self, index):
+        game_state = default_game_state()
+        ball = game_state['ball']
+        ball['dx'] = (-1) ** index * (5 + index)
+        ball['dy'] = (-1) ** (index // 2) * (3 + index / 2)
+        ball['y'] += 17 * index
+        return game_state
+
+    def step_scalar(self, engine, steps):
+        results = []
+        for _ in range(steps):
+            result = engine.step()
+            if result is not None:
+                results.append(result)
+            if result == 'end':
+                break
+        return results
+
+    def test_batch_matches_scalar_engine_tick_for_tick(self):
+        rng = random.Random(12)
+        pairs = [
+            (MatchEngine(index, self.game_state(index), 1, 2), MatchEngine(index, self.game_state(index), 1, 2))
+            for index in range(6)
+        ]
+        physics = BatchPhysics(capacity=4)
+        for batched, _ in pairs:
+            physics.add(batched)
+
+        for wakeup in range(3000):
+            for batched, scalar in pairs:
+                if rng.random() < 0.3:
+                    paddle_key, direction = rng.choice(['player1', 'player2']), rng.choice(['up', 'down'])
+                    batched.queue_input(paddle_key, direction, wakeup + 1)
+                    scalar.queue_input(paddle_key, direction, wakeup + 1)
+            steps = rng.choice([1, 1, 1, 2, 3])
+            events = physics.step(steps)
+            for batched, scalar in pairs:
+                if scalar.winner is not None:
+                    continue
+                self.assertEqual(events.get(batched.game_id, []), self.step_scalar(scalar, steps))
+                self.assertEqual(batched.tick, scalar.tick)
+                self.assertEqual(batched.snapshot(), scalar.snapshot())
+                self.assertEqual(batched.acks(), scalar.acks())
+
+        # Long enough for points and finished matches on both paths
+        self.assertTrue(any(scalar.winner for _, scalar in pairs))
+        self.assertTrue(any(scalar.state.score != [0, 0] for _, scalar in pairs))
+
+
+class MatchHostOwnersTests(SimpleTestCase):
+    async def test_owner_cache_only_keeps_live_entries(self):
+        host = hosting.MatchHost()
+        host.channel_layer = mock.AsyncMock()
+        holders = {1: 'worker-a', 2: None, 3: 'worker-b'}
+        with mock.patch.object(hosting, 'lease_holder', new=mock.AsyncMock(
+            side_effect=lambda key: holders[int(key.split(':')[1])]
+        )):
+            for game_id in holders:
+                await host.find_owner(game_id)
+        # A match without a host is not remembered
+        self.assertEqual(set(host.owners), {1, 3})
+
+        with mock.patch.object(host, 'pick_target', new=mock.AsyncMock(return_value='worker-c')):
+            self.assertTrue(await host.hand_off(3))
+        self.assertEqual(set(host.owners), {1})
+
+        host.owners[1] = ('worker-a', time.monotonic() - 1)
+        host.prune_owners()
+        self.assertEqual(host.owners, {})
+
+
+class BatchTickerTests(SimpleTestCase):
+    async def test_step_failure_ends_every_attached_match(self):
+        batch = BatchTicker()
+        batch.physics = mock.Mock()
+        batch.physics.step.side_effect = RuntimeError('step failed')
+        tickers = [SimpleNamespace(game_id=game_id, engine=None, stopping=False) for game_id in (1, 2)]
+
+        outcomes = await asyncio.wait_for(
+            asyncio.gather(*(batch.attach(ticker) for ticker in tickers), return_exceptions=True), timeout=5
+        )
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, RuntimeError)
+        self.assertEqual(batch.tickers, {})
+
+
+class SpectatorRoutingTests(TransactionTestCase):
+    """Viewers must not cost the session and user lookups of AuthMiddleware"""
+
+    async def connect(self, path):
+        from transcendence.asgi import application
+        communicator = WebsocketCommunicator(application, path, headers=[(b'origin', b'http://localhost')])
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_watch_route_skips_user_lookup(self):
+        with mock.patch('channels.auth.get_user', new=mock.AsyncMock(return_value=AnonymousUser())) as get_user:
+            communicator, connected = await self.connect('/ws/game/1/watch/')
+            self.assertTrue(connected)
+            response = await communicator.receive_json_from()
+            self.assertEqual(response['type'], 'error')
+            await communicator.disconnect()
+            get_user.assert_not_awaited()
+
+            communicator, connected = await self.connect('/ws/chat/')
+            self.assertFalse(connected)
+            get_user.assert_awaited_once()
+
+
+class GameCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.player1 = User.objects.create_user(username='player1', password='pass')
+        self.player2 = User.objects.create_user(username='player2', password='pass')
+
+    def test_no_game_is_cached_until_a_game_starts_and_after_it_ends(self):
+        self.assertIsNone(find_active_game(self.player1.id))
+        with self.assertNumQueries(0):
+            self.assertIsNone(find_active_game(self.player1.id))
+
+        game = Game.objects.create(player1=self.player1, player2=self.player2, status='active')
+        write_through(game)
+        with self.assertNumQueries(0):
+            self.assertEqual(find_active_game(self.player1.id)['id'], game.id)
+
+        Game.objects.filter(id=game.id).update(status='ended')
+        load_summary(game.id)
+        with self.assertNumQueries(0):
+            self.assertIsNone(find_active_game(self.player2.id))
+
+    def test_status_and_detail_are_routed(self):
+        game = Game.objects.create(player1=self.player1, player2=self.player2, status='active')
+        write_through(game)
+        self.client.force_login(self.player1)
+        response = self.client.get('/api/game/status/')
+        self.assertEqual(response.json()['game_id'], str(game.id))
+        response = self.client.get(f'/api/game/{game.id}/')
+        self.assertEqual(response.json()['status'], 'active')
+        self.assertEqual(self.client.get(f'/api/game/{game.id + 1}/').status_code, 404)
+
+        self.client.force_login(self.player2)
+        Game.objects.filter(id=game.id).update(status='ended')
+        load_summary(game.id)
+        self.assertEqual(self.client.get('/api/game/status/').json(), {'status': 'no_game'})
+
+
+class CheckpointTests(TransactionTestCase):
+    async def create_games(self, count):
+        User = get_user_model()
+        player1 = await User.objects.acreate(username='player1')
+        player2 = await User.objects.acreate(username='player2')
+        return [
+            await Game.objects.acreate(player1=player1, player2=player2, status='active')
+            for _ in range(count)
+        ]
+
+    def snapshot(self, x):
+        game_state = default_game_state()
+        game_state['ball']['x'] = x
+        return game_state
+
+    async def test_snapshots_are_written_in_one_batch(self):
+        games = await self.create_games(3)
+        writer = checkpoint.CheckpointWriter()
+        for game in games:
+            writer.track(game.id, game.state_version)
+
+        with mock.patch.object(checkpoint, 'write_checkpoints', wraps=checkpoint.write_checkpoints) as write:
+            futures = [writer.save(game.id, self.snapshot(100 + i), 10 + i) for i, game in enumerate(games)]
+            # Queued twice before the flush: only the latest snapshot is written
+            futures.append(writer.save(games[0].id, self.snapshot(500), 20))
+            self.assertEqual(await asyncio.gather(*futures), [True] * 4)
+        write.assert_awaited_once()
+
+        rows = {row.id: row async for row in Game.objects.filter(id__in=[game.id for game in games])}
+        self.assertEqual(rows[games[0].id].game_state['ball']['x'], 500)
+        self.assertEqual(rows[games[0].id].state_tick, 20)
+        self.assertEqual(rows[games[2].id].game_state['ball']['x'], 102)
+        self.assertEqual({row.state_version for row in rows.values()}, {1})
+        self.assertEqual(writer.versions, {game.id: 1 for game in games})
+
+    async def test_stale_writer_loses_the_row(self):
+        game, other = await self.create_games(2)
+        writer = checkpoint.CheckpointWriter()
+        writer.track(game.id, 0)
+        writer.track(other.id, 0)
+        # Another host took the match over and checkpointed it
+        await Game.objects.filter(id=game.id).aupdate(state_version=1, state_tick=99)
+
+        self.assertEqual(
+            await asyncio.gather(writer.save(game.id, self.snapshot(1), 5), writer.save(other.id, self.snapshot(1), 5)),
+            [False, True]
+        )
+        self.assertFalse(writer.owns(game.id))
+        self.assertFalse(await writer.save(game.id, self.snapshot(2), 6))
+        row = await Game.objects.aget(id=game.id)
+        self.assertEqual((row.state_version, row.state_tick), (1, 99))
+
+    async def test_deleted_row_is_lost(self):
+        game, = await self.create_games(1)
+        writer = checkpoint.CheckpointWriter()
+        writer.track(game.id, 0)
+        await Game.objects.filter(id=game.id).adelete()
+        self.assertFalse(await writer.save(game.id, self.snapshot(1), 5))
+        self.assertFalse(writer.owns(game.id))
+
+        # A released game is forgotten once its last snapshot is handled
+        writer.release(game.id)
+        self.assertNotIn(game.id, writer.versions)
+
+
+class PresenceTests(TransactionTestCase):
+    """A match pauses while a player is away, forfeits them after the grace period"""
+
+    async def start_match(self):
+        User = get_user_model()
+        self.player1 = await User.objects.acreate(username='player1')
+        self.player2 = await User.objects.acreate(username='player2')
+        game = await Game.objects.acreate(player1=self.player1, player2=self.player2, status='active')
+        self.ticker = MatchTicker(game, mock.AsyncMock())
+        self.ticker.broadcast = mock.AsyncMock()
+        self.addCleanup(stop_engine, game.id)
+
+    async def set_present(self, *players):
+        await presence.clear(self.ticker.game_id)
+        for player in players:
+            await presence.touch(self.ticker.game_id, player.id, f'channel-{player.id}')
+        # Check on the next call, not after PRESENCE_CHECK_INTERVAL
+        self.ticker.last_presence = float('-inf')
+
+    def sent(self):
+        return [call.args[0]['type'] for call in self.ticker.broadcast.call_args_list]
+
+    async def test_pause_then_resume_with_a_keyframe_after_the_countdown(self):
+        await self.start_match()
+        ticker = self.ticker
+        await self.set_present(self.player1)
+        self.assertTrue(await ticker.check_players())
+        self.assertTrue(ticker.engine.paused)
+        self.assertEqual(ticker.broadcast.call_args.args[0]['away'], ['player2'])
+
+        await self.set_present(self.player1, self.player2)
+        self.assertTrue(await ticker.advance([]))
+        self.assertTrue(ticker.engine.paused)
+        self.assertEqual(self.sent(), ['game_paused', 'game_countdown'])
+
+        ticker.resume_at = time.monotonic() - 0.01
+        self.assertTrue(await ticker.advance([]))
+        self.assertFalse(ticker.engine.paused)
+        self.assertEqual(self.sent()[-1], 'game_keyframe')
+
+    async def test_forfeit_after_the_grace_period(self):
+        await self.start_match()
+        ticker = self.ticker
+        await self.set_present(self.player2)
+        with mock.patch.object(ticker, 'end_game', new=mock.AsyncMock()) as end_game:
+            self.assertTrue(await ticker.check_players())
+            ticker.away_since -= settings.GAME_FORFEIT_GRACE - 1
+            ticker.last_presence = float('-inf')
+            self.assertTrue(await ticker.check_players())
+            end_game.assert_not_awaited()
+
+            ticker.away_since -= 2
+            ticker.last_presence = float('-inf')
+            self.assertFalse(await ticker.check_players())
+            end_game.assert_awaited_once_with('player2', reason='forfeit')
+
+    async def test_game_end_stops_refreshing_presence(self):
+        consumer = GameConsumer()
+        consumer.send_json = mock.AsyncMock()
+        task = consumer.presence_task = asyncio.create_task(asyncio.sleep(60))
+        await consumer.game_end_message({'winner': 'player1', 'duration': '01:00', 'final_score': {}})
+        await asyncio.sleep(0)
+        self.assertTrue(task.cancelled())
+        self.assertIsNone(consumer.presence_task)
+
+
+class SpectatorEndTests(TransactionTestCase):
+    def setUp(self):
+        # Game ids are reused between these tests, their cached summaries must not be
+        cache.clear()
+
+    async def test_ended_match_is_not_served_to_new_viewers(self):
+        User = get_user_model()
+        player1 = await User.objects.acreate(username='player1')
+        player2 = await User.objects.acreate(username='player2')
+        game = await Game.objects.acreate(player1=player1, player2=player2, status='active')
+        ticker = MatchTicker(game, mock.AsyncMock())
+        self.addCleanup(stop_engine, game.id)
+        await ticker.broadcast_keyframe()
+        self.assertIsNotNone(await state_store.read_state(game.id))
+
+        await ticker.end_game('player1')
+        self.assertIsNone(await state_store.read_state(game.id))
+        communicator = WebsocketCommunicator(SpectatorConsumer.as_asgi(), f'/ws/game/{game.id}/watch/')
+        communicator.scope['url_route'] = {'kwargs': {'game_id': str(game.id)}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {'type': 'error', 'message': 'Game is not being played'})
+        await communicator.disconnect()
+
+
+class ReplayTests(SimpleTestCase):
+    def test_resume_drops_inputs_the_old_host_recorded_past_it(self):
+        old_host = ReplayRecorder(1)
+        old_host.keyframe(0, default_game_state())
+        old_host.input(5, 'player1', 'up')
+        old_host.input(20, 'player1', 'down')
+        old_host.input(30, 'player2', 'up')
+        # The new host resumes from the checkpoint at tick 10
+        new_host = ReplayRecorder(1)
+        new_host.keyframe(10, default_game_state())
+        new_host.input(12, 'player2', 'down')
+        new_host.input(20, 'player2', 'up')
+
+        replay = Replay.parse(1, old_host.header + bytes(old_host.buffer) + bytes(new_host.buffer))
+        self.assertEqual(replay.keyframe_ticks(), [0, 10])
+        self.assertEqual(replay.inputs, {
+            5: [('player1', 'up')],
+            12: [('player2', 'down')],
+            20: [('player2', 'up')],
+        })
+
+
+class ReplaySeekTests(SimpleTestCase):
+    async def test_non_finite_seek_is_ignored(self):
+        consumer = ReplayConsumer()
+        consumer.playback = mock.Mock()
+        consumer.paused = True
+        with mock.patch.object(consumer, 'seek', new=mock.AsyncMock()) as seek:
+            for tick in ('Infinity', '-Infinity', 'NaN', '1e999', '"x"', 'null'):
+                await consumer.receive(text_data=f'{{"type": "seek", "tick": {tick}}}')
+            seek.assert_not_awaited()
+            await consumer.receive(text_data='{"type": "seek", "tick": 30}')
+            seek.assert_awaited_once_with(30)
+        self.assertFalse(consumer.paused)
+
+
+class ReplayAccessTests(TransactionTestCase):
+    def setUp(self):
+        # Game ids are reused between these tests, their cached summaries must not be
+        cache.clear()
+
+    async def connect(self, game_id, user):
+        communicator = WebsocketCommunicator(ReplayConsumer.as_asgi(), f'/ws/game/{game_id}/replay/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'game_id': str(game_id)}}
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_replays_need_a_login_and_an_ended_game(self):
+        User = get_user_model()
+        player1 = await User.objects.acreate(username='player1')
+        player2 = await User.objects.acreate(username='player2')
+        game = await Game.objects.acreate(player1=player1, player2=player2, status='active')
+
+        _, connected = await self.connect(game.id, AnonymousUser())
+        self.assertFalse(connected)
+
+        communicator, connected = await self.connect(game.id, player1)
+        self.assertTrue(connected)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response['message'], 'Replay is available once the game has ended')
+        await communicator.disconnect()
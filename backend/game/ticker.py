@@ -0,0 +1,567 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from . import presence, protocol, spectators, state_store
+from .cache import invalidate, load_summary
+from .checkpoint import get_checkpoint_writer
+from .engine import start_engine, stop_engine
+from .lease import make_lease
+from .models import Game
+from .physics_batch import BatchPhysics
+from .policy import SendPolicy, get_lag_monitor
+from .ratings import apply_result
+from .replay import ReplayRecorder, replays_enabled
+from .scheduler import FixedTimestep
+from .state import PLAYERS
+
+logger = logging.getLogger('game')
+
+PRESENCE_CHECK_INTERVAL = 1.0  # Seconds between checks that both players are connected
+
+
+def owner_key(game_id):
+    return f"game:{game_id}:owner"
+
+
+@database_sync_to_async
+def get_active_game(game_id):
+    try:
+        return Game.objects.get(id=game_id, status='active')
+    except Game.DoesNotExist:
+        return None
+
+
+@database_sync_to_async
+def idle_active_games(before):
+    """Ids of active games whose row was last written before ``before``"""
+    return list(Game.objects.filter(status='active', updated_at__lt=before).values_list('id', flat=True))
+
+
+@database_sync_to_async
+def update_game_status(game_id, status, winner=None, duration=None, duration_formatted=None):
+    """Update game status and statistics in database"""
+    try:
+        update_fields = {
+            'status': status,
+            'updated_at': timezone.now()
+        }
+
+        if winner is not None:
+            update_fields['winner_id'] = winner
+
+        if duration is not None:
+            update_fields['duration'] = duration
+            update_fields['duration_formatted'] = duration_formatted
+
+        Game.objects.filter(id=game_id).update(**update_fields)
+        # Write the new status through to the cached summary
+        load_summary(game_id)
+    except Exception as e:
+        logger.error(f"Error updating game status: {str(e)}", exc_info=True)
+        invalidate(game_id)
+
+
+@database_sync_to_async
+def update_ratings(player1_id, player2_id, winner_id):
+    """Apply a finished game to both players' ratings"""
+    try:
+        apply_result(player1_id, player2_id, winner_id)
+    except Exception as e:
+        logger.error(f"Error updating ratings: {str(e)}", exc_info=True)
+
+
+class FrameStream:
+    """One audience of a match: what it was sent last and when.
+
+    Players get frames through the game channel group. Spectators get
+    them published once to the spectator feeds, however many watch.
+    """
+
+    def __init__(self, group_name=None, spectator=False):
+        self.group_name = group_name
+        self.spectator = spectator
+        self.sent_paddles = {}
+        self.last_sent = float('-inf')
+
+    def paddles_moved(self, state):
+        return any(state.paddle(paddle_key).y != self.sent_paddles.get(paddle_key) for paddle_key in PLAYERS)
+
+
+class MatchTicker:
+    """The single simulation loop of a match.
+
+    Exactly one ticker runs per game id across all workers: it must hold
+    the match lease before stepping the engine and stops as soon as it
+    fails to renew it. Consumers never simulate, they only receive the
+    ``game_frame`` events the ticker sends to the game group. With
+    GAME_BATCH_PHYSICS the stepping itself is shared with the other
+    matches of the process through BatchTicker.
+
+    The match pauses while a player has no connection to it and goes on
+    after a countdown once they are back. A player away for longer than
+    GAME_FORFEIT_GRACE forfeits.
+    """
+
+    def __init__(self, game, lease, resume=None):
+        self.game_id = game.id
+        self.group_name = f"game_{game.id}"
+        self.engine = start_engine(game)
+        self.lease = lease
+        self.channel_layer = get_channel_layer()
+        self.started_at = time.time()
+        # A checkpoint without a handover means the previous host died
+        self.recovered = not resume and game.state_version > 0
+        if resume:
+            # Migrated from another worker: continue from its last snapshot
+            self.engine.restore(resume['game_state'], resume['tick'], resume['acks'])
+            self.started_at = resume['started_at']
+        elif self.recovered:
+            # The engine starts from the last checkpoint of game_state
+            self.engine.tick = game.state_tick
+            self.started_at = game.created_at.timestamp()
+        self.recorder = ReplayRecorder(game.id) if replays_enabled() else None
+        self.engine.recorder = self.recorder
+        self.task = None
+        self.detached = None
+        self.stopping = False
+        self.handed_over = False
+        self.checkpoints = get_checkpoint_writer()
+        self.checkpoints.track(game.id, game.state_version)
+        self.last_renew = time.monotonic()
+        self.streams = [
+            FrameStream(self.group_name),
+            FrameStream(spectator=True),
+        ]
+        self.policy = SendPolicy()
+        self.lag_monitor = get_lag_monitor()
+        self.last_point = time.monotonic()
+        self.last_presence = time.monotonic()
+        self.away_since = None
+        self.resume_at = None
+        self.timestep = FixedTimestep(
+            1 / settings.GAME_TICK_RATE,
+            max_substeps=settings.GAME_MAX_CATCHUP_STEPS
+        )
+
+    async def run(self):
+        logger.info(f"[GAME {self.game_id}] Starting game loop")
+        try:
+            # Seed the state slots so any worker can serve keyframes from now on
+            await self.broadcast_keyframe()
+            if self.recovered:
+                logger.warning(f"[GAME {self.game_id}] Recovered match from its checkpoint at tick {self.engine.tick}")
+                self.set_paused(True)
+                await self.countdown()
+
+            if settings.GAME_BATCH_PHYSICS:
+                # Stepped together with every other match of this process
+                if not await get_batch_ticker().attach(self):
+                    return
+            else:
+                while not self.stopping:
+                    steps = await self.timestep.wait()
+                    if not await self.advance(self.step(steps)):
+                        return
+
+            # Stopped for a migration: leave a final snapshot for the next host
+            if await self.checkpoint():
+                await self.broadcast_keyframe()
+                self.handed_over = True
+
+        except Exception as e:
+            logger.error(f"[GAME {self.game_id}] Error in game loop: {str(e)}", exc_info=True)
+        finally:
+            stop_engine(self.game_id)
+            _tickers.pop(self.game_id, None)
+            if self.recorder is not None:
+                # Before the lease goes: the next host appends after these records
+                await self.recorder.flush()
+            self.checkpoints.release(self.game_id)
+            await self.lease.release()
+
+    def step(self, steps):
+        """Run up to ``steps`` engine steps, returns their results"""
+        if self.engine.paused:
+            return []
+        results = []
+        for _ in range(steps):
+            results.append(self.engine.step())
+            if results[-1] == 'end':
+                break
+        return results
+
+    async def advance(self, results):
+        """Persist and broadcast the steps of one wakeup, False once the ticker must stop"""
+        engine = self.engine
+        if not await self.keep_lease():
+            logger.warning(f"[GAME {self.game_id}] Lost match lease, stopping ticker")
+            return False
+
+        if 'end' in results:
+            logger.warning(f"{engine.winner} wins!")
+            # Save final state before ending
+            if await self.checkpoint():
+                await self.end_game(engine.winner)
+            return False
+
+        if not await self.check_players():
+            return False
+        if engine.paused:
+            await self.resume_when_due()
+            return True
+
+        # Persist on scoring and on the checkpoint interval only
+        scored = 'score' in results
+        if scored or engine.checkpoint_due():
+            # Queued for the next batch write, never waited for mid-match
+            if not await self.checkpoint(wait=False):
+                return False
+            engine.mark_checkpoint()
+
+        # At most one broadcast per wakeup, however many steps were simulated.
+        # Points change the score so clients get a fresh keyframe.
+        if scored:
+            self.last_point = time.monotonic()
+            await self.broadcast_keyframe()
+        else:
+            await self.broadcast_deltas()
+        return True
+
+    def set_paused(self, paused):
+        engine = self.engine
+        engine.paused = paused
+        if engine.batch is not None:
+            engine.batch.set_paused(self.game_id, paused)
+        if not paused:
+            # Whatever was pressed during the pause is stale
+            engine.drop_inputs()
+
+    async def countdown(self):
+        """Let the paused match go on after GAME_RESUME_COUNTDOWN seconds"""
+        self.resume_at = time.monotonic() + settings.GAME_RESUME_COUNTDOWN
+        await self.broadcast({'type': 'game_countdown', 'seconds': settings.GAME_RESUME_COUNTDOWN}, self.streams)
+
+    async def resume_when_due(self):
+        if self.resume_at is None or time.monotonic() < self.resume_at:
+            return
+        self.resume_at = None
+        self.set_paused(False)
+        await self.broadcast_keyframe()
+
+    async def check_players(self):
+        """Pause while a player is away, forfeit them after GAME_FORFEIT_GRACE.
+
+        Returns False once the match ended by forfeit.
+        """
+        now = time.monotonic()
+        if now - self.last_presence < PRESENCE_CHECK_INTERVAL:
+            return True
+        self.last_presence = now
+        present = await presence.present_players(self.game_id)
+        away = [paddle_key for paddle_key, user_id in self.engine.players.items() if user_id not in present]
+
+        if not away:
+            if self.away_since is not None:
+                # Everybody is back
+                self.away_since = None
+                await self.countdown()
+            return True
+
+        if self.away_since is None:
+            self.away_since = now
+            self.resume_at = None
+            self.set_paused(True)
+            await self.broadcast({
+                'type': 'game_paused',
+                'away': away,
+                'grace': settings.GAME_FORFEIT_GRACE
+            }, self.streams)
+            return True
+        if now - self.away_since < settings.GAME_FORFEIT_GRACE:
+            return True
+
+        # Nobody wins a match both players abandoned
+        winner = None if len(away) == len(PLAYERS) else next(key for key in PLAYERS if key not in away)
+        logger.warning(f"[GAME {self.game_id}] {', '.join(away)} forfeited after {settings.GAME_FORFEIT_GRACE}s away")
+        if await self.checkpoint():
+            await self.end_game(winner, reason='forfeit')
+        return False
+
+    def resume_state(self):
+        """What the next host of this match needs to continue it"""
+        return {
+            'game_state': self.engine.snapshot(),
+            'tick': self.engine.tick,
+            'acks': self.engine.acks(),
+            'started_at': self.started_at,
+        }
+
+    async def keep_lease(self):
+        """Renew the lease a few times per TTL, returns False once it is lost"""
+        now = time.monotonic()
+        if now - self.last_renew < settings.GAME_LEASE_TTL / 3:
+            return True
+        self.last_renew = now
+        # Publish scheduling counters at the same cadence
+        stats = {**self.timestep.stats.as_dict(), 'send_backoff': self.lag_monitor.backoff}
+        await state_store.write_tick_stats(self.game_id, stats)
+        return await self.lease.renew()
+
+    async def broadcast(self, frame, streams):
+        """Encode ``frame`` once and hand the payloads to every subscriber of ``streams``"""
+        event = {
+            'type': 'game_frame',
+            **protocol.encode_frame(frame)
+        }
+        now = time.monotonic()
+        for stream in streams:
+            stream.last_sent = now
+            if stream.spectator:
+                await spectators.publish(self.game_id, event['text'])
+            else:
+                await self.channel_layer.group_send(stream.group_name, event)
+
+    async def broadcast_keyframe(self):
+        engine = self.engine
+        game_state = engine.snapshot()
+        if self.recorder is not None:
+            self.recorder.keyframe(engine.tick, game_state)
+        for stream in self.streams:
+            stream.sent_paddles = protocol.paddle_positions(engine.state)
+        await self.broadcast(protocol.keyframe(game_state, engine.tick, engine.acks()), self.streams)
+        await state_store.write_fields(
+            self.game_id,
+            state_store.keyframe_fields(engine.state, engine.tick, engine.acks()),
+            refresh_ttl=True
+        )
+
+    async def broadcast_deltas(self):
+        """Send a delta to the streams whose send interval has elapsed"""
+        engine = self.engine
+        now = time.monotonic()
+        backoff = self.lag_monitor.update(self.timestep.stats.jitter_avg_ms)
+        # Wakeups land on tick boundaries: allow half a tick of slack
+        slack = self.timestep.interval / 2
+        for stream in self.streams:
+            interval = self.policy.interval(
+                engine.state, stream.paddles_moved(engine.state), now - self.last_point,
+                spectator=stream.spectator, backoff=backoff
+            )
+            if now - stream.last_sent < interval - slack:
+                continue
+            frame = protocol.delta(engine.state, engine.tick, stream.sent_paddles, engine.acks())
+            await self.broadcast(frame, [stream])
+            if not stream.spectator:
+                # Only the slots that changed: the ball, and paddles that moved
+                await state_store.write_fields(
+                    self.game_id,
+                    state_store.delta_fields(engine.state, engine.tick, frame['acks'], frame.get('paddles', ()))
+                )
+
+    async def checkpoint(self, wait=True):
+        """Persist a snapshot, False if another owner wrote the row meanwhile.
+
+        Without ``wait`` the snapshot is only queued to the checkpoint
+        writer, and a lost row stops the ticker at a later checkpoint.
+        """
+        if not self.checkpoints.owns(self.game_id):
+            logger.warning(f"[GAME {self.game_id}] Game state was written by another owner, stopping ticker")
+            return False
+        game_state = self.engine.snapshot()
+        written = self.checkpoints.save(self.game_id, game_state, self.engine.tick)
+        if wait and not await written:
+            logger.warning(f"[GAME {self.game_id}] Game state was written by another owner, stopping ticker")
+            return False
+        if self.recorder is not None:
+            # Replays are written in batches, one per checkpoint
+            self.recorder.keyframe(self.engine.tick, game_state)
+            await self.recorder.flush()
+        return True
+
+    async def end_game(self, winner, reason='score'):
+        """End the game and update the database"""
+        logger.warning("=== ENDING GAME ===")
+        logger.warning(f"Winner: {winner}")
+
+        final_score = self.engine.state.score_json()
+        logger.warning(f"Final Score: {final_score}")
+
+        # Calculate game duration
+        game_duration = int(time.time() - self.started_at)
+        minutes = game_duration // 60
+        seconds = game_duration % 60
+        duration_formatted = f"{minutes:02d}:{seconds:02d}"
+
+        winner_id = self.engine.players.get(winner)
+        if self.recorder is not None and winner is not None:
+            self.recorder.end(self.engine.tick, winner)
+        await update_game_status(self.game_id, 'ended', winner_id, game_duration, duration_formatted)
+        if winner_id is not None:
+            await update_ratings(self.engine.players['player1'], self.engine.players['player2'], winner_id)
+        await presence.clear(self.game_id)
+
+        # Notify all players that game has ended
+        await self.channel_layer.group_send(
+            self.group_name,
+            {
+                'type': 'game_end_message',
+                'winner': winner,
+                'reason': reason,
+                'duration': duration_formatted,
+                'final_score': final_score
+            }
+        )
+        await spectators.publish(self.game_id, json.dumps({
+            'type': 'game_end',
+            'winner': winner,
+            'reason': reason,
+            'duration': duration_formatted,
+            'final_score': final_score
+        }))
+        # New viewers must not start from the final frame of a finished match
+        await state_store.clear(self.game_id)
+
+
+class BatchTicker:
+    """One loop stepping every match of this process through BatchPhysics.
+
+    Matches attach for their whole life. Each wakeup runs the physics of
+    all of them as array operations, then every MatchTicker persists and
+    broadcasts its own results concurrently.
+    """
+
+    def __init__(self):
+        self.physics = BatchPhysics()
+        self.tickers = {}
+        self.timestep = None
+        self.task = None
+
+    async def attach(self, ticker):
+        """Step the match until it stops, True when stopped for a migration"""
+        ticker.detached = asyncio.get_running_loop().create_future()
+        self.physics.add(ticker.engine)
+        self.tickers[ticker.game_id] = ticker
+        if self.task is None or self.task.done():
+            self.timestep = FixedTimestep(
+                1 / settings.GAME_TICK_RATE,
+                max_substeps=settings.GAME_MAX_CATCHUP_STEPS
+            )
+            self.task = asyncio.create_task(self.run())
+        # Tick stats now describe the shared loop
+        ticker.timestep = self.timestep
+        try:
+            return await ticker.detached
+        finally:
+            self.detach(ticker)
+
+    def detach(self, ticker, stopped=False, error=None):
+        self.tickers.pop(ticker.game_id, None)
+        self.physics.remove(ticker.game_id)
+        if ticker.detached.done():
+            return
+        if error is not None:
+            ticker.detached.set_exception(error)
+        else:
+            ticker.detached.set_result(stopped)
+
+    async def run(self):
+        try:
+            while self.tickers:
+                steps = await self.timestep.wait()
+                for ticker in list(self.tickers.values()):
+                    if ticker.stopping:
+                        self.detach(ticker, stopped=True)
+
+                results = self.physics.step(steps)
+                tickers = list(self.tickers.values())
+                outcomes = await asyncio.gather(
+                    *(ticker.advance(results.get(ticker.game_id, [])) for ticker in tickers),
+                    return_exceptions=True
+                )
+                for ticker, outcome in zip(tickers, outcomes):
+                    if isinstance(outcome, Exception):
+                        logger.error(f"[GAME {ticker.game_id}] Error in game loop: {str(outcome)}",
+                                     exc_info=outcome)
+                    if outcome is not True:
+                        self.detach(ticker)
+        except Exception as e:
+            # The shared step failed: end every attached match instead of leaving it waiting
+            logger.error(f"Error in batch game loop: {str(e)}", exc_info=True)
+            for ticker in list(self.tickers.values()):
+                self.detach(ticker, error=e)
+
+
+# One batch loop per event loop
+_batch_tickers = weakref.WeakKeyDictionary()
+
+
+def get_batch_ticker():
+    loop = asyncio.get_running_loop()
+    batch = _batch_tickers.get(loop)
+    if batch is None:
+        batch = BatchTicker()
+        _batch_tickers[loop] = batch
+    return batch
+
+
+_tickers = {}
+
+
+async def ensure_ticker(game_id, owner=None, resume=None):
+    """Start the match ticker unless some worker already owns this match.
+
+    Safe to call from every consumer of the match: only the caller that
+    wins the lease starts a loop, everybody else just subscribes to the
+    game group. ``owner`` is recorded as the lease holder so other
+    workers can find the match host, ``resume`` continues a migrated
+    match from its previous host's snapshot.
+    """
+    game_id = int(game_id)
+    if game_id in _tickers:
+        return False
+    # Reserve the slot before awaiting so concurrent callers in this process back off
+    _tickers[game_id] = None
+
+    lease = make_lease(owner_key(game_id), settings.GAME_LEASE_TTL, owner)
+    try:
+        game = None
+        if await lease.acquire():
+            game = await get_active_game(game_id)
+            if game is None or not game.player2_id:
+                await lease.release()
+                game = None
+    except Exception as e:
+        logger.error(f"[GAME {game_id}] Error acquiring match lease: {str(e)}", exc_info=True)
+        game = None
+
+    if game is None:
+        _tickers.pop(game_id, None)
+        return False
+
+    ticker = MatchTicker(game, lease, resume)
+    _tickers[game_id] = ticker
+    ticker.task = asyncio.create_task(ticker.run())
+    return True
+
+
+def hosted_games():
+    """Ids of the matches ticking in this process"""
+    return [game_id for game_id, ticker in _tickers.items() if ticker is not None]
+
+
+async def stop_ticker(game_id):
+    """Stop a match here for migration, returns its resume state or None"""
+    ticker = _tickers.get(int(game_id))
+    if ticker is None:
+        return None
+    ticker.stopping = True
+    await ticker.task
+    return ticker.resume_state() if ticker.handed_over else None
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path('create/', views.create_game, name='create_game'),
     path('join/<int:game_id>/', views.join_game, name='join_game'),
+    path('status/', views.game_status, name='game_status'),
+    path('<int:pk>/', views.GameViewSet.as_view({'get': 'retrieve'}), name='game_detail'),
+    path('<int:game_id>/tick_stats/', views.tick_stats, name='tick_stats'),
 ]
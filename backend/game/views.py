@@ -7,12 +7,16 @@ from .models import Game
 from .serializers import GameSerializer, GameDetailSerializer
 from django.utils import timezone
 from django.db.models import Q
+from .cache import find_active_game, get_summary, with_live_state, write_through
+from . import state_store
+from .matchmaking import get_queue
+from asgiref.sync import async_to_sync
 
 # Create your views here.
 
 class GameViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Game.objects.all()
+    queryset = Game.objects.select_related('player1', 'player2', 'winner')
     serializer_class = GameSerializer
 
     def get_serializer_class(self):
@@ -20,10 +24,21 @@ class GameViewSet(viewsets.ModelViewSet):
             return GameDetailSerializer
         return GameSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        # Served from the game cache, with the live snapshot of a running match
+        try:
+            summary = get_summary(int(self.kwargs['pk']))
+        except ValueError:
+            summary = None
+        if summary is None:
+            return Response({'error': 'Game not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(async_to_sync(with_live_state)(summary))
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_game(request):
     game = Game.objects.create(player1=request.user)
+    write_through(game)
     return Response(GameSerializer(game).data)
 
 @api_view(['POST'])
@@ -35,6 +50,7 @@ def join_game(request, game_id):
             game.player2 = request.user
             game.status = 'in_progress'
             game.save()
+            write_through(game)
             return Response(GameSerializer(game).data)
         return Response({'error': 'Cannot join this game'}, status=status.HTTP_400_BAD_REQUEST)
     except Game.DoesNotExist:
@@ -52,29 +68,30 @@ def user_games(request):
 @permission_classes([IsAuthenticated])
 def game_status(request):
     """Get the status of active games for the current user"""
-    active_game = Game.objects.filter(
-        status='playing',
-        player1=request.user
-    ).first() or Game.objects.filter(
-        status='playing',
-        player2=request.user
-    ).first()
-
-    if active_game:
+    summary = find_active_game(request.user.id)
+    if summary:
+        summary = async_to_sync(with_live_state)(summary)
+        score = summary['game_state'].get('score', {})
         return Response({
             'status': 'active',
-            'game_id': str(active_game.id),
-            'player1': active_game.player1.username,
-            'player2': active_game.player2.username if active_game.player2 else None,
-            'score1': active_game.player1_score,
-            'score2': active_game.player2_score
+            'game_id': str(summary['id']),
+            'player1': summary['player1']['username'],
+            'player2': summary['player2']['username'] if summary['player2'] else None,
+            'score1': score.get('player1', 0),
+            'score2': score.get('player2', 0)
         })
     
-    waiting_game = Game.objects.filter(status='waiting').first()
-    if waiting_game:
-        return Response({
-            'status': 'waiting',
-            'game_id': str(waiting_game.id)
-        })
+    if async_to_sync(get_queue().is_queued)(request.user.id):
+        return Response({'status': 'waiting'})
     
     return Response({'status': 'no_game'})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def tick_stats(request, game_id):
+    """Get the scheduler jitter and overrun counters of a running game"""
+    # Published by the ticker to the game Redis, whichever worker hosts the match
+    stats = async_to_sync(state_store.read_tick_stats)(game_id)
+    if stats is None:
+        return Response({'error': 'Game is not running'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(stats)
@@ -0,0 +1,176 @@
+import json
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from . import social
+from .messaging import (
+    history_page, mark_delivered, mark_read, message_error, message_payload, read_event, store_message,
+    undelivered_messages, user_group
+)
+
+logger = logging.getLogger('livechat')
+
+CHECK_TTL = 30.0  # Seconds a connection reuses the block/friend check of a peer
+UNDELIVERED_LIMIT = 100  # Messages pushed at most on connect, the rest after acks
+MAX_MESSAGE_LENGTH = 2000
+
+
+class ChatConsumer(AsyncWebsocketConsumer):
+    """Push delivery of direct messages.
+
+    Every connection of a user joins the user's chat group, so messages
+    are pushed as soon as they are stored instead of being polled. The
+    recipient's client acks them, which marks them delivered and tells
+    the sender. Whether the user may message a peer is checked once per
+    CHECK_TTL on the connection, and checked again as soon as either
+    user changes their relationship.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        if self.user.is_anonymous:
+            await self.close()
+            return
+        self.group_name = user_group(self.user.id)
+        self.checks = {}
+        try:
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.accept()
+            await self.send_json({'type': 'connection_established', 'user_id': self.user.id})
+
+            # Messages that arrived while offline, delivered once acked
+            for payload in await database_sync_to_async(undelivered_messages)(self.user.id, UNDELIVERED_LIMIT):
+                await self.send_json(payload)
+        except Exception as e:
+            logger.error(f"Error in chat connect: {str(e)}", exc_info=True)
+            await self.close()
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '{}')
+        except json.JSONDecodeError:
+            await self.send_json({'type': 'error', 'message': 'Invalid JSON'})
+            return
+
+        message_type = data.get('type')
+        try:
+            if message_type == 'send_message':
+                await self.send_message(data)
+            elif message_type == 'ack':
+                await self.ack(data.get('ids', []))
+            elif message_type == 'history':
+                await self.history(data)
+            elif message_type == 'read':
+                await self.read(data.get('with'))
+            elif message_type == 'heartbeat':
+                await self.send_json({'type': 'heartbeat_response'})
+            else:
+                await self.send_json({'type': 'error', 'message': f'Unknown message type: {message_type}'})
+        except Exception as e:
+            logger.error(f"Error handling chat message: {str(e)}", exc_info=True)
+            await self.send_json({'type': 'error', 'message': 'Internal error'})
+
+    async def send_message(self, data):
+        client_id = data.get('client_id')
+        recipient_id = data.get('to')
+        text = data.get('message')
+        if not isinstance(recipient_id, int) or not isinstance(text, str) or not text.strip():
+            await self.send_json({'type': 'error', 'client_id': client_id, 'message': 'to and message are required'})
+            return
+        if recipient_id == self.user.id:
+            await self.send_json({'type': 'error', 'client_id': client_id, 'message': 'Cannot send a message to yourself'})
+            return
+        if len(text) > MAX_MESSAGE_LENGTH:
+            await self.send_json({'type': 'error', 'client_id': client_id, 'message': 'Message is too long'})
+            return
+
+        error = await self.check_peer(recipient_id)
+        if error:
+            await self.send_json({'type': 'error', 'client_id': client_id, 'message': error})
+            return
+
+        message = await self.create_message(recipient_id, text)
+        payload = message_payload(message)
+        # Stored: ack the sender, then push to every connection of the recipient
+        await self.send_json({**payload, 'type': 'message_sent', 'client_id': client_id})
+        await self.channel_layer.group_send(user_group(recipient_id), {'type': 'chat.message', 'message': payload})
+
+    async def check_peer(self, peer_id):
+        """Why this user may not message ``peer_id``, or None, cached on the connection"""
+        now = time.monotonic()
+        error, expires_at = self.checks.get(peer_id, (None, 0))
+        if expires_at <= now:
+            error = await database_sync_to_async(message_error)(self.user.id, peer_id)
+            self.checks[peer_id] = (error, now + CHECK_TTL)
+        return error
+
+    @database_sync_to_async
+    def create_message(self, recipient_id, text):
+        return store_message(self.user.id, recipient_id, text)
+
+    async def ack(self, message_ids):
+        if not isinstance(message_ids, list) or not all(isinstance(i, int) for i in message_ids):
+            await self.send_json({'type': 'error', 'message': 'ids must be a list of message ids'})
+            return
+        delivered = await database_sync_to_async(mark_delivered)(self.user.id, message_ids)
+        for sender_id, ids in delivered.items():
+            await self.channel_layer.group_send(user_group(sender_id), {'type': 'chat.delivered', 'ids': ids})
+
+    async def history(self, data):
+        """Send a page of the conversation with a peer, older pages on request"""
+        peer_id = data.get('with')
+        before = data.get('before')
+        if not isinstance(peer_id, int):
+            await self.send_json({'type': 'error', 'message': 'with is required'})
+            return
+        if before is not None and not isinstance(before, str):
+            await self.send_json({'type': 'error', 'message': 'Invalid before or limit'})
+            return
+        try:
+            messages, next_cursor = await database_sync_to_async(history_page)(
+                self.user.id, peer_id, before=before, limit=data.get('limit', 50)
+            )
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'message': 'Invalid before or limit'})
+            return
+        await self.send_json({'type': 'history', 'with': peer_id, 'messages': messages, 'next_cursor': next_cursor})
+
+    async def read(self, peer_id):
+        if not isinstance(peer_id, int):
+            await self.send_json({'type': 'error', 'message': 'with is required'})
+            return
+        last_read_id = await database_sync_to_async(mark_read)(self.user.id, peer_id)
+        if last_read_id is None:
+            return
+        event = read_event(self.user.id, peer_id, last_read_id)
+        await self.channel_layer.group_send(self.group_name, event)
+        await self.channel_layer.group_send(user_group(peer_id), event)
+
+    async def chat_message(self, event):
+        await self.send_json(event['message'])
+
+    async def chat_delivered(self, event):
+        await self.send_json({'type': 'message_delivered', 'ids': event['ids']})
+
+    async def chat_read(self, event):
+        await self.send_json({
+            'type': 'conversation_read',
+            'reader': event['reader'],
+            'with': event['peer'] if event['reader'] == self.user.id else event['reader'],
+            'last_read_id': event['last_read_id'],
+        })
+
+    async def chat_relationship(self, event):
+        self.checks.pop(event['peer_id'], None)
+        # The change may have been made by another process
+        social.forget_local(self.user.id, event['peer_id'])
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content))
@@ -0,0 +1,226 @@
+"""Direct message rules and push delivery, shared by the REST views and ChatConsumer.
+
+Every chat connection of a user joins the user's chat group. A message
+is pushed to the recipient's group as soon as it is stored, and the
+recipient's client acks it to set ``delivered_at``. Changes to blocks or
+friendships invalidate the pair in ``social`` and are announced to both
+users' groups, so connections drop the checks they cached for that pair.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from . import social
+from .models import ChatMessage, Conversation
+
+
+def user_group(user_id):
+    return f"chat_{user_id}"
+
+
+def message_error(sender_id, recipient_id):
+    """Why ``sender_id`` may not message ``recipient_id``, or None if they may"""
+    entry = social.get_entry(sender_id)
+    recipient_id = int(recipient_id)
+    if recipient_id in entry.blocked:
+        return 'User cannot send message to someone he blocked'
+    if recipient_id in entry.blocked_by:
+        return 'User cannot send message to someone that blocked him'
+    if recipient_id not in entry.friends:
+        return 'User cannot send message to someone he doesnt had friend'
+    if recipient_id not in entry.friended_by:
+        return 'User cannot send message to someone who isnt your friend'
+    return None
+
+
+def message_payload(message):
+    return {
+        'type': 'chat_message',
+        'id': message.id,
+        'from': message.id_user_0_id,
+        'to': message.id_user_1_id,
+        'message': message.message,
+        'created_at': message.created_at.isoformat(),
+        'delivered_at': message.delivered_at.isoformat() if message.delivered_at else None,
+    }
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+INBOX_PAGE_SIZE = 50
+INBOX_MAX_PAGE_SIZE = 200
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(message):
+    """Opaque position of ``message`` in its conversation, for the ``before`` of the next page"""
+    micros = (message.created_at - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}_{message.id}"
+
+
+def decode_cursor(cursor):
+    """``(created_at, id)`` of a cursor, raises ValueError if it is malformed"""
+    micros, message_id = cursor.split('_')
+    try:
+        return _EPOCH + timedelta(microseconds=int(micros)), int(message_id)
+    except OverflowError:
+        raise ValueError(f"Cursor out of range: {cursor}")
+
+
+def conversation_messages(user_0_id, user_1_id):
+    """Messages between two users, in both directions"""
+    user_low_id, user_high_id = Conversation.pair(user_0_id, user_1_id)
+    return ChatMessage.objects.filter(conversation__user_low_id=user_low_id, conversation__user_high_id=user_high_id)
+
+
+def store_message(sender_id, recipient_id, text):
+    """Insert a message and move its conversation's last message and unread count along"""
+    user_low_id, user_high_id = Conversation.pair(sender_id, recipient_id)
+    unread = 'unread_low' if int(recipient_id) == user_low_id else 'unread_high'
+    with transaction.atomic():
+        # Locking the pair's row keeps last_message in insert order under concurrent sends
+        conversation, _ = Conversation.objects.select_for_update().get_or_create(
+            user_low_id=user_low_id,
+            user_high_id=user_high_id
+        )
+        message = ChatMessage.objects.create(
+            conversation=conversation,
+            id_user_0_id=sender_id,
+            id_user_1_id=recipient_id,
+            message=text
+        )
+        Conversation.objects.filter(id=conversation.id).update(
+            last_message=message,
+            last_message_at=message.created_at,
+            **{unread: F(unread) + 1}
+        )
+    return message
+
+
+def history_page(user_0_id, user_1_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """One page of a conversation, newest first, and the cursor of the next older page.
+
+    Pages are keyed on ``(created_at, id)`` rather than offsets, so each
+    one is an index range scan however far back it is, and messages sent
+    meanwhile do not shift the pages already read. ``next_cursor`` is None
+    on the oldest page.
+    """
+    limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+    messages = conversation_messages(user_0_id, user_1_id)
+    if before:
+        created_at, message_id = decode_cursor(before)
+        messages = messages.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id))
+    # One row more than the page tells whether an older page exists
+    page = list(messages.order_by('-created_at', '-id')[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return [message_payload(message) for message in page[:limit]], next_cursor
+
+
+def inbox(user_id, limit=INBOX_PAGE_SIZE):
+    """A user's conversations, most recent first, and their total unread count.
+
+    Reads the conversation rows only: their counters and last message are
+    kept up to date by ``store_message`` and ``mark_read``.
+    """
+    user_id = int(user_id)
+    limit = max(1, min(int(limit), INBOX_MAX_PAGE_SIZE))
+    conversations = Conversation.objects.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id))
+
+    entries = []
+    page = conversations.filter(last_message__isnull=False).select_related(
+        'user_low', 'user_high', 'last_message'
+    ).order_by('-last_message_at', '-id')[:limit]
+    for conversation in page:
+        low = conversation.user_low_id == user_id
+        peer = conversation.user_high if low else conversation.user_low
+        entries.append({
+            'conversation_id': conversation.id,
+            'user': {'id': peer.id, 'username': peer.username},
+            'last_message': message_payload(conversation.last_message),
+            'unread': conversation.unread_low if low else conversation.unread_high,
+            'last_read_id': conversation.last_read_low_id if low else conversation.last_read_high_id,
+        })
+
+    totals = conversations.aggregate(
+        low=Sum('unread_low', filter=Q(user_low_id=user_id)),
+        high=Sum('unread_high', filter=Q(user_high_id=user_id))
+    )
+    return entries, (totals['low'] or 0) + (totals['high'] or 0)
+
+
+def mark_read(user_id, peer_id):
+    """Reset ``user_id``'s unread count with ``peer_id``.
+
+    Returns the id of the last message read, None if they have no
+    conversation.
+    """
+    user_low_id, user_high_id = Conversation.pair(user_id, peer_id)
+    side = 'low' if int(user_id) == user_low_id else 'high'
+    conversations = Conversation.objects.filter(user_low_id=user_low_id, user_high_id=user_high_id)
+    # One statement, so the marker is the last message the reset covered
+    if not conversations.update(**{f'unread_{side}': 0, f'last_read_{side}': F('last_message')}):
+        return None
+    return conversations.values_list(f'last_read_{side}', flat=True).first()
+
+
+def undelivered_messages(user_id, limit):
+    """Payloads of the oldest messages to ``user_id`` not acked yet"""
+    messages = ChatMessage.objects.filter(
+        id_user_1_id=user_id,
+        delivered_at__isnull=True
+    ).order_by('created_at', 'id')[:limit]
+    return [message_payload(message) for message in messages]
+
+
+def mark_delivered(user_id, message_ids):
+    """Set ``delivered_at`` on the messages to ``user_id`` among ``message_ids``.
+
+    Returns the ids newly marked, by sender.
+    """
+    pending = ChatMessage.objects.filter(
+        id__in=message_ids,
+        id_user_1_id=user_id,
+        delivered_at__isnull=True
+    )
+    by_sender = {}
+    for message_id, sender_id in pending.values_list('id', 'id_user_0_id'):
+        by_sender.setdefault(sender_id, []).append(message_id)
+    if by_sender:
+        ChatMessage.objects.filter(
+            id__in=[message_id for ids in by_sender.values() for message_id in ids]
+        ).update(delivered_at=timezone.now())
+    return by_sender
+
+
+def push_message(message):
+    """Deliver a stored message to the recipient's connections (sync callers)"""
+    async_to_sync(get_channel_layer().group_send)(
+        user_group(message.id_user_1_id),
+        {'type': 'chat.message', 'message': message_payload(message)}
+    )
+
+
+def read_event(user_id, peer_id, last_read_id):
+    """Event telling the reader's connections and the peer's how far ``user_id`` has read"""
+    return {'type': 'chat.read', 'reader': int(user_id), 'peer': int(peer_id), 'last_read_id': last_read_id}
+
+
+def conversation_read(user_id, peer_id, last_read_id):
+    """Send ``read_event`` to both users' connections (sync callers)"""
+    event = read_event(user_id, peer_id, last_read_id)
+    group_send = async_to_sync(get_channel_layer().group_send)
+    group_send(user_group(user_id), event)
+    group_send(user_group(peer_id), event)
+
+
+def relationship_changed(user_0_id, user_1_id):
+    """Drop the pair's cached social graph and tell both users' connections to check it again (sync callers)"""
+    social.invalidate(user_0_id, user_1_id)
+    group_send = async_to_sync(get_channel_layer().group_send)
+    group_send(user_group(user_0_id), {'type': 'chat.relationship', 'peer_id': int(user_1_id)})
+    group_send(user_group(user_1_id), {'type': 'chat.relationship', 'peer_id': int(user_0_id)})
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livechat', '0002_frienduser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livechat', '0003_chatmessage_delivered_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['id_user_0', 'id_user_1', '-created_at', '-id'], name='chatmessage_history_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Q
+
+
+def backfill_conversations(apps, schema_editor):
+    """Create the conversation of every pair that exchanged messages and attach them.
+
+    Existing messages predate read tracking, so they all count as read.
+    """
+    ChatMessage = apps.get_model('livechat', 'ChatMessage')
+    Conversation = apps.get_model('livechat', 'Conversation')
+
+    pairs = set()
+    for sender_id, recipient_id in ChatMessage.objects.values_list('id_user_0_id', 'id_user_1_id').distinct():
+        pairs.add((min(sender_id, recipient_id), max(sender_id, recipient_id)))
+
+    for user_low_id, user_high_id in sorted(pairs):
+        conversation, _ = Conversation.objects.get_or_create(user_low_id=user_low_id, user_high_id=user_high_id)
+        messages = ChatMessage.objects.filter(
+            Q(id_user_0_id=user_low_id, id_user_1_id=user_high_id) |
+            Q(id_user_0_id=user_high_id, id_user_1_id=user_low_id)
+        )
+        messages.update(conversation=conversation)
+        last = messages.order_by('-created_at', '-id').first()
+        Conversation.objects.filter(id=conversation.id).update(last_message=last, last_message_at=last.created_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livechat', '0005_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livechat', '0006_backfill_conversations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='livechat.conversation'),
+        ),
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chatmessage_history_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='chatmessage_conversation_idx'),
+        ),
+    ]
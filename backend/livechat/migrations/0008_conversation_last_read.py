@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livechat', '0007_chatmessage_conversation_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_high',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='livechat.chatmessage'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_read_low',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='livechat.chatmessage'),
+        ),
+    ]
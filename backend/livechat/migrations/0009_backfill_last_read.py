@@ -0,0 +1,20 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def backfill_last_read(apps, schema_editor):
+    """Sides with nothing unread have read up to the last message"""
+    Conversation = apps.get_model('livechat', 'Conversation')
+    Conversation.objects.filter(unread_low=0).update(last_read_low=F('last_message'))
+    Conversation.objects.filter(unread_high=0).update(last_read_high=F('last_message'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('livechat', '0008_conversation_last_read'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_read, migrations.RunPython.noop),
+    ]
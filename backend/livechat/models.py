@@ -3,12 +3,58 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+class Conversation(models.Model):
+    """Direct messages between two users, stored as the ordered pair ``user_low < user_high``.
+
+    ``last_message`` and the unread counters are updated with every message
+    sent, so listing a user's conversations never scans the messages.
+    Marking it read resets one side's counter and moves its ``last_read``
+    marker to the last message.
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversations_low")
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversations_high")
+
+    last_message = models.ForeignKey('ChatMessage', null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    unread_low = models.PositiveIntegerField(default=0)  # Messages to user_low not read yet
+    unread_high = models.PositiveIntegerField(default=0)  # Messages to user_high not read yet
+    last_read_low = models.ForeignKey('ChatMessage', null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    last_read_high = models.ForeignKey('ChatMessage', null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user_low', 'user_high')
+        indexes = [
+            # A user's conversations, most recent first, from either side of the pair
+            models.Index(fields=['user_low', '-last_message_at'], name='conversation_low_inbox_idx'),
+            models.Index(fields=['user_high', '-last_message_at'], name='conversation_high_inbox_idx'),
+        ]
+
+    @staticmethod
+    def pair(user_0_id, user_1_id):
+        """``(user_low, user_high)`` ids of the conversation between two users"""
+        user_0_id, user_1_id = int(user_0_id), int(user_1_id)
+        return (user_0_id, user_1_id) if user_0_id < user_1_id else (user_1_id, user_0_id)
+
+    def __str__(self):
+        return f"Conversation between {self.user_low_id} and {self.user_high_id}"
+
+
 class ChatMessage(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="messages")
     id_user_0 = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sent_messages")
     id_user_1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name="received_messages")
     message = models.TextField()
 
     created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)  # Set when the recipient's client acks it
+
+    class Meta:
+        indexes = [
+            # Keyset pages of a conversation, both directions in one index range
+            models.Index(fields=['conversation', '-created_at', '-id'], name='chatmessage_conversation_idx'),
+        ]
 
     def __str__(self):
         return f"Message from {self.id_user_0.username} to {self.id_user_1.username}"
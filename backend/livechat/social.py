@@ -0,0 +1,158 @@
+"""Cached social graph for friendship and block checks.
+
+A user's entry holds four sets of user ids: who they added as a friend,
+who added them, who they blocked and who blocked them. Every check
+between a user and a peer is then a set membership test on the user's
+entry alone. Entries live in the shared cache (Redis in production) for
+CACHE_TTL, with a per-process LRU of LOCAL_SIZE entries in front.
+
+Each user also has a generation counter in the shared cache, bumped by
+``invalidate`` whenever a friendship or block of theirs changes. A
+shared entry is only used if it was built at the current generation,
+and a reader takes the generation before querying the database. So a
+reader that queried before the change committed cannot put its old sets
+back after the invalidation: they are tagged with the old generation.
+
+The per-process copies are not checked against the generation.
+``invalidate`` drops the copies of the process it runs in, and chat
+connections drop theirs when the change is announced to them. Any
+other process keeps serving its copy for up to LOCAL_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import BlockedUser, FriendUser
+
+CACHE_TTL = 300  # Seconds an entry lives in the shared cache
+LOCAL_TTL = 5.0  # Seconds a process reuses its copy of an entry
+LOCAL_SIZE = 10000  # Entries kept per process
+
+
+class SocialEntry:
+    __slots__ = ('friends', 'friended_by', 'blocked', 'blocked_by')
+
+    def __init__(self, friends, friended_by, blocked, blocked_by):
+        self.friends = friends
+        self.friended_by = friended_by
+        self.blocked = blocked
+        self.blocked_by = blocked_by
+
+    @property
+    def mutual_friends(self):
+        return self.friends & self.friended_by
+
+    def to_cache(self):
+        return (self.friends, self.friended_by, self.blocked, self.blocked_by)
+
+
+# user id -> (entry, monotonic time it was read), least recently used first.
+# Forgotten users keep a (None, time) tombstone, so a read that started
+# before they were forgotten does not put its copy back.
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def social_key(user_id):
+    return f"user:{user_id}:social"
+
+
+def generation_key(user_id):
+    return f"user:{user_id}:social_generation"
+
+
+def load_entry(user_id, generation):
+    """Read a user's relationships from the database and cache them as of ``generation``"""
+    friends, friended_by, blocked, blocked_by = set(), set(), set(), set()
+    for id_user_0, id_user_1 in FriendUser.objects.filter(
+        Q(id_user_0_id=user_id) | Q(id_user_1_id=user_id)
+    ).values_list('id_user_0_id', 'id_user_1_id'):
+        if id_user_0 == user_id:
+            friends.add(id_user_1)
+        else:
+            friended_by.add(id_user_0)
+    for id_user_0, id_user_1 in BlockedUser.objects.filter(
+        Q(id_user_0_id=user_id) | Q(id_user_1_id=user_id)
+    ).values_list('id_user_0_id', 'id_user_1_id'):
+        if id_user_0 == user_id:
+            blocked.add(id_user_1)
+        else:
+            blocked_by.add(id_user_0)
+
+    entry = SocialEntry(frozenset(friends), frozenset(friended_by), frozenset(blocked), frozenset(blocked_by))
+    # A later generation means the sets may be stale already: keep them out of the cache
+    cache.set(social_key(user_id), (generation, entry.to_cache()), timeout=CACHE_TTL)
+    return entry
+
+
+def get_entry(user_id):
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _local_lock:
+        cached = _local.get(user_id)
+        if cached is not None and cached[0] is not None and now - cached[1] < LOCAL_TTL:
+            _local.move_to_end(user_id)
+            return cached[0]
+
+    stored = cache.get_many([social_key(user_id), generation_key(user_id)])
+    generation = stored.get(generation_key(user_id), 0)
+    cached = stored.get(social_key(user_id))
+    if cached is not None and cached[0] == generation:
+        entry = SocialEntry(*cached[1])
+    else:
+        entry = load_entry(user_id, generation)
+    with _local_lock:
+        current = _local.get(user_id)
+        if current is None or current[1] < now:
+            _local[user_id] = (entry, now)
+            _local.move_to_end(user_id)
+            while len(_local) > LOCAL_SIZE:
+                _local.popitem(last=False)
+    return entry
+
+
+def forget_local(*user_ids):
+    """Drop this process's copies of the users' entries"""
+    now = time.monotonic()
+    with _local_lock:
+        for user_id in user_ids:
+            _local[int(user_id)] = (None, now)
+            _local.move_to_end(int(user_id))
+        while len(_local) > LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def invalidate(user_0_id, user_1_id):
+    """Drop both users' entries after a friendship or block between them changed"""
+    forget_local(user_0_id, user_1_id)
+    for user_id in (int(user_0_id), int(user_1_id)):
+        key = generation_key(user_id)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def has_friend(user_id, peer_id):
+    """True if ``user_id`` added ``peer_id`` as a friend"""
+    return int(peer_id) in get_entry(user_id).friends
+
+
+def has_blocked(user_id, peer_id):
+    """True if ``user_id`` blocked ``peer_id``"""
+    return int(peer_id) in get_entry(user_id).blocked
+
+
+def is_blocked_by(user_id, peer_id):
+    """True if ``peer_id`` blocked ``user_id``"""
+    return int(peer_id) in get_entry(user_id).blocked_by
+
+
+def are_friends(user_id, peer_id):
+    """True if both users added each other"""
+    return int(peer_id) in get_entry(user_id).mutual_friends
+
+
+def mutual_friends(user_id):
+    return get_entry(user_id).mutual_friends
@@ -1,3 +1,255 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import social
+from .consumers import ChatConsumer
+from .messaging import decode_cursor, encode_cursor, history_page, inbox, mark_read, message_error, store_message
+from .models import BlockedUser, ChatMessage, Conversation, FriendUser
+
+User = get_user_model()
+
+
+class HistoryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.carol = User.objects.create_user(username='carol', password='pass')
+
+    def send(self, count):
+        for i in range(count):
+            sender, recipient = (self.alice, self.bob) if i % 2 else (self.bob, self.alice)
+            store_message(sender.id, recipient.id, f'message {i}')
+
+    def test_cursor_round_trip(self):
+        self.send(1)
+        message = ChatMessage.objects.get()
+        self.assertEqual(decode_cursor(encode_cursor(message)), (message.created_at, message.id))
+
+    def test_malformed_cursor(self):
+        for cursor in ('', 'abc', '1_2_3', f'{10 ** 30}_1'):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_cover_conversation_once_newest_first(self):
+        self.send(25)
+        store_message(self.alice.id, self.carol.id, 'other conversation')
+        # Ties on created_at are broken by id
+        same_time = timezone.now() - timedelta(days=1)
+        ChatMessage.objects.filter(message__in=[f'message {i}' for i in range(5, 12)]).update(created_at=same_time)
+
+        seen, before = [], None
+        while True:
+            messages, before = history_page(self.bob.id, self.alice.id, before=before, limit=4)
+            self.assertLessEqual(len(messages), 4)
+            seen += [message['id'] for message in messages]
+            if before is None:
+                break
+
+        expected = list(
+            ChatMessage.objects.exclude(id_user_1=self.carol).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 25)
+
+    def test_new_messages_do_not_shift_older_pages(self):
+        self.send(6)
+        first, before = history_page(self.alice.id, self.bob.id, limit=3)
+        self.send(2)
+        second, _ = history_page(self.alice.id, self.bob.id, before=before, limit=3)
+        self.assertEqual(len({m['id'] for m in first} | {m['id'] for m in second}), 6)
+
+    def test_get_history_requires_participant(self):
+        self.send(3)
+        url = '/api/chat/get_history/'
+        self.assertEqual(self.client.get(url, {'id_user_1': self.bob.id}).status_code, 403)
+
+        self.client.force_login(self.carol)
+        response = self.client.get(url, {'id_user_0': self.alice.id, 'id_user_1': self.bob.id})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(self.alice)
+        response = self.client.get(url, {'id_user_1': self.bob.id, 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['messages']), 2)
+        self.assertIsNotNone(response.json()['next_cursor'])
+        self.assertEqual(self.client.get(url, {'id_user_1': self.bob.id, 'before': 'x'}).status_code, 400)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.carol = User.objects.create_user(username='carol', password='pass')
+
+    def unread(self, user, peer):
+        entries, _ = inbox(user.id)
+        return {entry['user']['id']: entry['unread'] for entry in entries}.get(peer.id)
+
+    def test_counters_follow_sends_and_reads(self):
+        for _ in range(3):
+            store_message(self.bob.id, self.alice.id, 'hi')
+        last = store_message(self.alice.id, self.bob.id, 'hello')
+        store_message(self.carol.id, self.alice.id, 'hey')
+
+        self.assertEqual(self.unread(self.alice, self.bob), 3)
+        self.assertEqual(self.unread(self.bob, self.alice), 1)
+        self.assertEqual(inbox(self.alice.id)[1], 4)
+
+        conversation = Conversation.objects.get(user_low=self.alice, user_high=self.bob)
+        self.assertEqual(conversation.last_message_id, last.id)
+
+        self.assertEqual(mark_read(self.alice.id, self.bob.id), last.id)
+        self.assertEqual(self.unread(self.alice, self.bob), 0)
+        self.assertEqual(self.unread(self.bob, self.alice), 1)
+        self.assertEqual(inbox(self.alice.id)[1], 1)
+        self.assertIsNone(mark_read(self.bob.id, self.carol.id))
+
+    def test_inbox_is_most_recent_first(self):
+        store_message(self.bob.id, self.alice.id, 'first')
+        store_message(self.carol.id, self.alice.id, 'second')
+        entries, _ = inbox(self.alice.id)
+        self.assertEqual([entry['user']['id'] for entry in entries], [self.carol.id, self.bob.id])
+        self.assertEqual(entries[0]['last_message']['message'], 'second')
+
+    def test_inbox_and_mark_read_use_the_caller(self):
+        store_message(self.bob.id, self.alice.id, 'hi')
+        self.assertEqual(self.client.get('/api/chat/get_inbox/').status_code, 403)
+        self.assertEqual(self.client.post('/api/chat/mark_read/', {'id_user_1': self.bob.id}).status_code, 403)
+
+        self.client.force_login(self.carol)
+        response = self.client.get('/api/chat/get_inbox/', {'id_user': self.alice.id})
+        self.assertEqual(response.json(), {'conversations': [], 'unread_total': 0})
+        self.assertEqual(self.client.post('/api/chat/mark_read/', {'id_user_1': self.bob.id}).status_code, 404)
+        self.assertEqual(self.unread(self.alice, self.bob), 1)
+
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get('/api/chat/get_inbox/').json()['unread_total'], 1)
+        self.assertEqual(self.client.post('/api/chat/mark_read/', {'id_user_1': self.bob.id}).status_code, 200)
+        self.assertEqual(self.unread(self.alice, self.bob), 0)
+
+
+class SocialCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        social._local.clear()
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        FriendUser.objects.create(id_user_0=self.alice, id_user_1=self.bob)
+        FriendUser.objects.create(id_user_0=self.bob, id_user_1=self.alice)
+
+    def block(self):
+        BlockedUser.objects.create(id_user_0=self.bob, id_user_1=self.alice)
+        social.invalidate(self.bob.id, self.alice.id)
+
+    def test_checks_are_served_from_cache(self):
+        self.assertTrue(social.are_friends(self.alice.id, self.bob.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(social.are_friends(self.alice.id, self.bob.id))
+            social._local.clear()
+            self.assertTrue(social.are_friends(self.alice.id, self.bob.id))
+
+    def test_invalidate_applies_block(self):
+        self.assertFalse(social.is_blocked_by(self.alice.id, self.bob.id))
+        self.block()
+        self.assertTrue(social.is_blocked_by(self.alice.id, self.bob.id))
+        self.assertTrue(social.has_blocked(self.bob.id, self.alice.id))
+
+    def test_late_fill_from_before_the_change_is_ignored(self):
+        generation = cache.get(social.generation_key(self.alice.id), 0)
+        stale = social.get_entry(self.alice.id).to_cache()
+        self.block()
+        # A reader that queried before the block writes its sets back afterwards
+        cache.set(social.social_key(self.alice.id), (generation, stale))
+        social._local.clear()
+        self.assertTrue(social.is_blocked_by(self.alice.id, self.bob.id))
+
+    def test_local_copy_is_not_restored_by_a_read_racing_invalidate(self):
+        load_entry = social.load_entry
+
+        def racing_load(user_id, generation):
+            entry = load_entry(user_id, generation)
+            self.block()
+            return entry
+
+        with mock.patch.object(social, 'load_entry', side_effect=racing_load):
+            self.assertFalse(social.is_blocked_by(self.alice.id, self.bob.id))
+        self.assertTrue(social.is_blocked_by(self.alice.id, self.bob.id))
+
+    def test_relationship_views_invalidate(self):
+        self.assertIsNone(message_error(self.alice.id, self.bob.id))
+        self.client.post('/api/chat/block_user/', {'id_user_0': self.bob.id, 'id_user_1': self.alice.id})
+        self.assertEqual(message_error(self.alice.id, self.bob.id), 'User cannot send message to someone that blocked him')
+        self.client.post('/api/chat/delete_blocked_user/', {'id_user_0': self.bob.id, 'id_user_1': self.alice.id})
+        self.client.post('/api/chat/delete_friend_user/', {'id_user_0': self.bob.id, 'id_user_1': self.alice.id})
+        self.assertEqual(message_error(self.alice.id, self.bob.id), 'User cannot send message to someone who isnt your friend')
+
+
+class ChatConsumerHistoryTests(TransactionTestCase):
+    async def test_invalid_before_is_a_validation_error(self):
+        alice = await User.objects.acreate(username='alice')
+        bob = await User.objects.acreate(username='bob')
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['user'] = alice
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()
+
+        for before in (5, ['1_1'], {'a': 1}):
+            await communicator.send_json_to({'type': 'history', 'with': bob.id, 'before': before})
+            response = await communicator.receive_json_from()
+            self.assertEqual(response, {'type': 'error', 'message': 'Invalid before or limit'})
+        await communicator.disconnect()
+
+
+class ChatDeliveryTests(TransactionTestCase):
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connection_established')
+        return communicator
+
+    async def test_undelivered_messages_are_pushed_until_acked(self):
+        cache.clear()
+        social._local.clear()
+        alice = await User.objects.acreate(username='alice')
+        bob = await User.objects.acreate(username='bob')
+        await FriendUser.objects.acreate(id_user_0=alice, id_user_1=bob)
+        await FriendUser.objects.acreate(id_user_0=bob, id_user_1=alice)
+
+        sender = await self.connect(alice)
+        await sender.send_json_to({'type': 'send_message', 'to': bob.id, 'message': 'while you were out', 'client_id': 'a'})
+        sent = await sender.receive_json_from()
+        self.assertEqual((sent['type'], sent['client_id']), ('message_sent', 'a'))
+
+        # Offline when it was sent: pushed on connect, again until acked
+        for _ in range(2):
+            recipient = await self.connect(bob)
+            pushed = await recipient.receive_json_from()
+            self.assertEqual((pushed['id'], pushed['message']), (sent['id'], 'while you were out'))
+            await recipient.disconnect()
+
+        recipient = await self.connect(bob)
+        await recipient.receive_json_from()
+        await recipient.send_json_to({'type': 'ack', 'ids': [sent['id']]})
+        self.assertEqual(await sender.receive_json_from(), {'type': 'message_delivered', 'ids': [sent['id']]})
+
+        # Online: pushed right away
+        await sender.send_json_to({'type': 'send_message', 'to': bob.id, 'message': 'live', 'client_id': 'b'})
+        await sender.receive_json_from()
+        self.assertEqual((await recipient.receive_json_from())['message'], 'live')
+        await recipient.disconnect()
+
+        # Only the message that was not acked comes back
+        recipient = await self.connect(bob)
+        self.assertEqual((await recipient.receive_json_from())['message'], 'live')
+        self.assertTrue(await recipient.receive_nothing())
+        await recipient.disconnect()
+        await sender.disconnect()
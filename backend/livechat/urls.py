@@ -6,6 +6,9 @@ urlpatterns = [
     path('block_user/', views.block_user, name='block_user'),
     path('send_message/', views.send_message, name='send_message'),
     path('get_message/', views.get_message, name='get_message'),
+    path('get_history/', views.get_history, name='get_history'),
+    path('get_inbox/', views.get_inbox, name='get_inbox'),
+    path('mark_read/', views.mark_read_message, name='mark_read'),
     path('get_friends/', views.get_friends, name='get_friends'),
     path('check_friendship/', views.check_friendship, name='check_friendship'),
     path('add_friend_user/', views.add_friend_user, name='add_friend_user'),
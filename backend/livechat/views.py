@@ -8,7 +8,12 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth import get_user_model
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
-from livechat.models import ChatMessage, BlockedUser, FriendUser
+from livechat.models import BlockedUser, FriendUser
+from livechat import social
+from livechat.messaging import (
+    conversation_messages, conversation_read, history_page, inbox, mark_read, message_error, push_message,
+    relationship_changed, store_message
+)
 from django.db import models
 from django.db.models import Q
 import logging
@@ -53,10 +58,11 @@ def block_user(request):
     except User.DoesNotExist:
         return Response({'error': 'User blocking not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if BlockedUser.objects.filter(id_user_0=user_blocking, id_user_1=user_to_block).exists():
+    if social.has_blocked(user_blocking.id, user_to_block.id):
         return Response({'message': 'User is already blocked'}, status=status.HTTP_400_BAD_REQUEST)
 
     BlockedUser.objects.create(id_user_0=user_blocking, id_user_1=user_to_block)
+    relationship_changed(user_blocking.id, user_to_block.id)
     return Response({'message': f'{user_to_block.username} has been blocked by {user_blocking.username}'}, status=status.HTTP_201_CREATED)
 
 
@@ -81,16 +87,17 @@ def add_friend_user(request):
     except User.DoesNotExist:
         return Response({'error': 'User adding not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if FriendUser.objects.filter(id_user_0=user_adding, id_user_1=user_to_add).exists():
+    if social.has_friend(user_adding.id, user_to_add.id):
         return Response({'message': 'User is already friend'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if BlockedUser.objects.filter(id_user_0=user_adding, id_user_1=user_to_add).exists():
+    if social.has_blocked(user_adding.id, user_to_add.id):
         return Response({'message': 'You cannot add friend someone you blocked'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if BlockedUser.objects.filter(id_user_0=user_to_add, id_user_1=user_adding).exists():
+    if social.is_blocked_by(user_adding.id, user_to_add.id):
         return Response({'message': 'You cannot add friend someone that blocked you'}, status=status.HTTP_400_BAD_REQUEST)
 
     FriendUser.objects.create(id_user_0=user_adding, id_user_1=user_to_add)
+    relationship_changed(user_adding.id, user_to_add.id)
     return Response({'message': f'{user_to_add.username} has been added friend by {user_adding.username}'}, status=status.HTTP_201_CREATED)
 
 
@@ -106,29 +113,22 @@ def send_message(request):
         return Response({'error': 'id_user_0 and id_user_1 and message is required'}, status=status.HTTP_400_BAD_REQUEST)
     if id_user_0 == id_user_1:
         return Response({'error': 'id_user_0 and id_user_1 must be different'}, status=status.HTTP_400_BAD_REQUEST)
-    try:
-        user_sending = User.objects.get(id=id_user_0)
-    except User.DoesNotExist:
+    # Both users in one query
+    users = User.objects.in_bulk([id_user_0, id_user_1])
+    user_sending = users.get(int(id_user_0))
+    if user_sending is None:
         return Response({'error': 'User sending message not found'}, status=status.HTTP_404_NOT_FOUND)
-
-    try:
-        user_to_send = User.objects.get(id=id_user_1)
-    except User.DoesNotExist:
+    user_to_send = users.get(int(id_user_1))
+    if user_to_send is None:
         return Response({'error': 'User to send message not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if BlockedUser.objects.filter(id_user_0=id_user_0, id_user_1=id_user_1).exists():
-        return Response({'error': 'User cannot send message to someone he blocked'}, status=status.HTTP_400_BAD_REQUEST)
+    error = message_error(user_sending.id, user_to_send.id)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
 
-    if BlockedUser.objects.filter(id_user_0=id_user_1, id_user_1=id_user_0).exists():
-        return Response({'error': 'User cannot send message to someone that blocked him'}, status=status.HTTP_400_BAD_REQUEST)
-
-    if not FriendUser.objects.filter(id_user_0=id_user_0, id_user_1=id_user_1).exists():
-        return Response({'error': 'User cannot send message to someone he doesnt had friend'}, status=status.HTTP_400_BAD_REQUEST)
-
-    if not FriendUser.objects.filter(id_user_0=id_user_1, id_user_1=id_user_0).exists():
-        return Response({'error': 'User cannot send message to someone who isnt your friend'}, status=status.HTTP_400_BAD_REQUEST)
-
-    message = ChatMessage.objects.create(id_user_0=user_sending, id_user_1=user_to_send, message=message)
+    message = store_message(user_sending.id, user_to_send.id, message)
+    # Connected recipients get it pushed over ws/chat/
+    push_message(message)
     return Response({'message': f'{user_sending.username} has sent {message.id} id to {user_to_send.username}'}, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
@@ -151,13 +151,86 @@ def get_message(request):
     except Exception as e:
         return Response({'error': 'User to send sending message not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    messages = ChatMessage.objects.filter(id_user_0=id_user_0, id_user_1=id_user_1) | ChatMessage.objects.filter(id_user_0=id_user_1, id_user_1=id_user_0)
+    # Both users are already loaded, no per-message lookups
+    usernames = {user_sending.id: user_sending.username, user_to_send.id: user_to_send.username}
+    messages = conversation_messages(user_sending.id, user_to_send.id).order_by('created_at', 'id')
     var = ""
     for message in messages:
-        var += f"{message.id} : {message.message} : {User.objects.get(id=message.id_user_0_id).username} -> {User.objects.get(id=message.id_user_1_id).username}, "
+        var += f"{message.id} : {message.message} : {usernames[message.id_user_0_id]} -> {usernames[message.id_user_1_id]}, "
     return Response({'messages': f'{var}'})
 
 
+@api_view(['GET'])
+@ensure_csrf_cookie
+@permission_classes([IsAuthenticated])
+def get_history(request):
+    """Page of the caller's conversation with id_user_1, newest first; pass ``next_cursor`` as ``before`` for older ones"""
+    id_user_0 = request.query_params.get('id_user_0', str(request.user.id))
+    id_user_1 = request.query_params.get('id_user_1')
+    before = request.query_params.get('before')
+    limit = request.query_params.get('limit', 50)
+
+    if not id_user_1:
+        return Response({'error': 'id_user_1 is required'}, status=status.HTTP_400_BAD_REQUEST)
+    # Only participants may read a conversation
+    if id_user_0 != str(request.user.id):
+        return Response({'error': 'Not a participant of this conversation'}, status=status.HTTP_403_FORBIDDEN)
+    if id_user_0 == id_user_1:
+        return Response({'error': 'id_user_0 and id_user_1 must be different'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        peer = User.objects.filter(id=id_user_1).values('id', 'username').first()
+    except ValueError:
+        return Response({'error': 'id_user_1 must be a user id'}, status=status.HTTP_400_BAD_REQUEST)
+    if peer is None:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        messages, next_cursor = history_page(request.user.id, peer['id'], before=before, limit=limit)
+    except ValueError:
+        return Response({'error': 'Invalid before or limit'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'users': {request.user.id: request.user.username, peer['id']: peer['username']},
+        'messages': messages,
+        'next_cursor': next_cursor,
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@ensure_csrf_cookie
+@permission_classes([IsAuthenticated])
+def get_inbox(request):
+    """The caller's conversations with their last message and unread count, most recent first"""
+    limit = request.query_params.get('limit', 50)
+
+    try:
+        conversations, unread_total = inbox(request.user.id, limit=limit)
+    except ValueError:
+        return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'conversations': conversations, 'unread_total': unread_total}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@ensure_csrf_cookie
+@permission_classes([IsAuthenticated])
+def mark_read_message(request):
+    """Mark everything id_user_1 sent to the caller as read"""
+    id_user_1 = request.data.get('id_user_1')
+
+    if not id_user_1:
+        return Response({'error': 'id_user_1 is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if str(id_user_1) == str(request.user.id):
+        return Response({'error': 'id_user_1 must be another user'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        last_read_id = mark_read(request.user.id, id_user_1)
+    except ValueError:
+        return Response({'error': 'id_user_1 must be a user id'}, status=status.HTTP_400_BAD_REQUEST)
+    if last_read_id is None:
+        return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+    conversation_read(request.user.id, id_user_1, last_read_id)
+    return Response({'last_read_id': last_read_id}, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @ensure_csrf_cookie
 @permission_classes([AllowAny])
@@ -170,20 +243,12 @@ def check_friendship(request):
     if id_user_0 == id_user_1:
         return Response({'error': 'id_user_0 and id_user_1 must be different'}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        user_to_add = User.objects.get(id=id_user_0)
-    except User.DoesNotExist:
-        return Response({'error': 'User id_user_0 not found'}, status=status.HTTP_404_NOT_FOUND)
-
-    try:
-        user_adding = User.objects.get(id=id_user_1)
-    except User.DoesNotExist:
-        return Response({'error': 'User id_user_1 found'}, status=status.HTTP_404_NOT_FOUND)
-    try:
-        user_0 = get_object_or_404(User, id=id_user_0)
-        user_1 = get_object_or_404(User, id=id_user_1)
-        is_friends = False
-        if FriendUser.objects.filter(id_user_0=id_user_0, id_user_1=id_user_1).exists() and FriendUser.objects.filter(id_user_0=id_user_1, id_user_1=id_user_0).exists():
-            is_friends = True
+        found = set(User.objects.filter(id__in=[id_user_0, id_user_1]).values_list('id', flat=True))
+        if int(id_user_0) not in found:
+            return Response({'error': 'User id_user_0 not found'}, status=status.HTTP_404_NOT_FOUND)
+        if int(id_user_1) not in found:
+            return Response({'error': 'User id_user_1 found'}, status=status.HTTP_404_NOT_FOUND)
+        is_friends = social.are_friends(id_user_0, id_user_1)
         return Response({"is_friends": is_friends}, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -202,11 +267,7 @@ def get_friends(request):
     try:
         user = get_object_or_404(User, id=id_user)
 
-        outgoing_friends = FriendUser.objects.filter(id_user_0=user).values_list("id_user_1", flat=True)
-
-        mutual_friends = FriendUser.objects.filter(id_user_0__in=outgoing_friends, id_user_1=user).values_list("id_user_0", flat=True)
-
-        mutual_friends_list = User.objects.filter(id__in=mutual_friends).values("id", "username")
+        mutual_friends_list = User.objects.filter(id__in=social.mutual_friends(user.id)).values("id", "username")
 
         return Response({"mutual_friends": list(mutual_friends_list)}, status=status.HTTP_200_OK)
 
@@ -239,6 +300,7 @@ def delete_friend_user(request):
         return Response({'message': 'Users are not friends'}, status=status.HTTP_400_BAD_REQUEST)
 
     friendship.delete()
+    relationship_changed(user_0.id, user_1.id)
 
     return Response({'message': f'Friendship from {user_0.username} to {user_1.username} has been removed'}, status=status.HTTP_200_OK)
 
@@ -265,6 +327,7 @@ def delete_blocked_user(request):
         return Response({'message': 'Users are not blocked'}, status=status.HTTP_400_BAD_REQUEST)
 
     blocked.delete()
+    relationship_changed(user_0.id, user_1.id)
 
     return Response({'message': f'blocking from {user_0.username} to {user_1.username} has been removed'}, status=status.HTTP_200_OK)
 
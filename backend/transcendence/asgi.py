@@ -14,18 +14,23 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transcendence.settings')
 django.setup()
 
 from django.core.asgi import get_asgi_application
+from django.urls import re_path
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
-from game.routing import websocket_urlpatterns
+from game.routing import websocket_urlpatterns as game_websocket_urlpatterns, spectator_websocket_urlpatterns
+from livechat.routing import websocket_urlpatterns as chat_websocket_urlpatterns
 
 django_asgi_app = get_asgi_application()
 
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
     'websocket': AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
-            URLRouter(websocket_urlpatterns)
-        )
+        URLRouter(spectator_websocket_urlpatterns + [
+            # Every other route needs the session user
+            re_path(r'', AuthMiddlewareStack(
+                URLRouter(game_websocket_urlpatterns + chat_websocket_urlpatterns)
+            )),
+        ])
     ),
 })
@@ -192,6 +192,44 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared by all workers: game summaries and tick stats are read everywhere
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f"redis://{os.environ.get('REDIS_HOST', 'redis')}:6379/2",
+    }
+}
+
+# Game engine settings
+GAME_CHECKPOINT_INTERVAL = 5.0  # Seconds between game_state snapshots to the DB
+GAME_CHECKPOINT_FLUSH_MS = 200  # Milliseconds between batched writes of the queued snapshots
+GAME_CHECKPOINT_BATCH_SIZE = 500  # Snapshots written per batch at most
+GAME_REDIS_URL = f"redis://{os.environ.get('REDIS_HOST', 'redis')}:6379/1"  # Empty to keep match coordination in-process
+GAME_LEASE_TTL = 3.0  # Seconds before an unrenewed match lease expires
+GAME_TICK_RATE = 60  # Physics steps per second
+GAME_MAX_CATCHUP_STEPS = 5  # Steps simulated at most per wakeup before lag is dropped
+GAME_BATCH_PHYSICS = True  # Step all matches of a worker together with NumPy
+GAME_BALL_MAX_SPEED = 20  # Ball speed cap, in pixels per 1/60 s
+GAME_BOUNCE_ANGLE = 50  # Degrees off horizontal for a ball hitting a paddle end
+GAME_SEND_RATE = 30  # Deltas per second to players while the ball is in open play
+GAME_SEND_RATE_NEAR_PADDLE = 60  # Deltas per second while the ball is about to reach a paddle
+GAME_SEND_RATE_IDLE = 10  # Deltas per second right after a point while no paddle moves
+GAME_SEND_RATE_SPECTATOR = 15  # Cap on deltas per second to spectators
+GAME_IDLE_AFTER_POINT = 1.0  # Seconds after a point that count as idle
+GAME_LAG_THRESHOLD_MS = 8  # Event-loop lag above which sends back off
+GAME_MAX_SEND_BACKOFF = 4  # Largest factor send intervals are stretched by under lag
+GAME_RATING_WINDOW = 50  # Rating gap accepted right away in ranked matchmaking
+GAME_RATING_WINDOW_GROWTH = 10  # Extra rating gap accepted per second of waiting
+GAME_RATING_WINDOW_MAX = 400
+GAME_RATING_SEARCH_INTERVAL = 2.0  # Seconds between widened searches for a queued player
+GAME_MATCHMAKING_TTL = 15  # Seconds a queued player counts as searching without a refresh
+GAME_REPLAY_DIR = os.path.join(BASE_DIR, 'replays')  # Where match replays are recorded, empty to disable
+GAME_CACHE_TTL = 600  # Seconds a cached game summary lives without being rewritten
+GAME_SWEEP_INTERVAL = 5.0  # Seconds between scans for active matches whose host died
+GAME_RESUME_COUNTDOWN = 3  # Seconds of countdown before a recovered or paused match goes on
+GAME_PRESENCE_TTL = 15  # Seconds a game connection counts as present without a refresh
+GAME_FORFEIT_GRACE = 30  # Seconds a player may be away from a match before forfeiting
+
 # WebSocket specific settings
 WEBSOCKET_ACCEPT_ALL = True  # Accept WebSocket upgrade requests
 WEBSOCKET_TIMEOUT = 3600  # 1 hour timeout for WebSocket connections
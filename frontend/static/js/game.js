@@ -1,5 +1,17 @@
 console.log('=== GAME.JS LOADED ===');
 
+// Binary wire format, see game/protocol.py
+const BINARY_SUBPROTOCOL = 'pong.bin.v2';
+const OP_PADDLE_MOVE = 1;
+const OP_DELTA = 2;
+const DELTA_FRAME_SIZE = 38;
+const INPUT_FRAME_SIZE = 6;
+
+// Ball velocities are in pixels per 1/60 s, see game/collision.py
+const REFERENCE_TICK_MS = 1000 / 60;
+// Stop extrapolating when deltas stop coming
+const MAX_EXTRAPOLATION_MS = 250;
+
 class PongGame {
     constructor() {
         // Bind methods to this instance first
@@ -26,6 +38,17 @@ class PongGame {
         this.canvas = null;
         this.ctx = null;
         this.keyState = { w: false, s: false };
+        this.protocolVersion = 2;
+        this.inputSeq = 0;
+        this.pendingInputs = [];
+        this.serverPaddleY = null;
+        this.binaryMode = false;
+        this.lastTick = 0;
+        this.lastBallUpdate = 0;
+        this.lastAnimateTime = 0;
+        this.resyncPending = false;
+        this.paused = false;
+        this.countdownInterval = null;
         
         this.paddleSpeed = 25; // pixels to move per keypress
         
@@ -350,8 +373,12 @@ class PongGame {
         const wsUrl = `${wsScheme}://localhost:8000/ws/game/`;
         console.log('Attempting to connect to:', wsUrl);
         
+        // Binary frames are opt-in, e.g. /game/?binary=1
+        const useBinary = new URLSearchParams(window.location.search).has('binary');
+        
         try {
-            this.gameSocket = new WebSocket(wsUrl);
+            this.gameSocket = useBinary ? new WebSocket(wsUrl, [BINARY_SUBPROTOCOL]) : new WebSocket(wsUrl);
+            this.gameSocket.binaryType = 'arraybuffer';
             console.log('WebSocket instance created');
         } catch (error) {
             console.error('Error creating WebSocket:', error);
@@ -364,6 +391,7 @@ class PongGame {
             
             this.connected = true;
             this.connectionAttempt = false;
+            this.binaryMode = this.gameSocket.protocol === BINARY_SUBPROTOCOL;
             this.reconnectAttempts = 0; // Reset reconnect attempts on successful connection
             
             // Enable game buttons when connection is established
@@ -447,12 +475,16 @@ class PongGame {
     
     handleWebSocketMessage(event) {
         //console.log('handleWebSocketMessage called');
+        if (event.data instanceof ArrayBuffer) {
+            this.handleBinaryFrame(event.data);
+            return;
+        }
         const message = JSON.parse(event.data);
         //console.log('WebSocket message received:', message);
         
         try {
             // Only log non-game-state messages
-            if (message.type !== 'game_state_update') {
+            if (message.type !== 'game_delta') {
                 console.log('Received WebSocket message:', event.data);
             }
             
@@ -466,24 +498,9 @@ class PongGame {
                     this.playerId = message.user.id;
                     break;
 
-                case 'game_created':
-                    console.log('Game created, initializing game state:', message);
-                    this.gameId = message.game_id;
-                    this.gameState = message.game_state;
+                case 'matchmaking_queued':
+                    // The server sends game_joined once an opponent is found
                     this.isCreatingGame = false;
-                    
-                    // Wait for game_joined message to set player roles
-                    if (this.canvasContainer) {
-                        this.canvasContainer.style.display = 'block';
-                    }
-                    
-                    // Start animation loop even when waiting
-                    if (!this.animationFrameId) {
-                        console.log('Starting animation loop');
-                        this.gameStarted = true; // Set this to true to allow drawing
-                        this.animationFrameId = requestAnimationFrame(() => this.animate());
-                    }
-                    
                     if (this.gameStatus) {
                         this.gameStatus.textContent = 'Waiting for opponent...';
                     }
@@ -503,6 +520,9 @@ class PongGame {
                             this.playerRole = 'player2';
                             console.log('Set as player2 with ID:', this.playerId);
                         }
+                        if (this.playerRole) {
+                            this.serverPaddleY = this.gameState.paddles[this.playerRole].y;
+                        }
                         
                         // Store player IDs in game state
                         this.gameState.player1_id = message.player1_id;
@@ -524,20 +544,13 @@ class PongGame {
                     }
                     break;
 
-                case 'game_state_update':
+                case 'game_keyframe':
+                    if (message.v !== this.protocolVersion) {
+                        console.error('Unsupported game protocol version:', message.v);
+                        break;
+                    }
                     if (message.game_state) {
-                        console.log('Received game state update:', {
-                            currentState: this.gameState ? {
-                                player1Y: this.gameState.paddles.player1.y,
-                                player2Y: this.gameState.paddles.player2.y
-                            } : null,
-                            newState: {
-                                player1Y: message.game_state.paddles.player1.y,
-                                player2Y: message.game_state.paddles.player2.y
-                            }
-                        });
-
-                        // Preserve player IDs when updating game state
+                        // Preserve player IDs when replacing game state
                         const player1_id = this.gameState?.player1_id;
                         const player2_id = this.gameState?.player2_id;
                         this.gameState = message.game_state;
@@ -545,20 +558,42 @@ class PongGame {
                             this.gameState.player1_id = player1_id;
                             this.gameState.player2_id = player2_id;
                         }
+                        this.lastTick = message.tick;
+                        this.lastBallUpdate = performance.now();
+                        this.resyncPending = false;
+                        this.paused = false;
+                        if (this.playerRole) {
+                            this.serverPaddleY = this.gameState.paddles[this.playerRole].y;
+                        }
+                        this.reconcile(message.acks);
                         
                         // Update scores if available
                         if (this.gameState.score) {
                             if (this.player1Score) this.player1Score.textContent = this.gameState.score.player1;
                             if (this.player2Score) this.player2Score.textContent = this.gameState.score.player2;
                         }
+                    }
+                    break;
+
+                case 'game_delta':
+                    this.applyDelta(message);
+                    break;
 
-                        console.log('Game state updated:', {
-                            player1Y: this.gameState.paddles.player1.y,
-                            player2Y: this.gameState.paddles.player2.y
-                        });
+                case 'game_paused':
+                    // The server holds the match while a player is away
+                    this.paused = true;
+                    clearInterval(this.countdownInterval);
+                    if (this.gameStatus) {
+                        this.gameStatus.textContent = `Waiting for the other player (forfeit after ${message.grace}s)...`;
                     }
                     break;
 
+                case 'game_countdown':
+                    // Resumed after a pause or a server restart, the next keyframe restarts play
+                    this.paused = true;
+                    this.showCountdown(message.seconds);
+                    break;
+
                 case 'game_end':
                     console.log('Received game_end event:', message);
                     this.gameStarted = false;
@@ -568,11 +603,18 @@ class PongGame {
                     }
                     
                     // Show game over message with winner and duration
+                    clearInterval(this.countdownInterval);
                     if (this.gameStatus) {
                         const winner = message.winner === 'player1' ? 'Player 1' : 'Player 2';
                         const duration = message.duration_formatted;
                         const score = `${message.final_score.player1} - ${message.final_score.player2}`;
-                        this.gameStatus.textContent = `Game Over! ${winner} wins! (${score}) Duration: ${duration}`;
+                        if (!message.winner) {
+                            this.gameStatus.textContent = `Game abandoned (${score})`;
+                        } else if (message.reason === 'forfeit') {
+                            this.gameStatus.textContent = `Game Over! ${winner} wins by forfeit! (${score})`;
+                        } else {
+                            this.gameStatus.textContent = `Game Over! ${winner} wins! (${score}) Duration: ${duration}`;
+                        }
                         console.log('Updated game status with:', this.gameStatus.textContent);
                     }
                     
@@ -603,6 +645,128 @@ class PongGame {
         }
     }
     
+    showCountdown(seconds) {
+        clearInterval(this.countdownInterval);
+        let remaining = seconds;
+        const show = () => {
+            if (this.gameStatus) {
+                this.gameStatus.textContent = remaining > 0 ? `Resuming in ${remaining}...` : 'Game in progress';
+            }
+            if (remaining-- <= 0) {
+                clearInterval(this.countdownInterval);
+            }
+        };
+        show();
+        this.countdownInterval = setInterval(show, 1000);
+    }
+
+    applyDelta(message) {
+        // Deltas only make sense on top of a keyframe
+        if (message.v !== this.protocolVersion || !this.gameState || !this.gameState.ball) {
+            this.requestResync();
+            return;
+        }
+        if (message.tick <= this.lastTick) {
+            return;
+        }
+        this.lastTick = message.tick;
+        
+        const ball = this.gameState.ball;
+        [ball.x, ball.y, ball.dx, ball.dy] = message.ball;
+        this.lastBallUpdate = performance.now();
+        if (message.paddles) {
+            for (const [paddleKey, y] of Object.entries(message.paddles)) {
+                this.gameState.paddles[paddleKey].y = y;
+                if (paddleKey === this.playerRole) {
+                    this.serverPaddleY = y;
+                }
+            }
+        }
+        this.reconcile(message.acks);
+    }
+    
+    reconcile(acks) {
+        // Server paddle position plus the inputs it has not processed yet
+        if (!this.playerRole || !acks || this.serverPaddleY === null) {
+            return;
+        }
+        const ack = acks[this.playerRole === 'player1' ? 0 : 1];
+        this.pendingInputs = this.pendingInputs.filter(input => input.seq > ack);
+        this.gameState.paddles[this.playerRole].y = this.serverPaddleY;
+        for (const input of this.pendingInputs) {
+            this.predictPaddle(input.direction);
+        }
+    }
+    
+    predictPaddle(direction) {
+        // Same rule as MatchEngine.move_paddle
+        const paddle = this.gameState.paddles[this.playerRole];
+        const speed = this.gameState.paddle_speed;
+        if (direction === 'up') {
+            paddle.y = Math.max(0, paddle.y - speed);
+        } else {
+            paddle.y = Math.min(this.gameState.canvas.height - paddle.height, paddle.y + speed);
+        }
+    }
+    
+    handleBinaryFrame(buffer) {
+        const view = new DataView(buffer);
+        if (view.byteLength !== DELTA_FRAME_SIZE || view.getUint8(0) !== OP_DELTA) {
+            console.error('Unknown binary frame');
+            return;
+        }
+        // Same fields as a JSON game_delta, see DELTA_FRAME in game/protocol.py
+        const mask = view.getUint8(21);
+        const paddles = {};
+        if (mask & 1) paddles.player1 = view.getFloat32(22, true);
+        if (mask & 2) paddles.player2 = view.getFloat32(26, true);
+        this.applyDelta({
+            type: 'game_delta',
+            v: this.protocolVersion,
+            tick: view.getUint32(1, true),
+            ball: [5, 9, 13, 17].map(offset => view.getFloat32(offset, true)),
+            paddles: mask ? paddles : undefined,
+            acks: [view.getUint32(30, true), view.getUint32(34, true)]
+        });
+    }
+    
+    sendPaddleMove(direction) {
+        const seq = ++this.inputSeq;
+        this.pendingInputs.push({ seq, direction });
+        // Move right away, reconcile() corrects it once the server acks
+        if (this.playerRole) {
+            this.predictPaddle(direction);
+        }
+        
+        if (this.binaryMode) {
+            const view = new DataView(new ArrayBuffer(INPUT_FRAME_SIZE));
+            view.setUint8(0, OP_PADDLE_MOVE);
+            view.setUint8(1, direction === 'up' ? 0 : 1);
+            view.setUint32(2, seq, true);
+            this.gameSocket.send(view.buffer);
+            return;
+        }
+        this.gameSocket.send(JSON.stringify({
+            type: 'paddle_move',
+            direction: direction,
+            game_id: this.gameId,
+            seq: seq
+        }));
+    }
+    
+    requestResync() {
+        if (!this.gameSocket || this.gameSocket.readyState !== WebSocket.OPEN || this.resyncPending) {
+            return;
+        }
+        this.resyncPending = true;
+        this.gameSocket.send(JSON.stringify({
+            type: 'resync',
+            game_id: this.gameId
+        }));
+        // Allow another request if no keyframe arrives in time
+        setTimeout(() => { this.resyncPending = false; }, 1000);
+    }
+    
     handleGameEnd(data) {
         const winner = data.winner;
         const duration = data.duration;
@@ -733,7 +897,8 @@ class PongGame {
         
         try {
             this.gameSocket.send(JSON.stringify({
-                type: 'create_game'
+                type: 'create_game',
+                mode: this.matchmakingMode()
             }));
         } catch (error) {
             console.error('Error creating game:', error);
@@ -750,10 +915,16 @@ class PongGame {
         if (this.joinGameBtn) this.joinGameBtn.disabled = true;
         
         this.gameSocket.send(JSON.stringify({
-            type: 'join_game'
+            type: 'join_game',
+            mode: this.matchmakingMode()
         }));
     }
 
+    matchmakingMode() {
+        // Skill-based pairing is opt-in, e.g. /game/?ranked=1
+        return new URLSearchParams(window.location.search).has('ranked') ? 'ranked' : 'casual';
+    }
+
     handleKeyPress(event) {
         console.log('handleKeyPress called');
         if (!this.gameSocket || this.gameSocket.readyState !== WebSocket.OPEN || !this.gameId || !this.gameStarted || !this.gameState) {
@@ -785,11 +956,7 @@ class PongGame {
             
             if (direction) {
                 console.log('Sending paddle_move:', { direction, gameId: this.gameId });
-                this.gameSocket.send(JSON.stringify({
-                    type: 'paddle_move',
-                    direction: direction,
-                    game_id: this.gameId
-                }));
+                this.sendPaddleMove(direction);
             }
         }
     }
@@ -819,10 +986,7 @@ class PongGame {
         }
         
         if (direction) {
-            this.gameSocket.send(JSON.stringify({
-                type: 'paddle_move',
-                direction: direction
-            }));
+            this.sendPaddleMove(direction);
             this.lastPaddleUpdate = now;
         }
     }
@@ -839,6 +1003,9 @@ class PongGame {
         // Update paddle position based on key state
         this.updatePaddlePosition();
 
+        // Deltas are rate limited by the server: move the ball in between
+        this.extrapolateBall(performance.now());
+
         // Draw the current game state
         this.draw();
 
@@ -847,6 +1014,27 @@ class PongGame {
     }
     
     
+    extrapolateBall(now) {
+        const ball = this.gameState.ball;
+        const since = Math.max(this.lastAnimateTime, this.lastBallUpdate);
+        this.lastAnimateTime = now;
+        if (this.paused || !ball || !this.lastBallUpdate || now - this.lastBallUpdate > MAX_EXTRAPOLATION_MS) {
+            return;
+        }
+        const steps = (now - since) / REFERENCE_TICK_MS;
+        ball.x += ball.dx * steps;
+        ball.y += ball.dy * steps;
+        // Walls are the only contact clients resolve, paddles wait for the server
+        const height = this.gameState.canvas.height;
+        if (ball.y < ball.radius) {
+            ball.y = 2 * ball.radius - ball.y;
+            ball.dy = -ball.dy;
+        } else if (ball.y > height - ball.radius) {
+            ball.y = 2 * (height - ball.radius) - ball.y;
+            ball.dy = -ball.dy;
+        }
+    }
+    
     draw() {
         //console.log('draw called');
         try {